@@ -0,0 +1,100 @@
+# benchmarks/audio_paths.py
+# Uso: python -m benchmarks.audio_paths [streams] [segundos] [archivo_audio]
+#
+# Compara la CPU por stream de los dos modos de audio del reproductor con
+# archivos locales (sin red): 'pcm' (FFmpeg -> PCM -> volumen y Opus en
+# Python, como hace la voz de discord.py) y 'opus' (FFmpeg aplica el
+# volumen y codifica; Python solo lee paquetes). Necesita ffmpeg y libopus.
+import sys
+import resource
+import subprocess
+import tempfile
+from pathlib import Path
+
+import discord
+
+from cogs.music.music import YTDLSource
+
+FRAME_SECONDS = 0.02 # discord.py lee tramas de 20 ms
+
+
+def cpu_seconds():
+    """(CPU de este proceso, CPU de los hijos ya terminados) en segundos."""
+    propio = resource.getrusage(resource.RUSAGE_SELF)
+    hijos = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return propio.ru_utime + propio.ru_stime, hijos.ru_utime + hijos.ru_stime
+
+
+def generar_audio(segundos: int) -> Path:
+    """Crea un audio de prueba (ruido rosa estéreo, 48 kHz) en un directorio temporal."""
+    path = Path(tempfile.mkdtemp(prefix="botipy-bench-")) / "prueba.opus"
+    subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-f", "lavfi",
+         "-i", f"anoisesrc=color=pink:duration={segundos}:sample_rate=48000",
+         "-ac", "2", "-c:a", "libopus", "-b:a", "128k", str(path)],
+        check=True
+    )
+    return path
+
+
+def medir(modo: str, archivo: Path, streams: int, tramas: int) -> dict:
+    """Reproduce 'streams' fuentes a la vez (intercaladas, como varios servidores) y mide la CPU."""
+    encoder = discord.opus.Encoder() if modo == "pcm" else None
+    data = {'title': archivo.name, 'webpage_url': str(archivo)}
+    fuentes = [YTDLSource.from_file(archivo, data, mode=modo) for _ in range(streams)]
+
+    python_0, hijos_0 = cpu_seconds()
+    leidas = 0
+    for _ in range(tramas):
+        for fuente in fuentes:
+            trama = fuente.read()
+            if not trama:
+                continue
+            if encoder:
+                encoder.encode(trama, encoder.SAMPLES_PER_FRAME) # Lo que hace VoiceClient con PCM
+            leidas += 1
+    for fuente in fuentes:
+        fuente.cleanup() # Espera a FFmpeg: su CPU pasa a RUSAGE_CHILDREN
+    python_1, hijos_1 = cpu_seconds()
+
+    audio = leidas * FRAME_SECONDS
+    total = (python_1 - python_0) + (hijos_1 - hijos_0)
+    return {
+        "python": python_1 - python_0,
+        "ffmpeg": hijos_1 - hijos_0,
+        "audio": audio,
+        # % de un núcleo que necesita cada stream para sonar en tiempo real ('audio' suma todos los streams)
+        "por_stream": total / audio * 100 if audio else 0.0,
+        "por_stream_ms": total / streams * 1000,
+    }
+
+
+def main(streams: int, segundos: int, archivo: str | None) -> int:
+    if not discord.opus.is_loaded():
+        try:
+            discord.opus._load_default()
+        except Exception:
+            pass
+    if not discord.opus.is_loaded():
+        print("FALLO: no se encontró libopus (el modo 'pcm' la necesita para codificar).")
+        return 1
+
+    path = Path(archivo) if archivo else generar_audio(segundos)
+    tramas = int(segundos / FRAME_SECONDS)
+    print(f"Audio: {path} | {streams} streams simultáneos | {segundos} s por stream")
+
+    for modo in ("pcm", "opus"):
+        r = medir(modo, path, streams, tramas)
+        print(
+            f"  {modo:>4}: CPU Python {r['python']:.2f} s + FFmpeg {r['ffmpeg']:.2f} s "
+            f"-> {r['por_stream_ms']:.0f} ms de CPU por stream "
+            f"({r['por_stream']:.2f}% de un núcleo por stream en tiempo real)"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    s = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    f = sys.argv[3] if len(sys.argv) > 3 else None
+    sys.exit(main(n, s, f))
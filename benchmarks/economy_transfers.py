@@ -0,0 +1,62 @@
+# benchmarks/economy_transfers.py
+# Uso: python -m benchmarks.economy_transfers [transferencias] [usuarios]
+#
+# Lanza miles de /pagar simultáneos contra una BBDD temporal usando las
+# mismas operaciones atómicas que el Cog de Economía y comprueba que el
+# total de Nocoins no cambia y que ningún saldo queda en negativo.
+import sys
+import time
+import random
+import asyncio
+import tempfile
+
+from utils.storage import Storage
+from cogs.economy.economy import SCHEMA, transferir
+
+GUILD_ID = 1
+SALDO_INICIAL = 1_000
+
+
+async def main(transferencias: int, usuarios: int):
+    storage = Storage(tempfile.mkdtemp(prefix="botipy-bench-"))
+    db = storage.get('economy')
+    try:
+        await db.executescript(SCHEMA)
+        await db.executemany(
+            "INSERT INTO balances (user_id, guild_id, balance) VALUES (?, ?, ?)",
+            [(user_id, GUILD_ID, SALDO_INICIAL) for user_id in range(usuarios)]
+        )
+        total_inicial = (await db.fetchone("SELECT SUM(balance) FROM balances"))[0]
+
+        async def una_transferencia():
+            emisor, receptor = random.sample(range(usuarios), 2)
+            cantidad = random.randint(1, SALDO_INICIAL // 2)
+            ok, _ = await db.transaction(transferir, emisor, receptor, GUILD_ID, cantidad)
+            return ok
+
+        inicio = time.perf_counter()
+        resultados = await asyncio.gather(*(una_transferencia() for _ in range(transferencias)))
+        duracion = time.perf_counter() - inicio
+
+        total_final = (await db.fetchone("SELECT SUM(balance) FROM balances"))[0]
+        negativos = (await db.fetchone("SELECT COUNT(*) FROM balances WHERE balance < 0"))[0]
+
+        completadas = sum(resultados)
+        print(f"Transferencias lanzadas: {transferencias} ({usuarios} usuarios)")
+        print(f"  Completadas: {completadas} | Rechazadas por fondos: {transferencias - completadas}")
+        print(f"  Tiempo total: {duracion:.2f} s -> {transferencias / duracion:,.0f} transferencias/s")
+        print(f"  Total inicial: {total_inicial} | Total final: {total_final} | Saldos negativos: {negativos}")
+
+        if total_final != total_inicial or negativos:
+            print("FALLO: la masa monetaria no se ha conservado.")
+            return 1
+        print("OK: la masa monetaria se conserva.")
+        return 0
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    u = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    sys.exit(asyncio.run(main(n, u)))
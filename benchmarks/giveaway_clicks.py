@@ -0,0 +1,143 @@
+# benchmarks/giveaway_clicks.py
+# Uso: python -m benchmarks.giveaway_clicks [clics] [segundos] [--legacy]
+#
+# Simula la avalancha de clics en "Participar" al anunciar un sorteo grande:
+# 'clics' pulsaciones repartidas en 'segundos' (con un 10% de repetidas)
+# contra el callback real de GiveawayButton y una BBDD temporal. Mide cuánto
+# tarda cada clic en recibir respuesta (Discord corta a los 3 s).
+# --legacy repite la prueba con el camino antiguo (una transacción por clic).
+import sys
+import time
+import random
+import asyncio
+import tempfile
+from types import SimpleNamespace
+
+import discord
+
+from utils.storage import Storage
+from cogs.community.giveaway import Giveaways, GiveawayButton
+
+MESSAGE_ID = 1
+DISCORD_ACK_LIMIT = 3.0 # Segundos que da Discord para contestar una interacción
+
+
+class FakeResponse:
+    def __init__(self, clic):
+        self.clic = clic
+
+    async def send_message(self, content, ephemeral=False):
+        self.clic.acked_at = time.perf_counter()
+        self.clic.content = content
+
+
+class FakeMessage:
+    """El mensaje del sorteo: solo cuenta cuántas veces se edita."""
+    def __init__(self):
+        self.id = MESSAGE_ID
+        self.embeds = [discord.Embed(title="Bench")]
+        self.edits = 0
+
+    async def edit(self, **kwargs):
+        self.edits += 1
+        self.embeds = [kwargs["embed"]]
+
+
+class FakeInteraction:
+    def __init__(self, client, message: FakeMessage, user_id: int):
+        self.client = client
+        self.message = message
+        self.user = SimpleNamespace(id=user_id)
+        self.response = FakeResponse(self)
+        self.sent_at = time.perf_counter()
+        self.acked_at = None
+        self.content = None
+
+
+async def legacy_join(interaction):
+    """El callback de antes: una transacción (SELECT + INSERT) por clic."""
+    db = interaction.client.storage.get('community')
+    message_id = interaction.message.id
+    user_id = interaction.user.id
+
+    def job(conn):
+        if conn.execute("SELECT 1 FROM giveaways WHERE message_id = ?", (message_id,)).fetchone() is None:
+            return None
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO giveaway_participants (message_id, user_id) VALUES (?, ?)",
+            (message_id, user_id)
+        )
+        return cursor.rowcount
+
+    await db.transaction(job)
+    await interaction.response.send_message("ok", ephemeral=True)
+
+
+def pct(ordenadas, p):
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p))]
+
+
+async def main(clics: int, segundos: float, legacy: bool) -> int:
+    storage = Storage(tempfile.mkdtemp(prefix="botipy-bench-"))
+    bot = SimpleNamespace(storage=storage, loop=asyncio.get_running_loop())
+    cog = Giveaways(bot)
+    bot.get_cog = lambda name: cog
+    try:
+        await cog.init_database()
+        await cog.db.execute(
+            "INSERT INTO giveaways (message_id, guild_id, channel_id, end_time, winner_count, prize) VALUES (?, 1, 1, '2999-01-01T00:00:00+00:00', 1, 'Bench')",
+            (MESSAGE_ID,)
+        )
+        await cog.load_active()
+        cog.entries.start()
+
+        view = GiveawayButton()
+        mensaje = FakeMessage()
+        callback = legacy_join if legacy else view.join_giveaway.callback
+        usuarios = [random.randrange(clics) if random.random() < 0.1 else i for i in range(clics)]
+
+        interacciones = []
+        tareas = []
+        inicio = time.perf_counter()
+        for i, user_id in enumerate(usuarios):
+            # Cada clic llega en su momento (reparto uniforme en 'segundos')
+            objetivo = inicio + i * segundos / clics
+            espera = objetivo - time.perf_counter()
+            if espera > 0:
+                await asyncio.sleep(espera)
+            interaction = FakeInteraction(bot, mensaje, user_id)
+            interacciones.append(interaction)
+            tareas.append(asyncio.create_task(callback(interaction)))
+        await asyncio.gather(*tareas)
+        duracion = time.perf_counter() - inicio
+        await cog.live_edits.close()
+        await cog.entries.close()
+
+        latencias = sorted((i.acked_at - i.sent_at) * 1000 for i in interacciones)
+        tarde = sum(1 for ms in latencias if ms > DISCORD_ACK_LIMIT * 1000)
+        guardados = (await cog.db.fetchone("SELECT COUNT(*) FROM giveaway_participants WHERE message_id = ?", (MESSAGE_ID,)))[0]
+        esperados = len(set(usuarios))
+
+        print(f"Modo: {'legacy (transacción por clic)' if legacy else 'memoria + escritura agrupada'}")
+        print(f"Clics: {clics} en {duracion:.2f} s | Usuarios distintos: {esperados}")
+        print(
+            f"  Respuesta al clic: p50 {pct(latencias, 0.50):.3f} ms | p99 {pct(latencias, 0.99):.3f} ms "
+            f"| máx {latencias[-1]:.3f} ms | > {DISCORD_ACK_LIMIT:.0f} s: {tarde}"
+        )
+        print(f"  Participantes en la BBDD: {guardados} (esperados {esperados})")
+        if not legacy:
+            print(f"  Ediciones del contador: {mensaje.edits} (intervalo {cog.live_edits.interval:.0f} s)")
+
+        if guardados != esperados:
+            print("FALLO: faltan o sobran participantes en la BBDD.")
+            return 1
+        return 0
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    n = int(args[0]) if len(args) > 0 else 10_000
+    s = float(args[1]) if len(args) > 1 else 10.0
+    sys.exit(asyncio.run(main(n, s, "--legacy" in sys.argv)))
@@ -0,0 +1,101 @@
+# benchmarks/giveaway_draw.py
+# Uso: python -m benchmarks.giveaway_draw [participantes] [ganadores]
+#
+# Mide el sorteo de un giveaway grande con requisitos (nivel mínimo, Nocoins
+# mínimos y rol) con Giveaways.draw(): social.db y economy.db adjuntas a una
+# conexión de lectura aparte y el filtro hecho en SQL. Comprueba que todos los
+# ganadores cumplen los requisitos, que un reroll no los repite y que las
+# escrituras de Economía no esperan mientras se sortea.
+import sys
+import time
+import random
+import asyncio
+import datetime
+import tempfile
+from types import SimpleNamespace
+
+from utils.storage import Storage
+from cogs.community.giveaway import Giveaways
+from cogs.economy.economy import SCHEMA as ECONOMY_SCHEMA
+
+GUILD_ID = 1
+MESSAGE_ID = 1
+MIN_LEVEL = 5
+MIN_BALANCE = 500
+OBJETIVO_MS = 1000 # El sorteo debe tardar menos de un segundo
+
+
+async def main(participantes: int, ganadores: int) -> int:
+    storage = Storage(tempfile.mkdtemp(prefix="botipy-bench-"))
+    bot = SimpleNamespace(storage=storage, get_cog=lambda name: None)
+    cog = Giveaways(bot)
+    try:
+        # BBDD de Niveles y Economía con un usuario por participante (niveles y saldos al azar)
+        social = storage.get('social')
+        economy = storage.get('economy')
+        await social.executescript(
+            "CREATE TABLE IF NOT EXISTS levels (user_id INTEGER NOT NULL, guild_id INTEGER NOT NULL, "
+            "xp INTEGER DEFAULT 0, level INTEGER DEFAULT 0, PRIMARY KEY (user_id, guild_id))"
+        )
+        await economy.executescript(ECONOMY_SCHEMA)
+        niveles = {user_id: random.randint(0, 10) for user_id in range(participantes)}
+        saldos = {user_id: random.randint(0, 1000) for user_id in range(participantes)}
+        await social.executemany("INSERT INTO levels (user_id, guild_id, level) VALUES (?, ?, ?)", [(u, GUILD_ID, n) for u, n in niveles.items()])
+        await economy.executemany("INSERT INTO balances (user_id, guild_id, balance) VALUES (?, ?, ?)", [(u, GUILD_ID, b) for u, b in saldos.items()])
+        con_rol = set(random.sample(range(participantes), participantes // 2)) # La "caché de miembros" del rol
+        rol = SimpleNamespace(members=[SimpleNamespace(id=u) for u in con_rol])
+        bot.get_guild = lambda guild_id: SimpleNamespace(get_role=lambda role_id: rol)
+
+        await cog.init_database()
+        await cog.db.execute(
+            "INSERT INTO giveaways (message_id, guild_id, channel_id, end_time, winner_count, prize, min_level, min_balance, required_role) "
+            "VALUES (?, ?, 1, ?, ?, 'Bench', ?, ?, 1)",
+            (MESSAGE_ID, GUILD_ID, datetime.datetime.now(datetime.UTC).isoformat(), ganadores, MIN_LEVEL, MIN_BALANCE)
+        )
+        await cog.db.executemany("INSERT INTO giveaway_participants (message_id, user_id) VALUES (?, ?)", [(MESSAGE_ID, u) for u in range(participantes)])
+
+        elegibles = sum(1 for u in range(participantes) if niveles[u] >= MIN_LEVEL and saldos[u] >= MIN_BALANCE and u in con_rol)
+        giveaway = await cog.db.fetchone("SELECT * FROM giveaways WHERE message_id = ?", (MESSAGE_ID,))
+
+        async def escrituras_economia():
+            """Escrituras sueltas en economy.db mientras dura el sorteo: devuelve la más lenta (ms)."""
+            peor = 0.0
+            while not sorteo.done():
+                inicio = time.perf_counter()
+                await economy.execute("UPDATE balances SET balance = balance WHERE user_id = 0 AND guild_id = ?", (GUILD_ID,))
+                peor = max(peor, (time.perf_counter() - inicio) * 1000)
+                await asyncio.sleep(0.005)
+            return peor
+
+        inicio = time.perf_counter()
+        sorteo = asyncio.create_task(cog.draw(giveaway, ganadores, close=True))
+        peor_escritura = await escrituras_economia()
+        primeros = await sorteo
+        sorteo_ms = (time.perf_counter() - inicio) * 1000
+
+        inicio = time.perf_counter()
+        reroll = await cog.draw(giveaway, ganadores)
+        reroll_ms = (time.perf_counter() - inicio) * 1000
+
+        print(f"Participantes: {participantes} | Cumplen los requisitos: {elegibles} | Ganadores por tirada: {ganadores}")
+        print(f"  Sorteo: {sorteo_ms:.1f} ms | Reroll: {reroll_ms:.1f} ms (objetivo < {OBJETIVO_MS} ms)")
+        print(f"  Escritura en economy.db más lenta durante el sorteo: {peor_escritura:.1f} ms")
+
+        todos = primeros + reroll
+        incumplen = [u for u in todos if not (niveles[u] >= MIN_LEVEL and saldos[u] >= MIN_BALANCE and u in con_rol)]
+        if incumplen or len(set(todos)) != len(todos) or len(primeros) != min(ganadores, elegibles):
+            print(f"FALLO: ganadores incorrectos (no cumplen: {incumplen}, repetidos: {len(todos) - len(set(todos))}).")
+            return 1
+        if max(sorteo_ms, reroll_ms) > OBJETIVO_MS:
+            print("FALLO: el sorteo tarda demasiado.")
+            return 1
+        print("OK: todos los ganadores cumplen los requisitos y el reroll no repite.")
+        return 0
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    sys.exit(asyncio.run(main(n, k)))
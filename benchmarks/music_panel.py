@@ -0,0 +1,82 @@
+# benchmarks/music_panel.py
+# Uso: python -m benchmarks.music_panel [pulsaciones] [--legacy]
+#
+# Mide la latencia "botón -> edición del panel" del reproductor de música.
+# El panel se redibuja desde el TrackInfo guardado, así que solo cuesta
+# construir el embed y la vista. Con --legacy se mide además la búsqueda
+# en YouTube que hacía antes cada pulsación (necesita red).
+import sys
+import time
+import asyncio
+import statistics
+
+from cogs.music.music import MusicPlayer, TrackInfo, YTDLSource
+from utils.extraction import ExtractionPool
+
+TRACK = TrackInfo(
+    title="Rick Astley - Never Gonna Give You Up (Official Video)",
+    url="https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    thumbnail="https://i.ytimg.com/vi/dQw4w9WgXcQ/hqdefault.jpg",
+    duration=213,
+    uploader="Rick Astley",
+)
+
+
+LOOP_MODES = ("none", "song", "queue")
+
+
+class FakeMessage:
+    """Mensaje del panel: edit() no sale a Discord, solo cuenta."""
+    def __init__(self):
+        self.edits = 0
+
+    async def edit(self, **kwargs):
+        self.edits += 1
+
+
+class FakeInteraction:
+    guild = None
+    channel = None
+
+
+def resumen(nombre: str, muestras: list):
+    muestras = sorted(muestras)
+    p99 = muestras[min(len(muestras) - 1, int(len(muestras) * 0.99))]
+    print(f"  {nombre}: media {statistics.mean(muestras):.3f} ms | p50 {statistics.median(muestras):.3f} ms | p99 {p99:.3f} ms")
+
+
+async def main(pulsaciones: int, legacy: bool):
+    player = MusicPlayer(bot=None, interaction=FakeInteraction(), cache=None, extraction=None, audio_cache=None, admission=None)
+    player.current_song = TRACK
+    player.panel_message = FakeMessage()
+
+    # Simulamos Pausa/Reanudar y Loop alternando el estado antes de cada redibujado
+    muestras = []
+    for i in range(pulsaciones):
+        player.is_paused = not player.is_paused
+        if i % 3 == 0:
+            player.loop_mode = LOOP_MODES[(i // 3) % len(LOOP_MODES)]
+        inicio = time.perf_counter()
+        await player.update_panel()
+        muestras.append((time.perf_counter() - inicio) * 1000)
+
+    print(f"Pulsaciones simuladas: {pulsaciones} (ediciones del panel: {player.panel_message.edits})")
+    resumen("Panel desde TrackInfo", muestras)
+
+    if legacy:
+        # Lo que hacía antes update_panel() en cada pulsación
+        pool = ExtractionPool(workers=1)
+        muestras = []
+        for _ in range(3):
+            inicio = time.perf_counter()
+            await YTDLSource.search(TRACK.title, pool=pool, guild_id=0)
+            muestras.append((time.perf_counter() - inicio) * 1000)
+        resumen("Búsqueda yt-dlp (antes)", muestras)
+        pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    n = int(args[0]) if args else 1_000
+    sys.exit(asyncio.run(main(n, "--legacy" in sys.argv)))
@@ -1,11 +1,15 @@
 # bot.py
 import os
+import signal
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 import pathlib
 import threading 
-from flask import Flask 
+from flask import Flask, jsonify 
+from utils.storage import Storage
+from utils.log_dispatcher import LogDispatcher
+from utils.metrics import metrics
 
 # --- Configuración Inicial ---
 load_dotenv()
@@ -30,6 +34,11 @@ def home():
     # Render espera una respuesta 200 OK en el path raíz
     return "Bot is running!", 200
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Expone las métricas internas (latencias de BBDD, colas, etc.) en JSON."""
+    return jsonify(metrics.snapshot()), 200
+
 def run_webserver():
     """Función que corre el servidor Flask en un hilo separado."""
     # Usamos el puerto que Render nos da (o el 10000 por defecto)
@@ -51,6 +60,17 @@ async def setup_hook():
     Carga automáticamente todos los Cogs de la carpeta /cogs
     y de todas sus sub-carpetas.
     """
+    # Servicio de almacenamiento compartido (ANTES de cargar los Cogs)
+    bot.storage = Storage()
+    # Despachador de logs de moderación (cola por canal + agrupado de embeds)
+    bot.log_dispatcher = LogDispatcher(bot)
+    # SIGTERM (cada deploy/reinicio del worker) cierra el bot limpiamente:
+    # así se descargan los Cogs y vuelcan lo que tienen en memoria (XP, ledger, sorteos)
+    try:
+        bot.loop.add_signal_handler(signal.SIGTERM, lambda: bot.loop.create_task(bot.close()))
+    except NotImplementedError:
+        pass # Windows no soporta add_signal_handler
+
     print("Cargando Cogs...")
     
     cogs_path = pathlib.Path('./cogs')
@@ -83,9 +103,14 @@ async def setup_hook():
 if __name__ == "__main__":
     if TOKEN:
         # ¡CRUCIAL! Iniciamos el servidor web en un hilo separado
-        threading.Thread(target=run_webserver).start()
+        # (daemon: al cerrar el bot el proceso termina sin esperar a Flask)
+        threading.Thread(target=run_webserver, daemon=True).start()
         
         # Luego, el bot de Discord arranca en el hilo principal (Asyncio)
         bot.run(TOKEN)
+
+        # El loop ya paró (y los Cogs ya se descargaron): cerramos las BBDD
+        if hasattr(bot, 'storage'):
+            bot.storage.close()
     else:
         print("Error: No se encontró el DISCORD_TOKEN en el archivo .env")
\ No newline at end of file
@@ -79,22 +79,17 @@ class AntiLinks(commands.Cog):
             except discord.Forbidden:
                 print(f"No se pudo enviar DM a {message.author.name} (DMs cerrados).")
             
-            # --- Acción 3: Enviar Log a Moderadores ---
-            log_channel = self.bot.get_channel(LOG_CHANNEL_ID)
-            if log_channel:
-                embed_log = discord.Embed(
-                    title="🛡️ Auto-Mod: Invitación Borrada",
-                    color=discord.Color.orange(),
-                    timestamp=datetime.datetime.now()
-                )
-                embed_log.add_field(name="Autor:", value=message.author.mention, inline=True)
-                embed_log.add_field(name="Canal:", value=message.channel.mention, inline=True)
-                embed_log.add_field(name="Contenido:", value=f"```{message.content}```", inline=False)
-                
-                try:
-                    await log_channel.send(embed=embed_log)
-                except Exception as e:
-                    print(f"Error al enviar log de anti-links: {e}")
+            # --- Acción 3: Enviar Log a Moderadores (vía el despachador de logs) ---
+            embed_log = discord.Embed(
+                title="🛡️ Auto-Mod: Invitación Borrada",
+                color=discord.Color.orange(),
+                timestamp=datetime.datetime.now()
+            )
+            embed_log.add_field(name="Autor:", value=message.author.mention, inline=True)
+            embed_log.add_field(name="Canal:", value=message.channel.mention, inline=True)
+            embed_log.add_field(name="Contenido:", value=f"```{message.content}```", inline=False)
+            
+            self.bot.log_dispatcher.send(LOG_CHANNEL_ID, embed_log)
 
 # --- Función Setup ---
 async def setup(bot: commands.Bot):
@@ -1,13 +1,31 @@
 # cogs/community/giveaways.py
 import os
+import time
+import heapq
+import asyncio
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 from discord import ui
 import datetime
-import sqlite3
 import random
 import re # Para leer el tiempo
+import sqlite3
+import weakref
+
+from utils.metrics import metrics
+from utils.batching import BatchWriter
+from utils.debounced_editor import DebouncedEditor
+
+# --- Configuración de las Inscripciones ---
+ENTRIES_FLUSH_INTERVAL = 1.0  # Segundos entre escrituras de participantes a la BBDD
+ENTRIES_FLUSH_MAX = 1000      # Si hay tantos pendientes, escribimos ya
+ENTRY_INSERT = "INSERT OR IGNORE INTO giveaway_participants (message_id, user_id) VALUES (?, ?)"
+GIVEAWAY_HISTORY_DAYS = 30    # Días que se guardan los sorteos terminados (para /reroll)
+GIVEAWAY_PURGE_HOURS = 24     # Cada cuánto se purga el historial viejo
+GIVEAWAY_RETRY_DELAY = 30     # Segundos hasta reintentar un sorteo que falló al cerrarse (se duplica en cada fallo)
+GIVEAWAY_RETRY_MAX = 3600     # Espera máxima entre reintentos
+ENTRY_FIELD = "Participantes" # Campo del embed con el contador en vivo
 
 # --- Cargar Configuración de Mod ---
 try:
@@ -46,6 +64,125 @@ def parse_duration(duration_str: str) -> datetime.timedelta:
             
     return datetime.timedelta(seconds=total_seconds)
 
+# --- Helper 2b: Contador de participantes en el embed ---
+def set_entry_count(embed: discord.Embed, count: int) -> discord.Embed:
+    """Pone (o actualiza) el campo con el número de participantes."""
+    for index, field in enumerate(embed.fields):
+        if field.name == ENTRY_FIELD:
+            embed.set_field_at(index, name=ENTRY_FIELD, value=f"👥 {count}", inline=True)
+            return embed
+    embed.add_field(name=ENTRY_FIELD, value=f"👥 {count}", inline=True)
+    return embed
+
+# --- Helper 3: Sorteo en SQL (sin cargar a los participantes en memoria) ---
+# Candidatos: participantes de 'message_id' que no hayan ganado ya en ese sorteo
+CANDIDATES = (
+    "FROM giveaway_participants WHERE message_id = :message_id "
+    "AND user_id NOT IN (SELECT user_id FROM giveaway_winners WHERE message_id = :message_id)"
+)
+# Requisitos opcionales: se aplican todos juntos, como filtros sobre las BBDD adjuntas
+REQUIREMENT_FILTERS = {
+    "min_level": "AND user_id IN (SELECT user_id FROM social.levels WHERE guild_id = :guild_id AND level >= :min_level)",
+    "min_balance": "AND user_id IN (SELECT user_id FROM economy.balances WHERE guild_id = :guild_id AND balance >= :min_balance)",
+    "required_role": "AND user_id IN (SELECT user_id FROM temp.giveaway_role_members)",
+}
+# Columnas añadidas después de la primera versión de la tabla 'giveaways'
+GIVEAWAY_COLUMNS = {
+    "ended": "INTEGER NOT NULL DEFAULT 0",
+    "announced": "INTEGER NOT NULL DEFAULT 0",
+    "min_level": "INTEGER",
+    "min_balance": "INTEGER",
+    "required_role": "INTEGER",
+}
+
+def sortear(conn, message_id: int, k: int, role_members=None) -> list:
+    """
+    Elige hasta 'k' ganadores al azar entre los candidatos que cumplen los
+    requisitos del sorteo. Los candidatos se filtran de una vez en SQL (JOIN
+    contra social.db / economy.db adjuntas) hacia una tabla temporal numerada
+    1..n; después se leen solo las 'k' filas elegidas. Solo LEE: corre en la
+    conexión de lectura de abrir_lectura(), nunca en la compartida.
+    'role_members' son los IDs con el rol requerido (de la caché de miembros),
+    o None si no se filtra por rol.
+    """
+    giveaway = conn.execute("SELECT * FROM giveaways WHERE message_id = ?", (message_id,)).fetchone()
+    params = {"message_id": message_id, "guild_id": giveaway['guild_id']}
+    filtro = CANDIDATES
+    for column in ("min_level", "min_balance"):
+        if giveaway[column] is not None:
+            params[column] = giveaway[column]
+            filtro += " " + REQUIREMENT_FILTERS[column]
+    if role_members is not None:
+        conn.execute("CREATE TEMP TABLE giveaway_role_members (user_id INTEGER PRIMARY KEY)")
+        conn.executemany("INSERT OR IGNORE INTO temp.giveaway_role_members (user_id) VALUES (?)", ((user_id,) for user_id in role_members))
+        filtro += " " + REQUIREMENT_FILTERS["required_role"]
+
+    # Tabla recién creada: los rowid empiezan en 1, así la posición i es 'WHERE n = i'
+    conn.execute("CREATE TEMP TABLE giveaway_candidates (n INTEGER PRIMARY KEY, user_id INTEGER NOT NULL)")
+    n = conn.execute(f"INSERT INTO temp.giveaway_candidates (user_id) SELECT user_id {filtro}", params).rowcount
+    return [
+        conn.execute("SELECT user_id FROM temp.giveaway_candidates WHERE n = ?", (position,)).fetchone()[0]
+        for position in random.sample(range(1, n + 1), k=min(k, n))
+    ]
+
+def abrir_lectura(paths: dict):
+    """
+    Conexión de lectura a community.db con social.db y economy.db adjuntas
+    ({alias: ruta}); solo escribe en tablas temporales. Es aparte de la
+    compartida: un BEGIN IMMEDIATE de esa conexión bloquearía también las BBDD
+    adjuntas (y con ellas a Economía y Niveles).
+    """
+    conn = sqlite3.connect(paths.pop("main"), isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA busy_timeout = 5000")
+    for alias, path in paths.items():
+        conn.execute("ATTACH DATABASE ? AS " + alias, (str(path),))
+    return conn
+
+def elegir_ganadores(paths: dict, message_id: int, k: int, role_members=None) -> list:
+    """Ejecuta sortear() en una lectura consistente (BEGIN DEFERRED: no toma bloqueos de escritura)."""
+    conn = abrir_lectura(dict(paths))
+    try:
+        conn.execute("BEGIN DEFERRED")
+        try:
+            return sortear(conn, message_id, k, role_members)
+        finally:
+            conn.execute("ROLLBACK") # Solo se escribió en tablas temporales
+    finally:
+        conn.close()
+
+def anotar_ganadores(conn, message_id: int, winners: list, ahora: str):
+    """Guarda una tirada en el historial (draw 0 = sorteo original, 1.. = rerolls)."""
+    draw = conn.execute("SELECT COALESCE(MAX(draw), -1) + 1 FROM giveaway_winners WHERE message_id = ?", (message_id,)).fetchone()[0]
+    conn.executemany(
+        "INSERT INTO giveaway_winners (message_id, user_id, draw, drawn_at) VALUES (?, ?, ?, ?)",
+        [(message_id, user_id, draw, ahora) for user_id in winners]
+    )
+
+def cerrar_sorteo(conn, message_id: int, winners: list, ahora: str) -> bool:
+    """Marca el sorteo como terminado y guarda la primera tirada. False si ya estaba cerrado."""
+    if conn.execute("UPDATE giveaways SET ended = 1 WHERE message_id = ? AND ended = 0", (message_id,)).rowcount == 0:
+        return False
+    anotar_ganadores(conn, message_id, winners, ahora)
+    return True
+
+def migrar(conn):
+    """Añade a 'giveaways' las columnas que falten (BBDD creadas con versiones anteriores)."""
+    columnas = {row[1] for row in conn.execute("PRAGMA table_info(giveaways)")}
+    for column, definition in GIVEAWAY_COLUMNS.items():
+        if column not in columnas:
+            conn.execute(f"ALTER TABLE giveaways ADD COLUMN {column} {definition}")
+    if "announced" not in columnas:
+        # Los sorteos que ya estaban cerrados se anunciaron con la versión anterior
+        conn.execute("UPDATE giveaways SET announced = ended")
+
+def purgar_historial(conn, limite: str):
+    """Borra los sorteos terminados antes de 'limite' (ISO), con sus participantes y ganadores."""
+    viejos = "SELECT message_id FROM giveaways WHERE announced = 1 AND end_time < ?"
+    conn.execute(f"DELETE FROM giveaway_participants WHERE message_id IN ({viejos})", (limite,))
+    conn.execute(f"DELETE FROM giveaway_winners WHERE message_id IN ({viejos})", (limite,))
+    conn.execute("DELETE FROM giveaways WHERE announced = 1 AND end_time < ?", (limite,))
+
 # -----------------------------------------------------------------
 # --- Clase 1: La Vista del Botón (Persistente) ---
 # -----------------------------------------------------------------
@@ -57,38 +194,22 @@ class GiveawayButton(ui.View):
     async def join_giveaway(self, interaction: discord.Interaction, button: ui.Button):
         """Callback: Se ejecuta cuando un usuario pulsa el botón."""
         
-        # Conectamos a la BBDD para registrar al participante
-        db = sqlite3.connect('data/community.db')
-        cursor = db.cursor()
-        
-        try:
-            # Comprobar si el sorteo sigue activo
-            cursor.execute("SELECT * FROM giveaways WHERE message_id = ?", (interaction.message.id,))
-            giveaway_data = cursor.fetchone()
-            
-            if not giveaway_data:
-                await interaction.response.send_message("Este sorteo ya ha finalizado.", ephemeral=True)
-                db.close()
-                return
-
-            # ¡Registrar al participante!
-            # INSERT OR IGNORE previene que un usuario se registre dos veces
-            cursor.execute(
-                "INSERT OR IGNORE INTO giveaway_participants (message_id, user_id) VALUES (?, ?)",
-                (interaction.message.id, interaction.user.id)
-            )
-            db.commit()
-            
-            if cursor.rowcount > 0:
-                await interaction.response.send_message("¡Mucha suerte! Has entrado al sorteo. 🤞", ephemeral=True)
-            else:
-                await interaction.response.send_message("Ya estabas participando en este sorteo.", ephemeral=True)
-                
-        except Exception as e:
-            print(f"Error de BBDD en botón de giveaway: {e}")
+        # Se responde desde memoria: el Cog guarda los sorteos activos y sus
+        # participantes, y escribe las inscripciones a la BBDD en lotes
+        cog = interaction.client.get_cog("Giveaways")
+        if cog is None:
             await interaction.response.send_message("Error al registrarte. Inténtalo de nuevo.", ephemeral=True)
-        finally:
-            db.close()
+            return
+        
+        joined = cog.join(interaction.message.id, interaction.user.id)
+        
+        if joined is None:
+            await interaction.response.send_message("Este sorteo ya ha finalizado.", ephemeral=True)
+        elif joined:
+            await interaction.response.send_message("¡Mucha suerte! Has entrado al sorteo. 🤞", ephemeral=True)
+            cog.refresh_entries(interaction.message)
+        else:
+            await interaction.response.send_message("Ya estabas participando en este sorteo.", ephemeral=True)
 
 # -----------------------------------------------------------------
 # --- Clase 2: El Cog (Comando y Tarea de Fondo) ---
@@ -96,44 +217,170 @@ class GiveawayButton(ui.View):
 class Giveaways(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.init_database()
-        # ¡Iniciamos la tarea en segundo plano!
-        self.check_giveaways.start()
-
-    def init_database(self):
-        """Crea la BBDD y las tablas si no existen."""
-        os.makedirs('data', exist_ok=True)
-        db = sqlite3.connect('data/community.db') # Nueva BBDD
-        cursor = db.cursor()
-        
-        # Tabla 1: Los sorteos activos
-        cursor.execute("""
+        self.db = bot.storage.get('community')
+        self.schedule = []  # heap de (end_time en epoch, message_id): el primero es el siguiente en acabar
+        self._wake = asyncio.Event()  # Despierta al planificador si llega un sorteo que acaba antes
+        self.scheduler_task = None
+        self.retries = {}  # {message_id: fallos seguidos al cerrarlo}
+        # Un candado por sorteo (así dos rerolls del mismo no eligen al mismo); sorteos distintos van a la vez
+        self.draw_locks = weakref.WeakValueDictionary()
+        # Sorteos activos y sus participantes {message_id: {user_id}}: los clics se contestan desde aquí
+        self.active = {}
+        # Inscripciones con escritura agrupada (un executemany por lote, no una transacción por clic)
+        self.entries = BatchWriter(self.db, ENTRY_INSERT, name="giveaways.entries",
+                                   interval=ENTRIES_FLUSH_INTERVAL, max_batch=ENTRIES_FLUSH_MAX)
+        # Ediciones del contador agrupadas (como mucho una cada pocos segundos por sorteo)
+        self.live_edits = DebouncedEditor(name="giveaways.live_edits")
+        metrics.gauge("giveaways.scheduled", lambda: len(self.schedule))
+        metrics.gauge("giveaways.active", lambda: len(self.active))
+
+    async def cog_load(self):
+        await self.init_database()
+        await self.load_schedule()
+        await self.load_active()
+        self.entries.start()
+        self.purgar.start()
+        # ¡Iniciamos el planificador en segundo plano!
+        self.scheduler_task = self.bot.loop.create_task(self.run_scheduler())
+
+    async def init_database(self):
+        """Crea las tablas si no existen (el historial viejo lo purga la tarea 'purgar')."""
+        await self.db.executescript("""
+        -- Tabla 1: Los sorteos (los terminados se guardan un tiempo para /reroll)
         CREATE TABLE IF NOT EXISTS giveaways (
             message_id INTEGER PRIMARY KEY,
             guild_id INTEGER NOT NULL,
             channel_id INTEGER NOT NULL,
             end_time DATETIME NOT NULL,
             winner_count INTEGER NOT NULL,
-            prize TEXT NOT NULL
-        )
-        """)
-        
-        # Tabla 2: Los participantes de cada sorteo
-        cursor.execute("""
+            prize TEXT NOT NULL,
+            ended INTEGER NOT NULL DEFAULT 0,      -- 1 = ya sorteado (ganadores en giveaway_winners)
+            announced INTEGER NOT NULL DEFAULT 0,  -- 1 = mensaje editado y ganadores anunciados
+            min_level INTEGER,      -- Requisitos opcionales (se comprueban al sortear)
+            min_balance INTEGER,
+            required_role INTEGER
+        );
+
+        -- Tabla 2: Los participantes de cada sorteo
         CREATE TABLE IF NOT EXISTS giveaway_participants (
             message_id INTEGER NOT NULL,
             user_id INTEGER NOT NULL,
             FOREIGN KEY (message_id) REFERENCES giveaways(message_id) ON DELETE CASCADE,
             PRIMARY KEY (message_id, user_id)
-        )
+        );
+
+        -- Tabla 3: Historial de ganadores (draw 0 = sorteo original, 1.. = rerolls)
+        CREATE TABLE IF NOT EXISTS giveaway_winners (
+            message_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            draw INTEGER NOT NULL,
+            drawn_at DATETIME NOT NULL,
+            PRIMARY KEY (message_id, user_id)
+        );
+
+        -- El planificador lee los sorteos por orden de finalización
+        CREATE INDEX IF NOT EXISTS idx_giveaways_end_time ON giveaways (end_time);
         """)
-        
-        db.commit()
-        db.close()
+        await self.db.transaction(migrar)
 
-    def cog_unload(self):
+    async def cog_unload(self):
         """Se llama si el Cog se recarga (para desarrollo)."""
-        self.check_giveaways.cancel()
+        if self.scheduler_task:
+            self.scheduler_task.cancel()
+        self.purgar.cancel()
+        await self.live_edits.close()
+        await self.entries.close()
+
+    # --- Tarea de Fondo: Purga del Historial ---
+    @tasks.loop(hours=GIVEAWAY_PURGE_HOURS)
+    async def purgar(self):
+        """Borra los sorteos anunciados hace más de GIVEAWAY_HISTORY_DAYS días (la primera vez, al cargar)."""
+        limite = datetime.datetime.now(datetime.UTC) - datetime.timedelta(days=GIVEAWAY_HISTORY_DAYS)
+        try:
+            await self.db.transaction(purgar_historial, limite.isoformat())
+        except Exception as e:
+            print(f"Error al purgar el historial de sorteos: {e}")
+
+    async def load_active(self):
+        """Carga en memoria los sorteos activos y sus participantes."""
+        self.active = {row['message_id']: set() for row in await self.db.fetchall("SELECT message_id FROM giveaways WHERE ended = 0")}
+        rows = await self.db.fetchall(
+            "SELECT p.message_id, p.user_id FROM giveaway_participants p "
+            "JOIN giveaways g ON g.message_id = p.message_id WHERE g.ended = 0"
+        )
+        for row in rows:
+            participants = self.active.get(row['message_id'])
+            if participants is not None:
+                participants.add(row['user_id'])
+
+    def join(self, message_id: int, user_id: int):
+        """
+        Apunta a 'user_id' al sorteo (sin esperar a la BBDD). Devuelve None si el
+        sorteo no está activo, True si entra y False si ya participaba.
+        """
+        participants = self.active.get(message_id)
+        if participants is None:
+            return None
+        if user_id in participants:
+            return False
+        participants.add(user_id)
+        self.entries.add((message_id, user_id))
+        return True
+
+    async def prepare_draw(self, giveaway):
+        """
+        Deja todo listo para filtrar por requisitos en SQL: vuelca el XP pendiente
+        de Levels (así social.db está al día) y devuelve los IDs con el rol
+        requerido desde la caché de miembros (None si el sorteo no pide rol).
+        """
+        if giveaway['min_level'] is not None:
+            levels = self.bot.get_cog("Levels")
+            if levels:
+                await levels.xp_buffer.flush()
+        if giveaway['required_role'] is None:
+            return None
+        guild = self.bot.get_guild(giveaway['guild_id'])
+        role = guild.get_role(giveaway['required_role']) if guild else None
+        if role is None:
+            print(f"Sorteo {giveaway['message_id']}: el rol requerido ya no existe; se ignora ese requisito.")
+            return None
+        return [member.id for member in role.members]
+
+    async def draw(self, giveaway, k: int, *, close: bool = False):
+        """
+        Hace una tirada: elige en una conexión de lectura aparte (en otro hilo) y
+        guarda el resultado con una transacción corta en la compartida. Con
+        'close' también marca el sorteo como terminado (None si ya lo estaba).
+        """
+        lock = self.draw_locks.get(giveaway['message_id'])
+        if lock is None:
+            lock = self.draw_locks[giveaway['message_id']] = asyncio.Lock()
+        async with lock:
+            start = time.perf_counter()
+            role_members = await self.prepare_draw(giveaway)
+            paths = {
+                "main": self.db.path,
+                "social": self.bot.storage.get('social').path,
+                "economy": self.bot.storage.get('economy').path,
+            }
+            winners = await asyncio.to_thread(elegir_ganadores, paths, giveaway['message_id'], k, role_members)
+            ahora = datetime.datetime.now(datetime.UTC).isoformat()
+            if close:
+                if not await self.db.transaction(cerrar_sorteo, giveaway['message_id'], winners, ahora):
+                    return None
+            else:
+                await self.db.transaction(anotar_ganadores, giveaway['message_id'], winners, ahora)
+            metrics.observe("giveaways.draw", (time.perf_counter() - start) * 1000)
+            return winners
+
+    def refresh_entries(self, message: discord.Message):
+        """Programa la actualización del contador de participantes del mensaje del sorteo."""
+        def render():
+            participants = self.active.get(message.id)
+            if participants is None or not message.embeds:
+                return None # El sorteo ya terminó: su embed final lo pone end_giveaway
+            return {"embed": set_entry_count(message.embeds[0].copy(), len(participants))}
+        self.live_edits.schedule(message, render)
 
     @app_commands.command(
         name="giveaway",
@@ -142,10 +389,14 @@ class Giveaways(commands.Cog):
     @app_commands.describe(
         duracion="Duración (ej: 1d, 12h, 30m, 1h30m).",
         ganadores="Número de ganadores (ej: 1).",
-        premio="El premio que se sortea."
+        premio="El premio que se sortea.",
+        nivel_minimo="(Opcional) Nivel mínimo para poder ganar.",
+        saldo_minimo="(Opcional) Nocoins mínimos para poder ganar.",
+        rol="(Opcional) Rol necesario para poder ganar."
     )
     @is_moderator()
-    async def giveaway(self, interaction: discord.Interaction, duracion: str, ganadores: app_commands.Range[int, 1, 20], premio: str):
+    async def giveaway(self, interaction: discord.Interaction, duracion: str, ganadores: app_commands.Range[int, 1, 20], premio: str,
+                       nivel_minimo: app_commands.Range[int, 1] = None, saldo_minimo: app_commands.Range[int, 1] = None, rol: discord.Role = None):
         
         await interaction.response.defer(ephemeral=True)
         
@@ -164,6 +415,16 @@ class Giveaways(commands.Cog):
             color=discord.Color.magenta(),
             timestamp=end_time
         )
+        requisitos = []
+        if nivel_minimo:
+            requisitos.append(f"Nivel {nivel_minimo} o más")
+        if saldo_minimo:
+            requisitos.append(f"{saldo_minimo} Nocoins o más")
+        if rol:
+            requisitos.append(f"Tener el rol {rol.mention}")
+        if requisitos:
+            embed.add_field(name="Requisitos (se comprueban al sortear)", value="\n".join(requisitos), inline=False)
+        set_entry_count(embed, 0)
         embed.set_footer(text="Finaliza") # El timestamp al lado lo hace automático
 
         # 3. Enviar el mensaje y registrarlo
@@ -172,14 +433,14 @@ class Giveaways(commands.Cog):
             message = await interaction.channel.send(embed=embed, view=view)
             
             # 4. Guardar en la Base de Datos
-            db = sqlite3.connect('data/community.db')
-            cursor = db.cursor()
-            cursor.execute(
-                "INSERT INTO giveaways (message_id, guild_id, channel_id, end_time, winner_count, prize) VALUES (?, ?, ?, ?, ?, ?)",
-                (message.id, interaction.guild.id, interaction.channel.id, end_time.isoformat(), ganadores, premio)
+            await self.db.execute(
+                "INSERT INTO giveaways (message_id, guild_id, channel_id, end_time, winner_count, prize, min_level, min_balance, required_role) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (message.id, interaction.guild.id, interaction.channel.id, end_time.isoformat(), ganadores, premio,
+                 nivel_minimo, saldo_minimo, rol.id if rol else None)
             )
-            db.commit()
-            db.close()
+            self.active[message.id] = set() # Desde ya se aceptan clics
+            self.schedule_giveaway(message.id, end_time.timestamp())
             
             await interaction.followup.send("¡Sorteo creado con éxito!", ephemeral=True)
             
@@ -188,80 +449,182 @@ class Giveaways(commands.Cog):
             await interaction.followup.send(f"Error al crear el sorteo: {e}", ephemeral=True)
 
     # -----------------------------------------------------------------
-    # --- La Tarea en Segundo Plano (¡100% Fiable!) ---
+    # --- El Planificador (duerme hasta el siguiente sorteo) ---
     # -----------------------------------------------------------------
-    @tasks.loop(seconds=30) # Comprueba cada 30 segundos
-    async def check_giveaways(self):
-        """Comprueba la BBDD por sorteos finalizados."""
-        
-        # Esperar a que el bot esté 100% conectado
+    async def load_schedule(self):
+        """Reconstruye el heap de finalizaciones desde la BBDD (usa el índice de end_time)."""
+        # También los ya sorteados cuyo anuncio falló: se reintenta solo el anuncio
+        rows = await self.db.fetchall("SELECT message_id, end_time FROM giveaways WHERE announced = 0 ORDER BY end_time")
+        # Ya vienen ordenadas, así que la lista es un heap válido
+        self.schedule = [(datetime.datetime.fromisoformat(row['end_time']).timestamp(), row['message_id']) for row in rows]
+
+    def schedule_giveaway(self, message_id: int, end_ts: float):
+        """Añade un sorteo al heap; si acaba antes que el siguiente, despierta al planificador."""
+        earliest = self.schedule[0][0] if self.schedule else None
+        heapq.heappush(self.schedule, (end_ts, message_id))
+        if earliest is None or end_ts < earliest:
+            self._wake.set()
+
+    async def run_scheduler(self):
+        """Espera exactamente hasta el siguiente end_time (o a que lo despierten) y cierra los sorteos vencidos."""
         await self.bot.wait_until_ready()
         
-        now = datetime.datetime.now(datetime.UTC)
-        db = sqlite3.connect('data/community.db')
-        db.row_factory = sqlite3.Row # Para leer como diccionario
-        cursor = db.cursor()
-        
-        try:
-            # 1. Buscar sorteos que hayan terminado
-            cursor.execute("SELECT * FROM giveaways WHERE end_time <= ?", (now.isoformat(),))
-            ended_giveaways = cursor.fetchall()
+        while True:
+            self._wake.clear()
+            if not self.schedule:
+                await self._wake.wait()
+                continue
             
-            if not ended_giveaways:
-                db.close()
-                return # No hay nada que hacer
-
-            # 2. Procesar cada sorteo finalizado
-            for giveaway in ended_giveaways:
-                channel = self.bot.get_channel(giveaway['channel_id'])
-                if not channel:
-                    continue # El canal fue borrado
-
+            delay = self.schedule[0][0] - time.time()
+            if delay > 0:
                 try:
-                    # 3. Buscar el mensaje original
-                    message = await channel.fetch_message(giveaway['message_id'])
-                except discord.NotFound:
-                    continue # El mensaje fue borrado
-                
-                # 4. Obtener los participantes de la BBDD
-                cursor.execute("SELECT user_id FROM giveaway_participants WHERE message_id = ?", (giveaway['message_id'],))
-                participants_rows = cursor.fetchall()
-                # Convertir [(123,), (456,)] en [123, 456]
-                participants_list = [row['user_id'] for row in participants_rows]
-
-                # 5. Elegir al ganador(es)
-                winner_mentions = []
-                if not participants_list:
-                    winner_str = "¡Nadie participó! 😢"
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            # Todos los que vencen ya se procesan a la vez
+            now = time.time()
+            due = []
+            while self.schedule and self.schedule[0][0] <= now:
+                due.append(heapq.heappop(self.schedule))
+            results = await asyncio.gather(*(self.end_giveaway(message_id) for _, message_id in due), return_exceptions=True)
+            for (_, message_id), result in zip(due, results):
+                if isinstance(result, Exception):
+                    # Lo devolvemos al heap: el sondeo de antes reintentaba solo, esto también
+                    fallos = self.retries.get(message_id, 0)
+                    delay = min(GIVEAWAY_RETRY_DELAY * 2 ** fallos, GIVEAWAY_RETRY_MAX)
+                    self.retries[message_id] = fallos + 1
+                    print(f"Error al finalizar el sorteo {message_id} (reintento en {delay} s): {result!r}")
+                    metrics.incr("giveaways.end_retry")
+                    self.schedule_giveaway(message_id, time.time() + delay)
                 else:
-                    winner_count = giveaway['winner_count']
-                    # Usamos min() por si participaron menos personas que el número de ganadores
-                    k = min(winner_count, len(participants_list)) 
-                    winner_ids = random.sample(participants_list, k=k)
-                    winner_mentions = [f"<@{user_id}>" for user_id in winner_ids]
-                    winner_str = ", ".join(winner_mentions)
-                
-                # 6. Actualizar el Embed original
-                new_embed = message.embeds[0]
-                new_embed.description = f"**Premio:** {giveaway['prize']}\n\n**Sorteo finalizado.**\n**Ganador(es):** {winner_str}"
-                new_embed.color = discord.Color.greyple()
-                
-                # Quitar el botón
-                await message.edit(embed=new_embed, view=None) 
-                
-                # 7. Anunciar al ganador en un mensaje nuevo
-                if winner_mentions:
-                    await channel.send(f"¡Felicidades {winner_str}! Habéis ganado: **{giveaway['prize']}** 🎉")
-
-                # 8. Limpiar la Base de Datos
-                # Borrar el sorteo (esto borra a los participantes gracias a "ON DELETE CASCADE")
-                cursor.execute("DELETE FROM giveaways WHERE message_id = ?", (giveaway['message_id'],))
-                db.commit()
+                    self.retries.pop(message_id, None)
 
-        except Exception as e:
-            print(f"Error en el bucle check_giveaways: {e}")
-        finally:
-            db.close()
+    async def end_giveaway(self, message_id: int):
+        """
+        Elige ganador(es), actualiza el mensaje y los anuncia. Solo se da por
+        terminado (announced = 1) cuando el mensaje se editó y el anuncio salió;
+        si eso falla, el reintento anuncia los ganadores ya guardados.
+        """
+        # Cerramos las inscripciones y volcamos las pendientes antes de sortear
+        participants = self.active.pop(message_id, None)
+        try:
+            await self.entries.flush()
+            await self.live_edits.cancel(message_id) # Que ningún contador pise el embed final
+        
+            giveaway = await self.db.fetchone("SELECT * FROM giveaways WHERE message_id = ? AND announced = 0", (message_id,))
+            if giveaway is None:
+                return # Ya no existe (o ya terminó)
+        
+            channel = self.bot.get_channel(giveaway['channel_id'])
+            if not channel:
+                return # El canal fue borrado
+
+            try:
+                # 1. Buscar el mensaje original
+                message = await channel.fetch_message(message_id)
+            except discord.NotFound:
+                return # El mensaje fue borrado
+        
+            # 2. Elegir al ganador(es) directamente en la BBDD y cerrar el sorteo
+            if giveaway['ended']:
+                # Ya se sorteó en un intento anterior: solo falta anunciarlo
+                rows = await self.db.fetchall("SELECT user_id FROM giveaway_winners WHERE message_id = ? AND draw = 0", (message_id,))
+                winner_ids = [row['user_id'] for row in rows]
+            else:
+                winner_ids = await self.draw(giveaway, giveaway['winner_count'], close=True)
+                if winner_ids is None:
+                    return # Otro proceso lo cerró mientras tanto
+        except Exception:
+            # Fallo transitorio antes de cerrar el sorteo: reabrimos las inscripciones
+            # (el planificador lo reintenta más tarde)
+            if participants is not None:
+                self.active[message_id] = participants
+            raise
+        
+        if participants is not None:
+            inscritos = len(participants)
+        else:
+            inscritos = (await self.db.fetchone("SELECT COUNT(*) FROM giveaway_participants WHERE message_id = ?", (message_id,)))[0]
+        
+        winner_mentions = [f"<@{user_id}>" for user_id in winner_ids]
+        if winner_mentions:
+            winner_str = ", ".join(winner_mentions)
+        elif inscritos:
+            winner_str = "Nadie cumplía los requisitos. 😢"
+        else:
+            winner_str = "¡Nadie participó! 😢"
+        
+        # 3. Actualizar el Embed original (si falla, el planificador lo reintenta)
+        new_embed = message.embeds[0]
+        new_embed.description = f"**Premio:** {giveaway['prize']}\n\n**Sorteo finalizado.**\n**Ganador(es):** {winner_str}"
+        new_embed.color = discord.Color.greyple()
+        set_entry_count(new_embed, inscritos)
+        
+        # Quitar el botón
+        await message.edit(embed=new_embed, view=None) 
+        
+        # 4. Anunciar al ganador en un mensaje nuevo
+        if winner_mentions:
+            await channel.send(f"¡Felicidades {winner_str}! Habéis ganado: **{giveaway['prize']}** 🎉")
+        
+        # 5. Ahora sí, terminado
+        await self.db.execute("UPDATE giveaways SET announced = 1 WHERE message_id = ?", (message_id,))
+        # Retraso respecto al end_time original (incluye los reintentos)
+        end_ts = datetime.datetime.fromisoformat(giveaway['end_time']).timestamp()
+        metrics.observe("giveaways.end_lateness", (time.time() - end_ts) * 1000)
+
+    # -----------------------------------------------------------------
+    # --- Comando: Repetir el Sorteo ---
+    # -----------------------------------------------------------------
+    @app_commands.command(
+        name="reroll",
+        description="[MOD] Vuelve a sortear un sorteo terminado (sin repetir ganadores)."
+    )
+    @app_commands.describe(
+        mensaje_id="ID del mensaje del sorteo.",
+        ganadores="Número de ganadores nuevos (ej: 1)."
+    )
+    @is_moderator()
+    async def reroll(self, interaction: discord.Interaction, mensaje_id: str, ganadores: app_commands.Range[int, 1, 20] = 1):
+        
+        await interaction.response.defer(ephemeral=True)
+        
+        if not mensaje_id.isdigit():
+            await interaction.followup.send("Eso no es un ID de mensaje válido.", ephemeral=True)
+            return
+        message_id = int(mensaje_id)
+        
+        giveaway = await self.db.fetchone("SELECT * FROM giveaways WHERE message_id = ? AND guild_id = ?", (message_id, interaction.guild.id))
+        if giveaway is None:
+            await interaction.followup.send(f"No encontré ese sorteo (solo se guardan {GIVEAWAY_HISTORY_DAYS} días).", ephemeral=True)
+            return
+        if not giveaway['ended']:
+            await interaction.followup.send("Ese sorteo todavía no ha terminado.", ephemeral=True)
+            return
+        
+        # Mismo sorteo en SQL; los que ya ganaron (en cualquier tirada) quedan fuera
+        winner_ids = await self.draw(giveaway, ganadores)
+        if not winner_ids:
+            await interaction.followup.send("No quedan participantes que cumplan los requisitos y no hayan ganado ya. 😢", ephemeral=True)
+            return
+        
+        winner_str = ", ".join(f"<@{user_id}>" for user_id in winner_ids)
+        channel = self.bot.get_channel(giveaway['channel_id']) or interaction.channel
+        await channel.send(f"🔁 ¡Nuevo sorteo! Felicidades {winner_str}, habéis ganado: **{giveaway['prize']}** 🎉")
+        await interaction.followup.send("¡Sorteo repetido!", ephemeral=True)
+
+    @reroll.error
+    async def on_reroll_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        if isinstance(error, app_commands.CheckFailure):
+            await interaction.response.send_message("⛔ ¡Acceso Denegado! ⛔", ephemeral=True)
+        else:
+            print(f"Error en /reroll: {error}")
+            if interaction.response.is_done():
+                await interaction.followup.send("Algo salió mal.", ephemeral=True)
+            else:
+                await interaction.response.send_message("Algo salió mal.", ephemeral=True)
         
 async def setup(bot: commands.Bot):
     # ¡Importante! Añadimos la vista persistente ANTES de añadir el Cog
@@ -1,16 +1,25 @@
 # cogs/economy/economy.py
 import os
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
+from discord import ui
 import datetime
 import sqlite3
 import random
+from cachetools import TTLCache
 
 # --- CONSTANTES DE ECONOMÍA ---
 DAILY_AMOUNT = 100 
 DAILY_COOLDOWN = 23 
 
+# --- CONSTANTES DEL LEDGER ---
+LEDGER_COMPACT_MINUTES = 10   # Cada cuánto se generan snapshots de saldo
+
+# --- CONSTANTES DEL LEADERBOARD ---
+LEADERBOARD_PAGE_SIZE = 10
+NAME_CACHE_TTL = 3600  # Segundos que recordamos el nombre de un usuario que ya no está en el servidor
+
 # --- ¡NUEVO! Cargar el ID de Moderador ---
 try:
     MOD_ROLE_ID = int(os.getenv("MODERATOR_ROLE_ID"))
@@ -28,67 +37,378 @@ def is_moderator():
         return role is not None
     return app_commands.check(predicate)
 
+# --- Esquema de la BBDD de Economía ---
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS balances (
+    user_id INTEGER NOT NULL, guild_id INTEGER NOT NULL,
+    balance INTEGER DEFAULT 0, last_daily DATETIME,
+    PRIMARY KEY (user_id, guild_id)
+);
+-- Índice de ranking (cubre las consultas del leaderboard: no toca la tabla)
+CREATE INDEX IF NOT EXISTS idx_balances_ranking ON balances (guild_id, balance DESC, user_id);
+
+CREATE TABLE IF NOT EXISTS shop_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    description TEXT,
+    price INTEGER NOT NULL,
+    role_id INTEGER NOT NULL UNIQUE
+);
+
+-- Ledger: historial append-only de TODOS los movimientos de Nocoins
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    amount INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    created_at DATETIME NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_user ON transactions (guild_id, user_id, created_at);
+
+-- Snapshots: saldo de cada usuario tras aplicar todos los movimientos con id <= last_tx_id
+CREATE TABLE IF NOT EXISTS balance_snapshots (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    last_tx_id INTEGER NOT NULL,
+    balance INTEGER NOT NULL,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (guild_id, user_id, last_tx_id)
+);
+"""
+
+LEDGER_INSERT = "INSERT INTO transactions (guild_id, user_id, amount, kind, created_at) VALUES (?, ?, ?, ?, ?)"
+
+# -----------------------------------------------------------------
+# --- Operaciones Atómicas (corren DENTRO del hilo de la BBDD) ---
+# -----------------------------------------------------------------
+# Cada cambio de saldo es UNA sentencia condicional: la comprobación de
+# fondos y la escritura ocurren a la vez, así dos clics simultáneos no
+# pueden gastar las mismas monedas ni pisarse el saldo.
+
+def saldo_actual(conn, user_id: int, guild_id: int) -> int:
+    row = conn.execute("SELECT balance FROM balances WHERE user_id = ? AND guild_id = ?", (user_id, guild_id)).fetchone()
+    return row[0] if row else 0
+
+def debitar(conn, user_id: int, guild_id: int, cantidad: int):
+    """Resta 'cantidad' solo si hay fondos. Devuelve el nuevo saldo, o None."""
+    row = conn.execute(
+        "UPDATE balances SET balance = balance - ? WHERE user_id = ? AND guild_id = ? AND balance >= ? RETURNING balance",
+        (cantidad, user_id, guild_id, cantidad)
+    ).fetchone()
+    return row[0] if row else None
+
+def acreditar(conn, user_id: int, guild_id: int, cantidad: int) -> int:
+    """Suma 'cantidad' (creando la fila si no existe). Devuelve el nuevo saldo."""
+    return conn.execute(
+        "INSERT INTO balances (user_id, guild_id, balance) VALUES (?, ?, ?) "
+        "ON CONFLICT (user_id, guild_id) DO UPDATE SET balance = balance + excluded.balance RETURNING balance",
+        (user_id, guild_id, cantidad)
+    ).fetchone()[0]
+
+def transferir(conn, emisor_id: int, receptor_id: int, guild_id: int, cantidad: int):
+    """Devuelve (ok, saldo_del_emisor)."""
+    nuevo_saldo = debitar(conn, emisor_id, guild_id, cantidad)
+    if nuevo_saldo is None:
+        return False, saldo_actual(conn, emisor_id, guild_id)
+    acreditar(conn, receptor_id, guild_id, cantidad)
+    return True, nuevo_saldo
+
+def resolver_apuesta(conn, user_id: int, guild_id: int, cantidad: int, gana: bool):
+    """Aplica la apuesta solo si el usuario puede cubrirla. Devuelve (ok, saldo)."""
+    row = conn.execute(
+        "UPDATE balances SET balance = balance + ? WHERE user_id = ? AND guild_id = ? AND balance >= ? RETURNING balance",
+        (cantidad if gana else -cantidad, user_id, guild_id, cantidad)
+    ).fetchone()
+    if row is None:
+        return False, saldo_actual(conn, user_id, guild_id)
+    return True, row[0]
+
+def cobrar_diario(conn, user_id: int, guild_id: int, cantidad: int, ahora: str, limite: str):
+    """
+    Paga el diario si el último cobro es anterior a 'limite' (ISO).
+    Devuelve (True, nuevo_saldo) o (False, last_daily).
+    """
+    row = conn.execute(
+        "INSERT INTO balances (user_id, guild_id, balance, last_daily) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (user_id, guild_id) DO UPDATE SET balance = balance + excluded.balance, last_daily = excluded.last_daily "
+        "WHERE last_daily IS NULL OR last_daily <= ? RETURNING balance",
+        (user_id, guild_id, cantidad, ahora, limite)
+    ).fetchone()
+    if row is not None:
+        return True, row[0]
+    last = conn.execute("SELECT last_daily FROM balances WHERE user_id = ? AND guild_id = ?", (user_id, guild_id)).fetchone()
+    return False, last[0]
+
+def con_ledger(conn, func, args, movimientos, ahora: str):
+    """
+    Ejecuta func(conn, *args) y, si tuvo éxito, anota 'movimientos'
+    [(guild_id, user_id, amount, kind)] en el ledger en la MISMA transacción:
+    el saldo y su historial se confirman juntos o no se confirma ninguno.
+    """
+    resultado = func(conn, *args)
+    ok = resultado[0] if isinstance(resultado, tuple) else True
+    if ok:
+        conn.executemany(LEDGER_INSERT, [(guild_id, user_id, amount, kind, ahora) for guild_id, user_id, amount, kind in movimientos])
+    return resultado
+
+# -----------------------------------------------------------------
+# --- Ledger: Snapshots y Consultas Históricas (hilo de la BBDD) ---
+# -----------------------------------------------------------------
+
+def abrir_ledger(conn, ahora: str):
+    """
+    Si el ledger está vacío, registra los saldos que ya existían como
+    movimientos de 'apertura' para que el historial cuadre. Va en una
+    transacción: la comprobación y la apertura se confirman juntas.
+    """
+    if conn.execute("SELECT 1 FROM transactions LIMIT 1").fetchone() is None:
+        conn.execute(
+            "INSERT INTO transactions (guild_id, user_id, amount, kind, created_at) "
+            "SELECT guild_id, user_id, balance, 'apertura', ? FROM balances WHERE balance != 0",
+            (ahora,)
+        )
+
+def compactar_ledger(conn, ahora: str) -> int:
+    """
+    Pliega los movimientos nuevos en snapshots de saldo (uno por usuario con
+    actividad). El ledger NO se borra: sigue siendo la auditoría completa.
+    Devuelve el número de snapshots creados.
+    """
+    desde = conn.execute("SELECT COALESCE(MAX(last_tx_id), 0) FROM balance_snapshots").fetchone()[0]
+    hasta = conn.execute("SELECT MAX(id) FROM transactions").fetchone()[0]
+    if hasta is None or hasta <= desde:
+        return 0
+    cursor = conn.execute(
+        """
+        INSERT INTO balance_snapshots (guild_id, user_id, last_tx_id, balance, created_at)
+        SELECT t.guild_id, t.user_id, ?,
+               COALESCE((SELECT s.balance FROM balance_snapshots s
+                         WHERE s.guild_id = t.guild_id AND s.user_id = t.user_id
+                         ORDER BY s.last_tx_id DESC LIMIT 1), 0) + SUM(t.amount),
+               ?
+        FROM transactions t
+        WHERE t.id > ? AND t.id <= ?
+        GROUP BY t.guild_id, t.user_id
+        """,
+        (hasta, ahora, desde, hasta)
+    )
+    return cursor.rowcount
+
+def saldo_en(conn, user_id: int, guild_id: int, momento: str) -> int:
+    """Saldo del usuario en un instante (ISO): último snapshot + movimientos posteriores."""
+    limite = conn.execute(
+        "SELECT MAX(id) FROM transactions WHERE guild_id = ? AND user_id = ? AND created_at <= ?",
+        (guild_id, user_id, momento)
+    ).fetchone()[0]
+    if limite is None:
+        return 0
+    snap = conn.execute(
+        "SELECT last_tx_id, balance FROM balance_snapshots "
+        "WHERE guild_id = ? AND user_id = ? AND last_tx_id <= ? ORDER BY last_tx_id DESC LIMIT 1",
+        (guild_id, user_id, limite)
+    ).fetchone()
+    desde, base = (snap[0], snap[1]) if snap else (0, 0)
+    delta = conn.execute(
+        "SELECT COALESCE(SUM(amount), 0) FROM transactions WHERE guild_id = ? AND user_id = ? AND id > ? AND id <= ?",
+        (guild_id, user_id, desde, limite)
+    ).fetchone()[0]
+    return base + delta
+
+# -----------------------------------------------------------------
+# --- Leaderboard: Consultas de Ranking (hilo de la BBDD) ---
+# -----------------------------------------------------------------
+
+def pagina_ranking(conn, guild_id: int, pagina: int):
+    """Devuelve (filas de la página, total de usuarios con saldo)."""
+    total = conn.execute("SELECT COUNT(*) FROM balances WHERE guild_id = ? AND balance > 0", (guild_id,)).fetchone()[0]
+    filas = conn.execute(
+        "SELECT user_id, balance FROM balances WHERE guild_id = ? AND balance > 0 "
+        "ORDER BY balance DESC, user_id LIMIT ? OFFSET ?",
+        (guild_id, LEADERBOARD_PAGE_SIZE, pagina * LEADERBOARD_PAGE_SIZE)
+    ).fetchall()
+    return filas, total
+
+def posicion_ranking(conn, user_id: int, guild_id: int):
+    """Devuelve (posición, saldo) del usuario, o None si no tiene saldo."""
+    row = conn.execute("SELECT balance FROM balances WHERE user_id = ? AND guild_id = ?", (user_id, guild_id)).fetchone()
+    if row is None or row[0] <= 0:
+        return None
+    saldo = row[0]
+    # Búsquedas por rango sobre idx_balances_ranking (mismo orden que la página)
+    por_delante = conn.execute(
+        "SELECT COUNT(*) FROM balances WHERE guild_id = ? AND balance > ?", (guild_id, saldo)
+    ).fetchone()[0]
+    empatados = conn.execute(
+        "SELECT COUNT(*) FROM balances WHERE guild_id = ? AND balance = ? AND user_id < ?", (guild_id, saldo, user_id)
+    ).fetchone()[0]
+    return por_delante + empatados + 1, saldo
+
+# -----------------------------------------------------------------
+# --- Vista: Leaderboard Paginado ---
+# -----------------------------------------------------------------
+class LeaderboardView(ui.View):
+    def __init__(self, cog, guild: discord.Guild, author: discord.abc.User, total: int):
+        super().__init__(timeout=180)
+        self.cog = cog
+        self.guild = guild
+        self.author = author
+        self.total = total
+        self.pagina = 0
+        self.update_buttons()
+
+    @property
+    def paginas(self) -> int:
+        return max(1, -(-self.total // LEADERBOARD_PAGE_SIZE))
+
+    def update_buttons(self):
+        self.prev_button.disabled = self.pagina <= 0
+        self.next_button.disabled = self.pagina >= self.paginas - 1
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.author.id:
+            await interaction.response.send_message("Usa `/leaderboard` para abrir tu propio ranking.", ephemeral=True)
+            return False
+        return True
+
+    async def cambiar_pagina(self, interaction: discord.Interaction, pagina: int):
+        self.pagina = pagina
+        embed, self.total = await self.cog.build_leaderboard(self.guild, self.author, self.pagina)
+        self.update_buttons()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @ui.button(emoji="◀️", style=discord.ButtonStyle.secondary)
+    async def prev_button(self, interaction: discord.Interaction, button: ui.Button):
+        await self.cambiar_pagina(interaction, max(0, self.pagina - 1))
+
+    @ui.button(emoji="▶️", style=discord.ButtonStyle.secondary)
+    async def next_button(self, interaction: discord.Interaction, button: ui.Button):
+        await self.cambiar_pagina(interaction, min(self.paginas - 1, self.pagina + 1))
+
 # --- Clase del Cog ---
 class Economy(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.init_database()
+        # Conexión compartida (WAL + hilo propio) del servicio de almacenamiento
+        self.db = bot.storage.get('economy')
+        # Nombres de usuarios que no están en la caché de miembros {user_id: nombre}
+        self.name_cache = TTLCache(maxsize=10_000, ttl=NAME_CACHE_TTL)
+        # Catálogo de la tienda por servidor (se llena al primer uso y se invalida con /additem y /delitem)
+        self.catalog = {}        # {guild_id: {item_id: item}} (ordenado por precio)
+        self.shop_embeds = {}    # {guild_id: discord.Embed} ya renderizado
+        self.catalog_version = {} # {guild_id: int} para no guardar un catálogo que se invalidó mientras se leía
 
-    def init_database(self):
-        """Crea las tablas 'balances' y 'shop_items' si no existen."""
-        os.makedirs('data', exist_ok=True) 
-        db = sqlite3.connect('data/economy.db') 
-        cursor = db.cursor()
-        
-        # Tabla de Balances
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS balances (
-            user_id INTEGER NOT NULL, guild_id INTEGER NOT NULL,
-            balance INTEGER DEFAULT 0, last_daily DATETIME,
-            PRIMARY KEY (user_id, guild_id)
-        )
-        """)
-        
-        # --- ¡NUEVA TABLA! Tienda ---
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS shop_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            guild_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            description TEXT,
-            price INTEGER NOT NULL,
-            role_id INTEGER NOT NULL UNIQUE
-        )
-        """)
+    async def cog_load(self):
+        await self.init_database()
+        self.compactar.start()
+
+    async def cog_unload(self):
+        self.compactar.cancel()
+
+    async def init_database(self):
+        """Crea las tablas (balances, tienda, ledger y snapshots) si no existen."""
+        await self.db.executescript(SCHEMA)
+        await self.db.transaction(abrir_ledger, datetime.datetime.now().isoformat())
+
+    # --- Función Helper: Cambiar saldos y anotarlo en el ledger (misma transacción) ---
+    async def mover(self, func, *args, movimientos: list):
+        """Ejecuta la operación atómica 'func' y, si sale bien, sus 'movimientos' del ledger."""
+        return await self.db.transaction(con_ledger, func, args, movimientos, datetime.datetime.now().isoformat())
+
+    # --- Tarea de Fondo: Compactador del Ledger ---
+    @tasks.loop(minutes=LEDGER_COMPACT_MINUTES)
+    async def compactar(self):
+        """Pliega el ledger en snapshots de saldo."""
+        try:
+            await self.db.transaction(compactar_ledger, datetime.datetime.now().isoformat())
+        except Exception as e:
+            print(f"Error al compactar el ledger de economía: {e}")
+
+    # --- Función Helper: Obtener Balance ---
+    async def get_balance(self, user_id: int, guild_id: int) -> dict:
+        """Una sola lectura. Un usuario sin fila tiene saldo 0 (no se escribe nada)."""
+        return await self.db.get_user_row('balances', user_id, guild_id, {"balance": 0, "last_daily": None})
+
+    # --- Función Helper: Devolver Nocoins (si una compra falla) ---
+    async def refund(self, user_id: int, guild_id: int, amount: int):
+        await self.mover(acreditar, user_id, guild_id, amount, movimientos=[(guild_id, user_id, amount, 'reembolso')])
+
+    # --- Función Helper: Catálogo de la Tienda (en memoria) ---
+    async def get_catalog(self, guild_id: int) -> dict:
+        """Devuelve {item_id: item} del servidor. Solo consulta la BBDD si no está en caché."""
+        catalog = self.catalog.get(guild_id)
+        if catalog is None:
+            version = self.catalog_version.get(guild_id, 0)
+            rows = await self.db.fetchall("SELECT id, name, price, role_id FROM shop_items WHERE guild_id = ? ORDER BY price ASC", (guild_id,))
+            catalog = {row['id']: dict(row) for row in rows}
+            if self.catalog_version.get(guild_id, 0) == version:
+                self.catalog[guild_id] = catalog
+        return catalog
+
+    def invalidate_catalog(self, guild_id: int):
+        self.catalog_version[guild_id] = self.catalog_version.get(guild_id, 0) + 1
+        self.catalog.pop(guild_id, None)
+        self.shop_embeds.pop(guild_id, None)
+
+    async def get_shop_embed(self, guild: discord.Guild) -> discord.Embed:
+        """Devuelve el embed de /tienda ya renderizado (se construye una vez por catálogo)."""
+        embed = self.shop_embeds.get(guild.id)
+        if embed is not None:
+            return embed
+        version = self.catalog_version.get(guild.id, 0)
+        items = await self.get_catalog(guild.id)
         
-        db.commit()
-        db.close()
-
-    # --- Función Helper: Obtener/Crear Balance (Sin cambios) ---
-    async def get_or_create_balance(self, user_id: int, guild_id: int) -> dict:
-        db = sqlite3.connect('data/economy.db')
-        db.row_factory = sqlite3.Row
-        cursor = db.cursor()
-        cursor.execute("SELECT * FROM balances WHERE user_id = ? AND guild_id = ?", (user_id, guild_id))
-        data = cursor.fetchone()
-        if data is None:
-            cursor.execute("INSERT INTO balances (user_id, guild_id, balance) VALUES (?, ?, ?)", (user_id, guild_id, 0))
-            db.commit()
-            cursor.execute("SELECT * FROM balances WHERE user_id = ? AND guild_id = ?", (user_id, guild_id))
-            data = cursor.fetchone()
-        db.close()
-        return data
+        embed = discord.Embed(title="🛒 Tienda de Roles Cosméticos 🛒", color=discord.Color.blue())
+        if not items:
+            embed.description = "La tienda está vacía. ¡Avisa a un admin para que añada roles!"
+        else:
+            embed.description = "Usa `/comprar [ID]` para obtener un rol.\n\n"
+            for item in items.values():
+                # Buscamos el rol para mostrarlo
+                role = guild.get_role(item['role_id'])
+                if role:
+                    embed.add_field(
+                        name=f"{item['name']} - {role.mention}",
+                        value=f"**Precio:** {item['price']} 🪙\n**ID:** `{item['id']}`",
+                        inline=False
+                    )
+        if self.catalog_version.get(guild.id, 0) == version:
+            self.shop_embeds[guild.id] = embed
+        return embed
+
+    # --- Evento: si borran un rol de la tienda, el embed renderizado ya no vale ---
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        catalog = self.catalog.get(role.guild.id)
+        if catalog is None or any(item['role_id'] == role.id for item in catalog.values()):
+            self.invalidate_catalog(role.guild.id)
 
     # --- Comandos Públicos (Sin cambios) ---
     # (/balance, /daily, /pagar, /leaderboard, /apostar)
     # ... (Omitidos por brevedad, están exactamente igual que antes) ...
     @app_commands.command(name="balance", description="Comprueba tu balance de Nocoins 🪙.")
-    async def balance(self, interaction: discord.Interaction, miembro: discord.Member = None):
-        # ... (código igual)
+    @app_commands.describe(miembro="La persona cuyo saldo quieres ver (opcional).", fecha="Ver el saldo al final de un día pasado (AAAA-MM-DD, opcional).")
+    async def balance(self, interaction: discord.Interaction, miembro: discord.Member = None, fecha: str = None):
         target_user = miembro or interaction.user
-        data = await self.get_or_create_balance(target_user.id, interaction.guild.id)
         embed = discord.Embed(title=f"Balance de {target_user.display_name}", color=discord.Color.gold())
         embed.set_thumbnail(url=target_user.display_avatar.url)
+        
+        if fecha:
+            # --- Consulta histórica (ledger + snapshots) ---
+            try:
+                dia = datetime.date.fromisoformat(fecha)
+            except ValueError:
+                await interaction.response.send_message("Formato de fecha inválido. Usa AAAA-MM-DD (ej: 2025-01-31).", ephemeral=True)
+                return
+            await interaction.response.defer()
+            momento = datetime.datetime.combine(dia, datetime.time.max).isoformat()
+            saldo = await self.db.run(saldo_en, target_user.id, interaction.guild.id, momento)
+            embed.add_field(name=f"Saldo el {dia.isoformat()}:", value=f"**{saldo}** Nocoins 🪙")
+            await interaction.followup.send(embed=embed)
+            return
+        
+        data = await self.get_balance(target_user.id, interaction.guild.id)
         embed.add_field(name="Saldo:", value=f"**{data['balance']}** Nocoins 🪙")
         await interaction.response.send_message(embed=embed)
 
@@ -97,24 +417,22 @@ class Economy(commands.Cog):
         # ... (código igual)
         user_id = interaction.user.id
         guild_id = interaction.guild.id
-        data = await self.get_or_create_balance(user_id, guild_id)
-        last_daily_str = data['last_daily']
         current_time = datetime.datetime.now()
-        if last_daily_str:
-            last_daily_time = datetime.datetime.fromisoformat(last_daily_str)
-            cooldown_delta = datetime.timedelta(hours=DAILY_COOLDOWN)
-            if (current_time - last_daily_time) < cooldown_delta:
-                tiempo_restante = (last_daily_time + cooldown_delta) - current_time
-                horas, rem = divmod(tiempo_restante.seconds, 3600)
-                minutos, _ = divmod(rem, 60)
-                await interaction.response.send_message(f"¡Calma, vaquero! 🤠 Aún debes esperar **{horas}h {minutos}m**.", ephemeral=True)
-                return
-        new_balance = data['balance'] + DAILY_AMOUNT
-        db = sqlite3.connect('data/economy.db')
-        cursor = db.cursor()
-        cursor.execute("UPDATE balances SET balance = ?, last_daily = ? WHERE user_id = ? AND guild_id = ?", (new_balance, current_time.isoformat(), user_id, guild_id))
-        db.commit()
-        db.close()
+        cooldown_delta = datetime.timedelta(hours=DAILY_COOLDOWN)
+        # Comprobar el cooldown y pagar en UNA sentencia
+        ok, resultado = await self.mover(
+            cobrar_diario, user_id, guild_id, DAILY_AMOUNT,
+            current_time.isoformat(), (current_time - cooldown_delta).isoformat(),
+            movimientos=[(guild_id, user_id, DAILY_AMOUNT, 'daily')]
+        )
+        if not ok:
+            last_daily_time = datetime.datetime.fromisoformat(resultado)
+            tiempo_restante = (last_daily_time + cooldown_delta) - current_time
+            horas, rem = divmod(tiempo_restante.seconds, 3600)
+            minutos, _ = divmod(rem, 60)
+            await interaction.response.send_message(f"¡Calma, vaquero! 🤠 Aún debes esperar **{horas}h {minutos}m**.", ephemeral=True)
+            return
+        new_balance = resultado
         embed = discord.Embed(title="¡Día de Paga! 💸", description=f"¡Has recibido **{DAILY_AMOUNT}** Nocoins 🪙!", color=discord.Color.green())
         embed.add_field(name="Nuevo Saldo:", value=f"**{new_balance}** Nocoins 🪙")
         embed.set_footer(text=f"¡Vuelve en {DAILY_COOLDOWN} horas!")
@@ -130,49 +448,67 @@ class Economy(commands.Cog):
         if emisor_id == receptor_id or receptor.bot:
             await interaction.response.send_message("No puedes pagarte a ti mismo o a un bot.", ephemeral=True)
             return
-        emisor_data = await self.get_or_create_balance(emisor_id, guild_id)
-        if emisor_data['balance'] < cantidad:
-            await interaction.response.send_message(f"No tienes fondos. Tu saldo es de **{emisor_data['balance']}** 🪙.", ephemeral=True)
+        # Débito condicional + crédito en UNA transacción
+        ok, saldo_emisor = await self.mover(
+            transferir, emisor_id, receptor_id, guild_id, cantidad,
+            movimientos=[(guild_id, emisor_id, -cantidad, 'pago'), (guild_id, receptor_id, cantidad, 'pago')]
+        )
+        if not ok:
+            await interaction.response.send_message(f"No tienes fondos. Tu saldo es de **{saldo_emisor}** 🪙.", ephemeral=True)
             return
-        receptor_data = await self.get_or_create_balance(receptor_id, guild_id)
-        nuevo_saldo_emisor = emisor_data['balance'] - cantidad
-        nuevo_saldo_receptor = receptor_data['balance'] + cantidad
-        db = sqlite3.connect('data/economy.db')
-        cursor = db.cursor()
-        cursor.execute("UPDATE balances SET balance = ? WHERE user_id = ? AND guild_id = ?", (nuevo_saldo_emisor, emisor_id, guild_id))
-        cursor.execute("UPDATE balances SET balance = ? WHERE user_id = ? AND guild_id = ?", (nuevo_saldo_receptor, receptor_id, guild_id))
-        db.commit()
-        db.close()
         await interaction.response.send_message(f"✅ ¡Transferencia completada! Has enviado **{cantidad}** Nocoins 🪙 a {receptor.mention}.", ephemeral=True)
 
-    @app_commands.command(name="leaderboard", description="Muestra el top 10 de usuarios más ricos del servidor.")
-    async def leaderboard(self, interaction: discord.Interaction):
-        # ... (código igual)
-        await interaction.response.defer()
-        db = sqlite3.connect('data/economy.db')
-        db.row_factory = sqlite3.Row
-        cursor = db.cursor()
-        cursor.execute("SELECT user_id, balance FROM balances WHERE guild_id = ? AND balance > 0 ORDER BY balance DESC LIMIT 10", (interaction.guild.id,))
-        results = cursor.fetchall()
-        db.close()
-        embed = discord.Embed(title="🏆 Top 10 Ricos del Servidor 🏆", color=discord.Color.gold(), timestamp=datetime.datetime.now())
-        embed.set_footer(text="¿Podrás entrar en el top?")
+    # --- Función Helper: Nombre de un usuario (sin REST en el caso normal) ---
+    async def resolve_name(self, guild: discord.Guild, user_id: int) -> str:
+        """Caché de miembros -> caché de nombres (TTL) -> caché de usuarios -> REST."""
+        member = guild.get_member(user_id)
+        if member:
+            return member.display_name
+        if user_id in self.name_cache:
+            return self.name_cache[user_id]
+        user = self.bot.get_user(user_id)
+        if user is None:
+            try:
+                user = await self.bot.fetch_user(user_id)
+            except discord.NotFound:
+                user = None
+        name = user.name if user else "Usuario Desconocido"
+        self.name_cache[user_id] = name
+        return name
+
+    async def build_leaderboard(self, guild: discord.Guild, author: discord.abc.User, pagina: int):
+        """Construye el embed de una página del ranking. Devuelve (embed, total)."""
+        results, total = await self.db.run(pagina_ranking, guild.id, pagina)
+        embed = discord.Embed(title="🏆 Ranking de Ricos del Servidor 🏆", color=discord.Color.gold(), timestamp=datetime.datetime.now())
+        paginas = max(1, -(-total // LEADERBOARD_PAGE_SIZE))
+        embed.set_footer(text=f"Página {pagina + 1}/{paginas} · ¿Podrás entrar en el top?")
         if not results:
             embed.description = "Nadie tiene Nocoins todavía... ¡Usa `/daily` para empezar!"
-            await interaction.followup.send(embed=embed)
-            return
+            return embed, total
         description_list = ""
         medallas = ["🥇", "🥈", "🥉"]
-        for i, row in enumerate(results):
-            try:
-                user = await self.bot.fetch_user(row['user_id'])
-                user_name = user.name
-            except discord.NotFound:
-                user_name = "Usuario Desconocido"
+        for i, row in enumerate(results, start=pagina * LEADERBOARD_PAGE_SIZE):
+            user_name = await self.resolve_name(guild, row['user_id'])
             rank_str = medallas[i] if i < len(medallas) else f"**#{i+1}**"
             description_list += f"{rank_str} {user_name} - **{row['balance']}** 🪙\n"
         embed.description = description_list
-        await interaction.followup.send(embed=embed)
+        # "Tu posición"
+        mi_posicion = await self.db.run(posicion_ranking, author.id, guild.id)
+        if mi_posicion:
+            embed.add_field(name="Tu posición:", value=f"**#{mi_posicion[0]}** de {total} con **{mi_posicion[1]}** 🪙", inline=False)
+        else:
+            embed.add_field(name="Tu posición:", value="Aún no tienes Nocoins. ¡Usa `/daily`!", inline=False)
+        return embed, total
+
+    @app_commands.command(name="leaderboard", description="Muestra el ranking de usuarios más ricos del servidor.")
+    async def leaderboard(self, interaction: discord.Interaction):
+        await interaction.response.defer()
+        embed, total = await self.build_leaderboard(interaction.guild, interaction.user, 0)
+        if total <= LEADERBOARD_PAGE_SIZE:
+            await interaction.followup.send(embed=embed)
+            return
+        view = LeaderboardView(self, interaction.guild, interaction.user, total)
+        await interaction.followup.send(embed=embed, view=view)
 
     @app_commands.command(name="apostar", description="Apuesta Nocoins a un cara o cruz. ¡Doble o nada!")
     @app_commands.describe(cantidad="La cantidad de Nocoins que quieres apostar.", eleccion="Tu elección: ¿cara o cruz?")
@@ -182,22 +518,20 @@ class Economy(commands.Cog):
         await interaction.response.defer()
         user_id = interaction.user.id
         guild_id = interaction.guild.id
-        data = await self.get_or_create_balance(user_id, guild_id)
-        if data['balance'] < cantidad:
-            await interaction.followup.send(f"¡No puedes apostar tanto! Solo tienes **{data['balance']}** 🪙.", ephemeral=True)
-            return
         resultado = random.choice(["cara", "cruz"])
-        if eleccion.value == resultado:
-            nuevo_saldo = data['balance'] + cantidad
+        gana = eleccion.value == resultado
+        # Comprobar fondos y aplicar el resultado en UNA sentencia
+        ok, nuevo_saldo = await self.mover(
+            resolver_apuesta, user_id, guild_id, cantidad, gana,
+            movimientos=[(guild_id, user_id, cantidad if gana else -cantidad, 'apuesta')]
+        )
+        if not ok:
+            await interaction.followup.send(f"¡No puedes apostar tanto! Solo tienes **{nuevo_saldo}** 🪙.", ephemeral=True)
+            return
+        if gana:
             titulo, descripcion, color = "¡Has Ganado! 💸", f"¡Salió **{resultado.upper()}**! Has ganado **{cantidad}** 🪙.", discord.Color.green()
         else:
-            nuevo_saldo = data['balance'] - cantidad
             titulo, descripcion, color = "¡Has Perdido! 😢", f"¡Salió **{resultado.upper()}**! Has perdido **{cantidad}** 🪙.", discord.Color.red()
-        db = sqlite3.connect('data/economy.db')
-        cursor = db.cursor()
-        cursor.execute("UPDATE balances SET balance = ? WHERE user_id = ? AND guild_id = ?", (nuevo_saldo, user_id, guild_id))
-        db.commit()
-        db.close()
         embed = discord.Embed(title=titulo, description=descripcion, color=color)
         embed.set_footer(text=f"Tu nuevo saldo: {nuevo_saldo} 🪙")
         await interaction.followup.send(embed=embed)
@@ -220,14 +554,11 @@ class Economy(commands.Cog):
             return
             
         try:
-            db = sqlite3.connect('data/economy.db')
-            cursor = db.cursor()
-            cursor.execute(
+            await self.db.execute(
                 "INSERT INTO shop_items (guild_id, name, description, price, role_id) VALUES (?, ?, ?, ?, ?)",
                 (interaction.guild.id, nombre, f"Compra el rol {rol.name}", precio, rol.id)
             )
-            db.commit()
-            db.close()
+            self.invalidate_catalog(interaction.guild.id)
         except sqlite3.IntegrityError:
             await interaction.response.send_message("Error: Ese rol ya está en la tienda.", ephemeral=True)
             return
@@ -245,16 +576,13 @@ class Economy(commands.Cog):
     @is_moderator()
     async def delitem(self, interaction: discord.Interaction, rol: discord.Role):
         try:
-            db = sqlite3.connect('data/economy.db')
-            cursor = db.cursor()
-            cursor.execute("DELETE FROM shop_items WHERE role_id = ? AND guild_id = ?", (rol.id, interaction.guild.id))
-            db.commit()
+            result = await self.db.execute("DELETE FROM shop_items WHERE role_id = ? AND guild_id = ?", (rol.id, interaction.guild.id))
+            self.invalidate_catalog(interaction.guild.id)
             
-            if cursor.rowcount == 0:
+            if result.rowcount == 0:
                 await interaction.response.send_message("Error: Ese rol no se encontraba en la tienda.", ephemeral=True)
             else:
                 await interaction.response.send_message(f"✅ ¡Item eliminado! El rol {rol.name} ya no está en la tienda.", ephemeral=True)
-            db.close()
         except Exception as e:
             await interaction.response.send_message(f"Error de base de datos: {e}", ephemeral=True)
             return
@@ -265,48 +593,21 @@ class Economy(commands.Cog):
     
     @app_commands.command(name="tienda", description="Muestra los roles que puedes comprar con Nocoins 🪙.")
     async def tienda(self, interaction: discord.Interaction):
-        await interaction.response.defer()
-        
-        db = sqlite3.connect('data/economy.db')
-        db.row_factory = sqlite3.Row
-        cursor = db.cursor()
-        cursor.execute("SELECT id, name, price, role_id FROM shop_items WHERE guild_id = ? ORDER BY price ASC", (interaction.guild.id,))
-        items = cursor.fetchall()
-        db.close()
-        
-        embed = discord.Embed(title="🛒 Tienda de Roles Cosméticos 🛒", color=discord.Color.blue())
-        
-        if not items:
-            embed.description = "La tienda está vacía. ¡Avisa a un admin para que añada roles!"
-        else:
-            embed.description = "Usa `/comprar [ID]` para obtener un rol.\n\n"
-            for item in items:
-                # Buscamos el rol para mostrarlo
-                role = interaction.guild.get_role(item['role_id'])
-                if role:
-                    embed.add_field(
-                        name=f"{item['name']} - {role.mention}",
-                        value=f"**Precio:** {item['price']} 🪙\n**ID:** `{item['id']}`",
-                        inline=False
-                    )
-        
-        await interaction.followup.send(embed=embed)
+        # El embed sale de la caché: sin consultas a la BBDD (salvo la primera vez)
+        embed = await self.get_shop_embed(interaction.guild)
+        await interaction.response.send_message(embed=embed)
 
     @app_commands.command(name="comprar", description="Compra un rol de la tienda.")
     @app_commands.describe(id_item="El ID del item que quieres comprar (lo ves en /tienda).")
     async def comprar(self, interaction: discord.Interaction, id_item: int):
         await interaction.response.defer(ephemeral=True)
         
-        # 1. Buscar el item en la tienda
-        db = sqlite3.connect('data/economy.db')
-        db.row_factory = sqlite3.Row
-        cursor = db.cursor()
-        cursor.execute("SELECT * FROM shop_items WHERE id = ? AND guild_id = ?", (id_item, interaction.guild.id))
-        item = cursor.fetchone()
+        # 1. Buscar el item en el catálogo (en memoria)
+        catalog = await self.get_catalog(interaction.guild.id)
+        item = catalog.get(id_item)
         
         if not item:
             await interaction.followup.send("Error: No se encontró ningún item con ese ID.", ephemeral=True)
-            db.close()
             return
             
         item_price = item['price']
@@ -316,50 +617,57 @@ class Economy(commands.Cog):
         role = interaction.guild.get_role(item_role_id)
         if not role:
             await interaction.followup.send("Error: El rol asociado a este item ya no existe. Avisa a un admin.", ephemeral=True)
-            db.close()
             return
             
         # 3. Comprobar si el usuario ya lo tiene
         if role in interaction.user.roles:
             await interaction.followup.send("¡Ya tienes este rol!", ephemeral=True)
-            db.close()
             return
 
-        # 4. Comprobar fondos
-        user_data = await self.get_or_create_balance(interaction.user.id, interaction.guild.id)
-        if user_data['balance'] < item_price:
-            await interaction.followup.send(f"¡No tienes fondos! Necesitas **{item_price}** 🪙 pero solo tienes **{user_data['balance']}** 🪙.", ephemeral=True)
-            db.close()
+        # 4 + 5a. Comprobar fondos y quitar el dinero en UNA sentencia condicional
+        def job(conn):
+            nuevo_saldo = debitar(conn, interaction.user.id, interaction.guild.id, item_price)
+            if nuevo_saldo is None:
+                return False, saldo_actual(conn, interaction.user.id, interaction.guild.id)
+            return True, nuevo_saldo
+        
+        ok, saldo = await self.mover(job, movimientos=[(interaction.guild.id, interaction.user.id, -item_price, 'compra')])
+        if not ok:
+            await interaction.followup.send(f"¡No tienes fondos! Necesitas **{item_price}** 🪙 pero solo tienes **{saldo}** 🪙.", ephemeral=True)
             return
             
         # 5. ¡¡PROCEDER CON LA COMPRA!!
         try:
-            # 5a. Quitar dinero
-            nuevo_saldo = user_data['balance'] - item_price
-            cursor.execute("UPDATE balances SET balance = ? WHERE user_id = ? AND guild_id = ?",
-                           (nuevo_saldo, interaction.user.id, interaction.guild.id))
-            db.commit()
-            
             # 5b. Dar el rol
             await interaction.user.add_roles(role, reason=f"Comprado en la tienda por {item_price} Nocoins")
             
         except discord.Forbidden:
             # ¡Error de jerarquía!
             await interaction.followup.send("Error: No puedo asignar este rol. Asegúrate de que mi rol esté por encima del rol de la tienda.", ephemeral=True)
-            db.rollback() # DESHACER la compra si no se pudo dar el rol
-            db.close()
+            await self.refund(interaction.user.id, interaction.guild.id, item_price) # DESHACER la compra si no se pudo dar el rol
             return
         except Exception as e:
             await interaction.followup.send(f"Error de transacción: {e}", ephemeral=True)
-            db.rollback()
-            db.close()
+            await self.refund(interaction.user.id, interaction.guild.id, item_price)
             return
-            
-        db.close()
         
         # 6. Confirmación
         await interaction.followup.send(f"¡Felicidades! Has comprado el rol {role.mention} por **{item_price}** 🪙.", ephemeral=True)
 
+    @comprar.autocomplete('id_item')
+    async def comprar_autocomplete(self, interaction: discord.Interaction, current: str):
+        """Sugiere items de la tienda (servido desde la caché del catálogo)."""
+        catalog = await self.get_catalog(interaction.guild.id)
+        current = current.lower()
+        choices = []
+        for item in catalog.values():
+            label = f"{item['name']} - {item['price']} 🪙 (ID {item['id']})"
+            if current in label.lower():
+                choices.append(app_commands.Choice(name=label[:100], value=item['id']))
+            if len(choices) >= 25:
+                break
+        return choices
+
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(Economy(bot))
\ No newline at end of file
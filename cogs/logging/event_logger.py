@@ -3,7 +3,9 @@ import os
 import discord
 from discord.ext import commands
 import datetime
-import asyncio # ¡NUEVO! Necesario para el retardo
+import asyncio
+import time
+from collections import OrderedDict
 
 # --- Cargar el ID del canal de Logs ---
 try:
@@ -11,19 +13,71 @@ try:
 except (TypeError, ValueError):
     LOG_CHANNEL_ID = None
 
+# --- Correlación con el Registro de Auditoría ---
+AUDIT_MATCH_WINDOW = 10  # Segundos que una entrada de ban/kick sirve para clasificar una salida
+AUDIT_WAIT = 2.0         # Espera máxima a la entrada si la salida llega ANTES que ella
+
 # --- Clase del Cog ---
 class EventLogger(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        # Entradas de ban/kick recientes que aún no se han emparejado con una salida
+        self.recent_actions = OrderedDict() # {(guild_id, user_id): (entry, hora_monotónica)}
+        # Salidas esperando su entrada de auditoría
+        self.pending_removals = {}          # {(guild_id, user_id): Future}
+
+    def _prune_actions(self):
+        """Olvida las entradas más viejas que la ventana (están ordenadas por llegada)."""
+        limite = time.monotonic() - AUDIT_MATCH_WINDOW
+        while self.recent_actions:
+            key, (_, llegada) = next(iter(self.recent_actions.items()))
+            if llegada >= limite:
+                break
+            self.recent_actions.popitem(last=False)
+
+    # --- Evento 0: Entrada nueva en el Registro de Auditoría (push, sin sondeo) ---
+    @commands.Cog.listener()
+    async def on_audit_log_entry_create(self, entry: discord.AuditLogEntry):
+        if entry.action not in (discord.AuditLogAction.ban, discord.AuditLogAction.kick) or entry.target is None:
+            return
+        key = (entry.guild.id, entry.target.id)
+        
+        # ¿Hay una salida esperando esta entrada? Se la entregamos directamente
+        future = self.pending_removals.get(key)
+        if future and not future.done():
+            future.set_result(entry)
+            return
+        
+        self._prune_actions()
+        self.recent_actions[key] = (entry, time.monotonic())
+        self.recent_actions.move_to_end(key)
+
+    async def match_audit_entry(self, member: discord.Member):
+        """Devuelve la entrada de ban/kick de este miembro, o None si simplemente se fue."""
+        key = (member.guild.id, member.id)
+        self._prune_actions()
+        
+        # 1. La entrada llegó antes que la salida: clasificación inmediata
+        cached = self.recent_actions.pop(key, None)
+        if cached:
+            return cached[0]
+        
+        # 2. Si no, esperamos un poco a que llegue (sin consultar la API)
+        future = asyncio.get_running_loop().create_future()
+        self.pending_removals[key] = future
+        try:
+            return await asyncio.wait_for(future, timeout=AUDIT_WAIT)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            if self.pending_removals.get(key) is future:
+                del self.pending_removals[key]
 
     # --- Evento 1: Mensaje Borrado (Sin cambios) ---
     @commands.Cog.listener()
     async def on_message_delete(self, message: discord.Message):
         if not LOG_CHANNEL_ID or message.author.bot:
             return
-        log_channel = self.bot.get_channel(LOG_CHANNEL_ID)
-        if not log_channel:
-            return
         
         content = message.content or "No se pudo recuperar el contenido (probablemente una imagen)."
         if len(content) > 1020:
@@ -35,10 +89,7 @@ class EventLogger(commands.Cog):
         embed.add_field(name="Contenido:", value=f"```{content}```", inline=False)
         embed.set_footer(text=f"ID de Usuario: {message.author.id}")
         
-        try:
-            await log_channel.send(embed=embed)
-        except Exception as e:
-            print(f"Error inesperado en on_message_delete: {e}")
+        self.bot.log_dispatcher.send(LOG_CHANNEL_ID, embed)
 
     # --- Evento 2: Mensaje Editado (Sin cambios) ---
     @commands.Cog.listener()
@@ -46,10 +97,6 @@ class EventLogger(commands.Cog):
         if not LOG_CHANNEL_ID or before.author.bot or before.content == after.content:
             return
             
-        log_channel = self.bot.get_channel(LOG_CHANNEL_ID)
-        if not log_channel:
-            return
-            
         content_before = before.content or "Vacío"
         content_after = after.content or "Vacío"
 
@@ -63,10 +110,7 @@ class EventLogger(commands.Cog):
         embed.add_field(name="Después:", value=f"```{content_after}```", inline=False)
         embed.set_footer(text=f"ID de Usuario: {after.author.id}")
         
-        try:
-            await log_channel.send(embed=embed)
-        except Exception as e:
-            print(f"Error inesperado en on_message_edit: {e}")
+        self.bot.log_dispatcher.send(LOG_CHANNEL_ID, embed)
 
     # -----------------------------------------------------------------
     # --- ¡NUEVO! Evento 3: Miembro se va/es expulsado/baneado ---
@@ -79,16 +123,7 @@ class EventLogger(commands.Cog):
         if not LOG_CHANNEL_ID or member.bot:
             return
             
-        log_channel = self.bot.get_channel(LOG_CHANNEL_ID)
-        if not log_channel:
-            return
-            
-        # 2. Esperar 3 segundos.
-        #    Esto es CRUCIAL. El Log de Auditoría puede tardar en actualizarse.
-        #    Si preguntamos demasiado rápido, no veremos el 'ban' o 'kick'.
-        await asyncio.sleep(3) 
-
-        # 3. Preparar el Embed (por defecto, asumimos que "salió")
+        # 2. Preparar el Embed (por defecto, asumimos que "salió")
         embed = discord.Embed(
             title="⬅️ Miembro Salió",
             description=f"{member.mention} (`{member.name}`) ha abandonado el servidor.",
@@ -98,44 +133,34 @@ class EventLogger(commands.Cog):
         embed.set_thumbnail(url=member.display_avatar.url)
         embed.set_footer(text=f"ID de Usuario: {member.id}")
         
-        # 4. Comprobar el Log de Auditoría por un BAN
-        try:
-            # Buscamos la última entrada de BAN en el log
-            async for entry in member.guild.audit_logs(limit=1, action=discord.AuditLogAction.ban):
-                # Si el baneo es de HACE MENOS de 10 segundos Y es para ESTE usuario
-                if entry.target == member and (discord.utils.utcnow() - entry.created_at).total_seconds() < 10:
-                    embed.title = "🔨 Miembro Baneado"
-                    embed.color = discord.Color.brand_red()
-                    embed.description = f"{member.mention} (`{member.name}`) fue **baneado**."
-                    embed.add_field(name="Baneado por:", value=entry.user.mention)
-                    if entry.reason:
-                        embed.add_field(name="Razón:", value=entry.reason, inline=False)
-                    break # Encontramos el log, paramos de buscar
-
-            # 5. Si no fue un ban, comprobar por un KICK
-            #    (Us 'else' en el 'for' significa "si el bucle NO se rompió con break")
-            else: 
-                async for entry in member.guild.audit_logs(limit=1, action=discord.AuditLogAction.kick):
-                    if entry.target == member and (discord.utils.utcnow() - entry.created_at).total_seconds() < 10:
-                        embed.title = "👢 Miembro Expulsado"
-                        embed.color = discord.Color.orange()
-                        embed.description = f"{member.mention} (`{member.name}`) fue **expulsado**."
-                        embed.add_field(name="Expulsado por:", value=entry.user.mention)
-                        if entry.reason:
-                            embed.add_field(name="Razón:", value=entry.reason, inline=False)
-                        break
-                        
-        except discord.Forbidden:
-            # ¡El bot no tiene el permiso "Ver el Registro de Auditoría"!
+        # 3. Sin permiso de auditoría no llegan entradas: lo indicamos
+        if not member.guild.me.guild_permissions.view_audit_log:
             embed.add_field(name="Error de Log", value="No tengo permisos para ver el Registro de Auditoría.")
-        except Exception as e:
-            print(f"Error inesperado en on_member_remove: {e}")
+        else:
+            # 4. Emparejar con la entrada de BAN o KICK (recibida por evento, no por sondeo)
+            try:
+                entry = await self.match_audit_entry(member)
+            except Exception as e:
+                entry = None
+                print(f"Error inesperado en on_member_remove: {e}")
+            
+            if entry and entry.action == discord.AuditLogAction.ban:
+                embed.title = "🔨 Miembro Baneado"
+                embed.color = discord.Color.brand_red()
+                embed.description = f"{member.mention} (`{member.name}`) fue **baneado**."
+                embed.add_field(name="Baneado por:", value=f"<@{entry.user_id}>")
+                if entry.reason:
+                    embed.add_field(name="Razón:", value=entry.reason, inline=False)
+            elif entry and entry.action == discord.AuditLogAction.kick:
+                embed.title = "👢 Miembro Expulsado"
+                embed.color = discord.Color.orange()
+                embed.description = f"{member.mention} (`{member.name}`) fue **expulsado**."
+                embed.add_field(name="Expulsado por:", value=f"<@{entry.user_id}>")
+                if entry.reason:
+                    embed.add_field(name="Razón:", value=entry.reason, inline=False)
 
-        # 6. Enviar el Embed (sea cual sea el resultado)
-        try:
-            await log_channel.send(embed=embed)
-        except Exception as e:
-            print(f"Error final al enviar log de on_member_remove: {e}")
+        # 5. Encolar el Embed (sea cual sea el resultado); el despachador lo envía
+        self.bot.log_dispatcher.send(LOG_CHANNEL_ID, embed)
 
 # --- Función Setup ---
 async def setup(bot: commands.Bot):
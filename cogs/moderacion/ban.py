@@ -87,15 +87,9 @@ class Ban(commands.Cog):
         await interaction.response.send_message(embed=embed_confirm, ephemeral=True)
 
         # --- ¡NUEVO! 5. Enviar Log al Canal de Moderación ---
+        #     (el despachador lo agrupa y envía; los errores de canal/permisos los reporta él)
         if LOG_CHANNEL_ID:
-            log_channel = self.bot.get_channel(LOG_CHANNEL_ID)
-            if log_channel:
-                try:
-                    await log_channel.send(embed=embed_confirm)
-                except discord.Forbidden:
-                    print(f"Error: El bot no tiene permisos para hablar en el canal de logs (ID: {LOG_CHANNEL_ID})")
-            else:
-                print(f"Error: No se encontró el canal de logs (ID: {LOG_CHANNEL_ID})")
+            self.bot.log_dispatcher.send(LOG_CHANNEL_ID, embed_confirm)
         else:
             print("Info: No se ha configurado MOD_LOG_CHANNEL_ID. Saltando envío de log.")
 
@@ -77,15 +77,9 @@ class Kick(commands.Cog):
 
         # --- ¡NUEVO! 5. Enviar Log al Canal de Moderación ---
         if LOG_CHANNEL_ID:
-            log_channel = self.bot.get_channel(LOG_CHANNEL_ID)
-            if log_channel:
-                # Re-usamos el Embed de confirmación, pero esta vez lo enviamos al canal
-                try:
-                    await log_channel.send(embed=embed_confirm)
-                except discord.Forbidden:
-                    print(f"Error: El bot no tiene permisos para hablar en el canal de logs (ID: {LOG_CHANNEL_ID})")
-            else:
-                print(f"Error: No se encontró el canal de logs (ID: {LOG_CHANNEL_ID})")
+            # Re-usamos el Embed de confirmación, pero esta vez lo encolamos para el canal
+            # (el despachador lo agrupa y envía; los errores de canal/permisos los reporta él)
+            self.bot.log_dispatcher.send(LOG_CHANNEL_ID, embed_confirm)
         else:
             print("Info: No se ha configurado MOD_LOG_CHANNEL_ID. Saltando envío de log.")
 
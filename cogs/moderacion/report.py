@@ -74,11 +74,8 @@ class ReportModal(ui.Modal):
         embed.add_field(name="Motivo:", value=razon, inline=False)
         embed.add_field(name="Detalles:", value=detalles, inline=False)
         
-        # 4. Enviamos el Embed al canal de logs
-        try:
-            await log_channel.send(embed=embed)
-        except discord.Forbidden:
-            print("Error: El bot no puede enviar el reporte al canal de logs.")
+        # 4. Encolamos el Embed para el canal de logs (el despachador lo envía)
+        interaction.client.log_dispatcher.send(LOG_CHANNEL_ID, embed)
             
         # 5. Damos confirmación al usuario que reportó
         await interaction.response.send_message(
@@ -115,9 +115,7 @@ class Timeout(commands.Cog):
 
         # --- 5. Enviar Log al Canal ---
         if LOG_CHANNEL_ID:
-            log_channel = self.bot.get_channel(LOG_CHANNEL_ID)
-            if log_channel:
-                await log_channel.send(embed=embed_confirm) # Enviamos el mismo embed al log
+            self.bot.log_dispatcher.send(LOG_CHANNEL_ID, embed_confirm) # Enviamos el mismo embed al log
 
     # --- Manejador de Errores ---
     @timeout.error
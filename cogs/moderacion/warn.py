@@ -4,7 +4,6 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 import datetime
-import sqlite3
 
 # --- LÓGICA DE CONFIGURACIÓN Y CHECKS (Sin cambios) ---
 try:
@@ -28,13 +27,13 @@ def is_moderator():
 class Warn(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.init_database()
+        self.db = bot.storage.get('moderation')
 
-    def init_database(self):
-        os.makedirs('data', exist_ok=True)
-        db = sqlite3.connect('data/moderation.db')
-        cursor = db.cursor()
-        cursor.execute("""
+    async def cog_load(self):
+        await self.init_database()
+
+    async def init_database(self):
+        await self.db.execute("""
         CREATE TABLE IF NOT EXISTS warnings (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             guild_id INTEGER NOT NULL,
@@ -44,8 +43,6 @@ class Warn(commands.Cog):
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
         )
         """)
-        db.commit()
-        db.close()
 
     # --- Comando /warn (Sin cambios) ---
     @app_commands.command(name="warn", description="Añade una advertencia a un miembro.")
@@ -57,13 +54,9 @@ class Warn(commands.Cog):
             await interaction.response.send_message("No puedes advertirte a ti mismo ni a un bot.", ephemeral=True)
             return
         try:
-            db = sqlite3.connect('data/moderation.db')
-            cursor = db.cursor()
-            cursor.execute("INSERT INTO warnings (guild_id, user_id, moderator_id, reason) VALUES (?, ?, ?, ?)",
-                           (interaction.guild.id, miembro.id, interaction.user.id, razon))
-            db.commit()
-            warn_id = cursor.lastrowid
-            db.close()
+            result = await self.db.execute("INSERT INTO warnings (guild_id, user_id, moderator_id, reason) VALUES (?, ?, ?, ?)",
+                                           (interaction.guild.id, miembro.id, interaction.user.id, razon))
+            warn_id = result.lastrowid
         except Exception as e:
             await interaction.response.send_message(f"Error de DB: {e}", ephemeral=True)
             return
@@ -77,9 +70,7 @@ class Warn(commands.Cog):
         embed_confirm.set_footer(text=f"Advertido por {interaction.user.name}")
         await interaction.response.send_message(embed=embed_confirm, ephemeral=True)
         if LOG_CHANNEL_ID:
-            log_channel = self.bot.get_channel(LOG_CHANNEL_ID)
-            if log_channel:
-                await log_channel.send(embed=embed_confirm)
+            self.bot.log_dispatcher.send(LOG_CHANNEL_ID, embed_confirm)
 
     @warn.error
     async def on_warn_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
@@ -97,13 +88,8 @@ class Warn(commands.Cog):
         # (El código de /warnings se mantiene igual)
         await interaction.response.defer(ephemeral=True)
         try:
-            db = sqlite3.connect('data/moderation.db')
-            db.row_factory = sqlite3.Row
-            cursor = db.cursor()
-            cursor.execute("SELECT id, moderator_id, reason, timestamp FROM warnings WHERE user_id = ? AND guild_id = ? ORDER BY timestamp DESC",
-                           (miembro.id, interaction.guild.id))
-            results = cursor.fetchall()
-            db.close()
+            results = await self.db.fetchall("SELECT id, moderator_id, reason, timestamp FROM warnings WHERE user_id = ? AND guild_id = ? ORDER BY timestamp DESC",
+                                             (miembro.id, interaction.guild.id))
         except Exception as e:
             await interaction.followup.send(f"Error de DB: {e}", ephemeral=True)
             return
@@ -151,26 +137,21 @@ class Warn(commands.Cog):
         await interaction.response.defer(ephemeral=True)
 
         try:
-            db = sqlite3.connect('data/moderation.db')
-            db.row_factory = sqlite3.Row # Para poder leer los datos que borramos
-            cursor = db.cursor()
+            # 1. Buscamos el warning (para informar qué borramos) y 2. lo borramos, en UNA transacción
+            def job(conn):
+                row = conn.execute(
+                    "SELECT * FROM warnings WHERE id = ? AND guild_id = ?",
+                    (id_advertencia, interaction.guild.id)
+                ).fetchone()
+                if row:
+                    conn.execute("DELETE FROM warnings WHERE id = ?", (id_advertencia,))
+                return row
             
-            # 1. Primero, buscamos el warning para poder informar qué borramos
-            cursor.execute(
-                "SELECT * FROM warnings WHERE id = ? AND guild_id = ?",
-                (id_advertencia, interaction.guild.id)
-            )
-            warning_data = cursor.fetchone()
+            warning_data = await self.db.transaction(job)
             
             if not warning_data:
                 await interaction.followup.send(f"No se encontró ninguna advertencia con el ID #{id_advertencia} en este servidor.", ephemeral=True)
-                db.close()
                 return
-
-            # 2. Si lo encontramos, lo borramos
-            cursor.execute("DELETE FROM warnings WHERE id = ?", (id_advertencia,))
-            db.commit()
-            db.close()
             
         except Exception as e:
             print(f"Error de Base de Datos en /delwarn: {e}")
@@ -195,9 +176,7 @@ class Warn(commands.Cog):
 
         # --- 4. Enviar Log al Canal ---
         if LOG_CHANNEL_ID:
-            log_channel = self.bot.get_channel(LOG_CHANNEL_ID)
-            if log_channel:
-                await log_channel.send(embed=embed_confirm) # Enviamos el mismo embed al log
+            self.bot.log_dispatcher.send(LOG_CHANNEL_ID, embed_confirm) # Enviamos el mismo embed al log
 
     @delwarn.error
     async def on_delwarn_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
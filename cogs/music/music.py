@@ -1,14 +1,38 @@
 # cogs/music/music.py
 import os
+import re
+import time
+import threading
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 from discord import ui
 import asyncio
-import yt_dlp
-import functools
+from dataclasses import dataclass
 from pathlib import Path 
 
+from utils.metrics import metrics
+from utils.ytdl_cache import YTDLCache, stream_expires_at
+from utils.extraction import ExtractionPool, extract_info, extract_playlist
+from utils.audio_cache import AudioCache
+from utils.track_queue import TrackQueue
+from utils.resources import process_stats, sum_stats
+from utils.admission import AdmissionController
+
+# --- CONFIGURACIÓN Y CHECKS ---
+try:
+    MOD_ROLE_ID = int(os.getenv("MODERATOR_ROLE_ID"))
+except (TypeError, ValueError):
+    MOD_ROLE_ID = None
+
+def is_moderator():
+    async def predicate(interaction: discord.Interaction) -> bool:
+        if not MOD_ROLE_ID:
+            return False
+        role = interaction.user.get_role(MOD_ROLE_ID)
+        return role is not None
+    return app_commands.check(predicate)
+
 # --- CONFIGURACIÓN DE RUTA ABSOLUTA ---
 RUTA_ACTUAL = Path(__file__).resolve()
 RUTA_PRINCIPAL = RUTA_ACTUAL.parent.parent.parent
@@ -34,38 +58,162 @@ FFMPEG_OPTIONS = {
     'options': '-vn',
 }
 
+# --- Modos de audio ---
+# 'pcm':  FFmpeg -> PCM -> volumen y codificación Opus en Python (clásico; una CPU por stream en el bot)
+# 'opus': FFmpeg aplica el volumen y codifica a Opus; el bot solo reenvía paquetes
+AUDIO_MODES = ("pcm", "opus")
+DEFAULT_AUDIO_MODE = os.getenv("MUSIC_AUDIO_MODE", "pcm")
+VOLUME = 0.5
+OPUS_BITRATE = 128 # kbps
+
+# --- Precarga de la siguiente canción ---
+PREFETCH_EXPIRY_MARGIN = 60  # Segundos de margen: la URL debe durar toda la canción + esto
+FFMPEG_WARMUP = os.getenv("MUSIC_FFMPEG_WARMUP", "0") == "1" # Arrancar FFmpeg de la siguiente por adelantado
+
+# --- Cola ---
+QUEUE_PAGE_SIZE = 10
+
+# --- Ciclo de vida de los reproductores ---
+PLAYER_IDLE_TIMEOUT = 300 # Segundos sin sonar nada antes de cerrar un reproductor
+PLAYER_REAP_GRACE = 60    # Margen para reproductores recién creados (un /play en curso)
+PLAYER_DISCONNECT_GRACE = 120 # Segundos desconectado (sin reconectar) antes de cerrarlo
+PLAYER_PAUSE_TIMEOUT = 1800   # Segundos en pausa antes de cerrarlo (y soltar su plaza de FFmpeg)
+REAP_INTERVAL = 60        # Cada cuánto pasa el 'reaper'
+
+# --- Playlists ---
+PLAYLIST_RE = re.compile(r"^https?://\S+[?&]list=[\w-]+") # URL con 'list=' (playlist o vídeo dentro de una)
+
+# --- Metadatos de una canción ---
+@dataclass(frozen=True, slots=True)
+class TrackInfo:
+    """
+    Metadatos inmutables de una canción (cola y panel).
+    Se crean UNA vez al buscarla; el panel se redibuja desde aquí sin red.
+    Las de playlists vienen de la extracción 'flat' (datos mínimos) y se
+    sustituyen por los completos justo al empezar a sonar.
+    """
+    title: str
+    url: str
+    thumbnail: str | None = None
+    duration: int | None = None
+    uploader: str | None = None
+    video_id: str | None = None
+
+    @classmethod
+    def from_data(cls, data: dict) -> "TrackInfo":
+        """Construye el registro a partir del dict que devuelve yt-dlp."""
+        return cls(
+            title=data.get('title') or "Desconocido",
+            url=data.get('webpage_url') or data.get('url'),
+            thumbnail=data.get('thumbnail') or (data.get('thumbnails') or [{}])[-1].get('url'),
+            duration=data.get('duration'),
+            uploader=data.get('uploader') or data.get('channel'),
+            video_id=data.get('id'),
+        )
+
+    def as_data(self) -> dict:
+        """El camino inverso: un dict con las claves de yt-dlp."""
+        return {
+            'id': self.video_id, 'title': self.title, 'webpage_url': self.url,
+            'thumbnail': self.thumbnail, 'duration': self.duration, 'uploader': self.uploader,
+        }
+
 # --- Clase 1: YTDLSource (El "Traductor") ---
-class YTDLSource(discord.PCMVolumeTransformer):
-    def __init__(self, source, *, data, volume=0.5):
-        super().__init__(source, volume)
+class TrackMetadata:
+    """Atributos comunes a las fuentes de audio de los dos modos."""
+    def _set_metadata(self, data: dict):
         self.data = data
         self.title = data.get('title')
         self.url = data.get('webpage_url')
         self.thumbnail = data.get('thumbnail')
         self.duration = data.get('duration')
         self.uploader = data.get('uploader')
+        self.track = TrackInfo.from_data(data)
+
+class YTDLSource(TrackMetadata, discord.PCMVolumeTransformer):
+    mode = "pcm"
+
+    def __init__(self, source, *, data, volume=VOLUME):
+        super().__init__(source, volume)
+        self._set_metadata(data)
 
     @classmethod
-    async def from_url(cls, url, *, loop=None, stream=True):
-        loop = loop or asyncio.get_event_loop()
-        with yt_dlp.YoutubeDL(YTDL_OPTIONS) as ydl:
-            partial_data = functools.partial(ydl.extract_info, url, download=not stream)
-            data = await loop.run_in_executor(None, partial_data)
+    async def extract(cls, url, *, pool: ExtractionPool, guild_id: int) -> dict:
+        """Resuelve la URL del stream (en el pool de extracción) SIN arrancar FFmpeg."""
+        data = await pool.run(guild_id, extract_info, url, YTDL_OPTIONS)
         if 'entries' in data:
             data = data['entries'][0]
-        filename = data['url'] if stream else ydl.prepare_filename(data)
-        return cls(discord.FFmpegPCMAudio(filename, **FFMPEG_OPTIONS), data=data)
+        return data
+
+    @classmethod
+    def from_data(cls, data: dict, *, mode: str = "pcm"):
+        """Arranca FFmpeg sobre un stream ya resuelto con extract()."""
+        return open_source(data['url'], data, mode=mode, remote=True)
+
+    @classmethod
+    def from_file(cls, path, data: dict, *, mode: str = "pcm"):
+        """Arranca FFmpeg sobre un audio de la caché local (sin red ni reconexiones)."""
+        return open_source(str(path), data, mode=mode, remote=False)
         
     @classmethod
-    async def search(cls, query: str, *, loop=None):
-        loop = loop or asyncio.get_event_loop()
-        with yt_dlp.YoutubeDL(YTDL_OPTIONS) as ydl:
-            partial_search = functools.partial(ydl.extract_info, f"ytsearch1:{query}", download=False)
-            data = await loop.run_in_executor(None, partial_search)
+    async def search(cls, query: str, *, pool: ExtractionPool, guild_id: int):
+        data = await pool.run(guild_id, extract_info, f"ytsearch1:{query}", YTDL_OPTIONS)
         if not data or 'entries' not in data or not data['entries']:
             raise Exception("No se encontró la canción.")
         return data['entries'][0]
 
+class YTDLOpusSource(TrackMetadata, discord.FFmpegOpusAudio):
+    """Modo 'opus': el volumen es un filtro de FFmpeg y Python solo reenvía paquetes Opus."""
+    mode = "opus"
+
+    def __init__(self, location: str, *, data, before_options=None, volume=VOLUME):
+        super().__init__(
+            location, bitrate=OPUS_BITRATE, before_options=before_options,
+            options=f"-vn -filter:a volume={volume}"
+        )
+        self._set_metadata(data)
+
+def open_source(location: str, data: dict, *, mode: str, remote: bool):
+    """Crea la fuente de audio del modo pedido ('pcm' u 'opus')."""
+    before_options = FFMPEG_OPTIONS['before_options'] if remote else None
+    if mode == "opus":
+        return YTDLOpusSource(location, data=data, before_options=before_options)
+    return YTDLSource(discord.FFmpegPCMAudio(location, before_options=before_options, options='-vn'), data=data)
+
+@dataclass
+class PrefetchedTrack:
+    """La siguiente canción, ya resuelta (y con FFmpeg arrancado si hay warmup)."""
+    track: TrackInfo
+    data: dict
+    expires_at: float
+    source: YTDLSource | YTDLOpusSource | None = None
+    release_slot: object = None # Devuelve la plaza de admisión del FFmpeg precalentado
+
+    def _release(self):
+        if self.release_slot:
+            self.release_slot()
+            self.release_slot = None
+
+    def usable(self) -> bool:
+        """False si la URL caduca antes de poder terminar la canción."""
+        margen = (self.track.duration or 0) + PREFETCH_EXPIRY_MARGIN
+        return self.expires_at - time.time() > margen
+
+    def take_source(self, mode: str):
+        source, self.source = self.source, None
+        self._release() # A partir de aquí suena con la plaza del servidor
+        if source and source.mode != mode:
+            source.cleanup() # Se precalentó con el modo anterior
+            source = None
+        return source or YTDLSource.from_data(self.data, mode=mode)
+
+    def discard(self):
+        """Libera el FFmpeg precalentado (si lo hay)."""
+        if self.source:
+            self.source.cleanup()
+            self.source = None
+        self._release()
+
 # -----------------------------------------------------------------
 # --- Clase 2: La "Mesa de Mezclas" (Los Botones) (Sin cambios funcionales) ---
 # -----------------------------------------------------------------
@@ -165,22 +313,76 @@ class MusicControlView(ui.View):
         
         await interaction.response.send_message("¡Música detenida! Me voy. 👋", ephemeral=True, delete_after=5)
 
+# --- Vista paginada de /queue ---
+class QueueView(ui.View):
+    def __init__(self, player, author: discord.abc.User):
+        super().__init__(timeout=180)
+        self.player = player
+        self.author = author
+        self.pagina = 0
+        self.update_buttons()
+
+    @property
+    def paginas(self) -> int:
+        return max(1, -(-len(self.player.queue) // QUEUE_PAGE_SIZE))
+
+    def update_buttons(self):
+        self.pagina = min(self.pagina, self.paginas - 1) # La cola pudo encoger entre clics
+        self.prev_button.disabled = self.pagina <= 0
+        self.next_button.disabled = self.pagina >= self.paginas - 1
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.author.id:
+            await interaction.response.send_message("Usa `/queue` para abrir tu propia vista de la cola.", ephemeral=True)
+            return False
+        return True
+
+    async def cambiar_pagina(self, interaction: discord.Interaction, pagina: int):
+        self.pagina = pagina
+        self.update_buttons()
+        await interaction.response.edit_message(embed=self.player.build_queue_embed(self.pagina), view=self)
+
+    @ui.button(emoji="◀️", style=discord.ButtonStyle.secondary)
+    async def prev_button(self, interaction: discord.Interaction, button: ui.Button):
+        await self.cambiar_pagina(interaction, max(0, self.pagina - 1))
+
+    @ui.button(emoji="▶️", style=discord.ButtonStyle.secondary)
+    async def next_button(self, interaction: discord.Interaction, button: ui.Button):
+        await self.cambiar_pagina(interaction, min(self.paginas - 1, self.pagina + 1))
+
 # -----------------------------------------------------------------
 # --- Clase 3: El "Reproductor" (¡¡CAMBIO AQUÍ!!) ---
 # -----------------------------------------------------------------
 class MusicPlayer:
-    def __init__(self, bot, interaction: discord.Interaction):
+    def __init__(self, bot, interaction: discord.Interaction, cache: YTDLCache, extraction: ExtractionPool,
+                 audio_cache: AudioCache, admission: AdmissionController, audio_mode: str = DEFAULT_AUDIO_MODE):
         self.bot = bot
+        self.audio_mode = audio_mode
+        self.admission = admission
+        self.wait_position = None # (posición, total) mientras esperamos plaza para sonar
+        self.cache = cache
+        self.extraction = extraction
+        self.audio_cache = audio_cache
         self.guild = interaction.guild
         self.text_channel = interaction.channel
         self.voice_client = None
-        self.queue = asyncio.Queue()
+        self.queue = TrackQueue()
         self.next_song = asyncio.Event()
         self.current_song = None
         self.player_loop_task = None
         self.panel_message = None
+        self.panel_view = None
+        self.source = None # Fuente de audio sonando (su FFmpeg cuenta en /musica_debug)
+        self.idle_since = time.monotonic() # Desde cuándo no suena nada (None = sonando)
         self.is_paused = False
+        self.paused_since = None       # monotonic() al pausar (None = no está en pausa)
+        self.disconnected_since = None # monotonic() de la primera vez que el reaper lo vio desconectado
         self.loop_mode = "none"
+        # Precarga de la siguiente canción
+        self.prefetched = None       # PrefetchedTrack listo para sonar
+        self.prefetch_task = None
+        self.prefetch_target = None  # TrackInfo que está resolviendo prefetch_task
+        self.track_ended_at = None   # perf_counter() del final de la canción anterior
 
     async def connect_vc(self, channel: discord.VoiceChannel):
         if self.voice_client:
@@ -198,37 +400,73 @@ class MusicPlayer:
         
         while True:
             try:
-                song_data = await asyncio.wait_for(self.queue.get(), timeout=300.0)
+                # Solo medimos el cambio de canción si la siguiente ya estaba en cola
+                ended_at = self.track_ended_at if self.queue else None
+                self.track_ended_at = None
+                track = await asyncio.wait_for(self.queue.get(), timeout=300.0)
                 
-                self.current_song = song_data
-                source = await YTDLSource.from_url(song_data['webpage_url'], loop=self.bot.loop, stream=True)
+                self.current_song = track
                 
-                # --- INICIO DEL ARREGLO (PRE-BUFFER) ---
+                # 1. Si la precarga de ESTA canción sigue en marcha, la esperamos (mejor que empezar otra)
+                if self.prefetch_task and not self.prefetch_task.done() and self.prefetch_target == track:
+                    await asyncio.wait({self.prefetch_task})
                 
-                # 1. Inicia la reproducción (y conexión de FFMPEG)
-                self.voice_client.play(source, after=lambda e: self.bot.loop.call_soon_threadsafe(self.next_song.set))
+                # 2. Plaza para un FFmpeg más (límite global); se conserva entre canciones
+                if not self.admission.holds(self.guild.id):
+                    admitted = await self.admission.acquire(self.guild.id, on_position=self.show_wait_position)
+                    self.wait_position = None
+                    if not admitted:
+                        self.queue.push_front(track)
+                        self.current_song = None
+                        try:
+                            await self.text_channel.send("🚦 Hay demasiados servidores escuchando música ahora mismo. Inténtalo en un rato.", delete_after=30)
+                        except discord.HTTPException:
+                            pass
+                        music = self.bot.get_cog("Music")
+                        if music:
+                            music.release_player(self)
+                        await self.disconnect()
+                        break
                 
-                # 2. Pausa el stream de Discord inmediatamente
-                self.voice_client.pause()
+                # 3. Caché local en disco > precarga vigente > resolver ahora
+                local_path = self.audio_cache.get(track.video_id)
+                prefetched = self.take_prefetched(track)
+                if local_path:
+                    if prefetched:
+                        prefetched.discard()
+                    data = await self.cache.get_metadata(track.video_id) or track.as_data()
+                    source = YTDLSource.from_file(local_path, data=data, mode=self.audio_mode)
+                elif prefetched:
+                    source = prefetched.take_source(self.audio_mode)
+                else:
+                    source = YTDLSource.from_data(await self.resolve_stream(track), mode=self.audio_mode)
+                self.current_song = source.track # Metadatos completos (las de playlist llegan 'flat')
                 
-                # 3. El estado deseado es 'reproduciendo' (esto es una pausa interna)
+                # 4. Inicia la reproducción (sin pausa ni espera fija)
+                self.voice_client.play(source, after=lambda e: self.bot.loop.call_soon_threadsafe(self.on_track_end))
+                self.source = source
+                self.idle_since = None
                 self.is_paused = False
+                self.paused_since = None
+                if ended_at is not None:
+                    metrics.observe("music.switch", (time.perf_counter() - ended_at) * 1000)
                 
-                # 4. Actualiza el panel para el usuario
-                await self.update_panel(source=source)
-                
-                # 5. Espera 2.5 segundos para que FFMPEG llene el buffer (aumentado de 1.0 para hosts lentos)
-                await asyncio.sleep(2.5)
-                
-                # 6. Reanuda, SOLO SI el usuario no ha pausado en ese segundo
-                if self.voice_client and self.voice_client.is_paused() and not self.is_paused:
-                    self.voice_client.resume()
-                
-                # --- FIN DEL ARREGLO ---
+                # 5. Actualiza el panel y precarga la siguiente mientras suena esta
+                await self.update_panel()
+                self.schedule_prefetch()
                 
                 await self.next_song.wait()
                 
+                if not local_path:
+                    # Ya sonó una vez: la guardamos en disco en segundo plano (no a la vez
+                    # que se reproduce, así no se descarga el mismo stream dos veces)
+                    self.audio_cache.fill(track.video_id, source.data['url'], source.duration)
+                
             except asyncio.TimeoutError:
+                # Nos quitamos del diccionario del Cog (si no, el reproductor se quedaría para siempre)
+                music = self.bot.get_cog("Music")
+                if music:
+                    music.release_player(self)
                 await self.disconnect()
                 try:
                     await self.text_channel.send("Me voy, la cola está vacía. 😴", delete_after=30)
@@ -244,20 +482,124 @@ class MusicPlayer:
                 continue
             finally:
                 if self.loop_mode == "song" and self.current_song:
-                    self.queue._queue.appendleft(self.current_song)
+                    self.queue.push_front(self.current_song)
                 elif self.loop_mode == "queue" and self.current_song:
-                    await self.queue.put(self.current_song)
+                    self.queue.push(self.current_song)
                 
                 self.current_song = None
+                self.source = None
+                if self.idle_since is None:
+                    self.idle_since = time.monotonic()
+                if not self.queue:
+                    self.admission.release(self.guild.id) # Sin nada más que sonar: dejamos la plaza
                 self.next_song.clear()
+
+    async def show_wait_position(self, posicion: int, total: int):
+        """Refleja en el panel la posición en la cola de espera para sonar."""
+        self.wait_position = (posicion, total)
+        try:
+            await self.update_panel()
+        except discord.HTTPException:
+            pass
+
+    def on_track_end(self):
+        """Callback (en el loop) cuando FFmpeg termina la canción actual."""
+        self.track_ended_at = time.perf_counter()
+        self.next_song.set()
+
+    def enqueue_batch(self, entries: list):
+        """Añade a la cola un lote de entradas 'flat' de una playlist (sin red)."""
+        self.queue.push_many(TrackInfo.from_data(entry) for entry in entries)
+        if self.current_song:
+            self.schedule_prefetch()
+
+    # --- Precarga ---
+    def peek_next(self):
+        """La canción que sonará después de la actual (sin sacarla de la cola)."""
+        if self.loop_mode == "song" and self.current_song:
+            return self.current_song
+        if self.queue:
+            return self.queue.peek()
+        if self.loop_mode == "queue":
+            return self.current_song
+        return None
+
+    def schedule_prefetch(self):
+        """Lanza (o redirige) la precarga hacia la próxima canción. Idempotente."""
+        track = self.peek_next()
+        if self.prefetch_task and not self.prefetch_task.done():
+            if self.prefetch_target == track:
+                return
+            self.prefetch_task.cancel()
+        if track is None or track.video_id in self.audio_cache:
+            return # Nada que precargar (o ya la tenemos en disco)
+        if self.prefetched and self.prefetched.track == track and self.prefetched.usable():
+            return
+        self.prefetch_target = track
+        self.prefetch_task = self.bot.loop.create_task(self._prefetch(track))
+
+    async def _prefetch(self, track: TrackInfo):
+        try:
+            data = await self.resolve_stream(track)
+        except Exception as e:
+            print(f"Error al precargar '{track.title}': {e}")
+            metrics.incr("music.prefetch.error")
+            return
+        prefetched = PrefetchedTrack(track, data, stream_expires_at(data, time.time()))
+        warmup_slot = ("warmup", self.guild.id)
+        if FFMPEG_WARMUP and self.admission.try_acquire(warmup_slot):
+            prefetched.source = YTDLSource.from_data(data, mode=self.audio_mode)
+            prefetched.release_slot = lambda: self.admission.release(warmup_slot)
+        if self.prefetched:
+            self.prefetched.discard()
+        self.prefetched = prefetched
+
+    async def resolve_stream(self, track: TrackInfo) -> dict:
+        """Datos del stream de 'track' (de la caché si la URL aún dura toda la canción)."""
+        min_valid = (track.duration or 0) + PREFETCH_EXPIRY_MARGIN
+        return await self.cache.stream(
+            track.video_id,
+            lambda: YTDLSource.extract(track.url, pool=self.extraction, guild_id=self.guild.id),
+            min_valid=min_valid
+        )
+
+    def take_prefetched(self, track: TrackInfo):
+        """Devuelve la precarga de 'track' si sigue vigente; si no, la descarta."""
+        prefetched, self.prefetched = self.prefetched, None
+        if prefetched is None or prefetched.track != track:
+            if prefetched:
+                prefetched.discard()
+            metrics.incr("music.prefetch.miss")
+            return None
+        if not prefetched.usable():
+            prefetched.discard()
+            metrics.incr("music.prefetch.expired")
+            return None
+        metrics.incr("music.prefetch.hit")
+        return prefetched
+
+    def cancel_prefetch(self):
+        if self.prefetch_task:
+            self.prefetch_task.cancel()
+            self.prefetch_task = None
+        self.prefetch_target = None
+        if self.prefetched:
+            self.prefetched.discard()
+            self.prefetched = None
                 
     async def disconnect(self):
         """Detiene todo, borra el panel y se desconecta."""
         if self.player_loop_task:
-            self.player_loop_task.cancel()
+            if self.player_loop_task is not asyncio.current_task(): # (si nos llama el propio loop, que termine solo)
+                self.player_loop_task.cancel()
             self.player_loop_task = None
+        self.cancel_prefetch()
+        self.admission.release(self.guild.id)
+        if self.panel_view:
+            self.panel_view.stop()
+            self.panel_view = None
             
-        self.queue = asyncio.Queue()
+        self.queue.clear()
         
         if self.panel_message:
             try:
@@ -270,18 +612,47 @@ class MusicPlayer:
             await self.voice_client.disconnect()
             self.voice_client = None
 
-    async def update_panel(self, source=None):
-        """Crea o edita el panel de control."""
-        if not source and self.current_song:
-            try:
-                song_data = await YTDLSource.search(self.current_song['title'], loop=self.bot.loop)
-                source = YTDLSource(None, data=song_data)
-            except Exception:
-                source = None
-        
-        view = MusicControlView(self.bot, self)
+    def build_panel_embed(self) -> discord.Embed:
+        """Embed del panel a partir de 'current_song' (sin red)."""
+        track = self.current_song
+        embed = discord.Embed(
+            title="Reproduciendo Ahora 🎶",
+            description=f"**[{track.title}]({track.url})**\nPor: {track.uploader}",
+            color=discord.Color.random()
+        )
+        embed.set_thumbnail(url=track.thumbnail)
+        if self.wait_position:
+            posicion, total = self.wait_position
+            embed.title = "En Espera ⏳"
+            embed.add_field(name="Esperando turno:", value=f"Hay muchos servidores escuchando música. Posición **{posicion}** de {total}.")
+        embed.set_footer(text=f"Loop: {self.loop_mode.capitalize()} | {'Pausado' if self.is_paused else 'Reproduciendo'}")
+        return embed
+
+    def build_queue_embed(self, pagina: int) -> discord.Embed:
+        """Una página de la cola (solo se leen las canciones de esa página)."""
+        embed = discord.Embed(title="Cola de Reproducción 🎶", color=discord.Color.blue())
+        if self.current_song:
+            embed.add_field(name="Sonando Ahora:", value=f"**[{self.current_song.title}]({self.current_song.url})**", inline=False)
+        total = len(self.queue)
+        if not total:
+            embed.description = "No hay más canciones en la cola."
+            return embed
+        paginas = max(1, -(-total // QUEUE_PAGE_SIZE))
+        inicio = pagina * QUEUE_PAGE_SIZE
+        queue_list_str = ""
+        for i, song in enumerate(self.queue.slice(inicio, inicio + QUEUE_PAGE_SIZE), start=inicio + 1):
+            queue_list_str += f"**{i}.** [{song.title}]({song.url})\n"
+        embed.add_field(name="A Continuación:", value=queue_list_str, inline=False)
+        embed.set_footer(text=f"Página {pagina + 1}/{paginas} | {total} canciones en cola")
+        return embed
+
+    async def update_panel(self):
+        """Crea o edita el panel de control (solo la llamada a Discord; nada de yt-dlp)."""
+        if self.panel_view:
+            self.panel_view.stop() # La vista anterior deja de escuchar (si no, se acumulan)
+        view = self.panel_view = MusicControlView(self.bot, self)
         
-        if not source:
+        if not self.current_song:
             if self.panel_message:
                 try:
                     await self.panel_message.edit(view=view)
@@ -289,13 +660,7 @@ class MusicPlayer:
                     self.panel_message = None
             return
 
-        embed = discord.Embed(
-            title="Reproduciendo Ahora 🎶",
-            description=f"**[{source.title}]({source.url})**\nPor: {source.uploader}",
-            color=discord.Color.random()
-        )
-        embed.set_thumbnail(url=source.thumbnail)
-        embed.set_footer(text=f"Loop: {self.loop_mode.capitalize()} | {'Pausado' if self.is_paused else 'Reproduciendo'}")
+        embed = self.build_panel_embed()
         
         if self.panel_message:
             try:
@@ -305,15 +670,49 @@ class MusicPlayer:
         else:
             self.panel_message = await self.text_channel.send(embed=embed, view=view)
 
+    # --- Recursos ---
+    def ffmpeg_pids(self) -> list:
+        """PIDs de los FFmpeg vivos de este servidor (el que suena y el precalentado)."""
+        pids = []
+        for source in (self.source, self.prefetched.source if self.prefetched else None):
+            # En modo PCM el FFmpeg va envuelto por PCMVolumeTransformer (.original)
+            process = getattr(getattr(source, 'original', source), '_process', None)
+            if process is not None and process.poll() is None:
+                pids.append(process.pid)
+        return pids
+
+    def is_stale(self, now: float) -> bool:
+        """
+        True si el reproductor ya no hace nada útil y se puede cerrar. Lo llama
+        el reaper: de paso anota desde cuándo está desconectado.
+        """
+        if self.voice_client is not None and not self.voice_client.is_connected():
+            # Puede ser discord.py reconectando tras un corte del gateway de voz:
+            # solo lo cerramos si sigue así pasado el margen
+            if self.disconnected_since is None:
+                self.disconnected_since = now
+            return now - self.disconnected_since > PLAYER_DISCONNECT_GRACE
+        self.disconnected_since = None
+        if self.is_paused and self.paused_since is not None:
+            return now - self.paused_since > PLAYER_PAUSE_TIMEOUT # Pausado y olvidado
+        if self.idle_since is None:
+            return False # Está sonando
+        idle = now - self.idle_since
+        if self.player_loop_task is None or self.player_loop_task.done():
+            return idle > PLAYER_REAP_GRACE # Sin bucle (un /play que falló, un bucle que murió...)
+        return not self.queue and idle > PLAYER_IDLE_TIMEOUT
+
     async def pause(self):
         if self.voice_client and self.voice_client.is_playing():
             self.voice_client.pause()
             self.is_paused = True
+            self.paused_since = time.monotonic()
 
     async def resume(self):
         if self.voice_client and self.voice_client.is_paused():
             self.voice_client.resume()
             self.is_paused = False
+            self.paused_since = None
             
     async def toggle_loop(self) -> str:
         if self.loop_mode == "none":
@@ -322,6 +721,7 @@ class MusicPlayer:
             self.loop_mode = "queue"
         elif self.loop_mode == "queue":
             self.loop_mode = "none"
+        self.schedule_prefetch() # Cambia cuál es la siguiente canción
         return self.loop_mode.capitalize()
 
 # -----------------------------------------------------------------
@@ -331,6 +731,57 @@ class Music(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.players = {}
+        self.db = bot.storage.get('music')
+        self.audio_modes = {} # {guild_id: 'pcm' | 'opus'} (tabla music_settings)
+        # Caché de búsquedas / metadatos / streams de yt-dlp (data/music.db)
+        self.ytdl_cache = YTDLCache(self.db)
+        # Pool propio para yt-dlp (tope global + turnos por servidor)
+        self.extraction = ExtractionPool()
+        # Límite global de FFmpeg a la vez (MUSIC_MAX_STREAMS) con cola de espera
+        self.admission = AdmissionController()
+        # Audio ya transcodificado en disco (data/audio_cache, AUDIO_CACHE_MAX_MB); sus FFmpeg cuentan en el límite
+        self.audio_cache = AudioCache(admission=self.admission)
+
+    async def cog_load(self):
+        await self.db.execute("""
+        CREATE TABLE IF NOT EXISTS music_settings (
+            guild_id INTEGER PRIMARY KEY,
+            audio_mode TEXT NOT NULL
+        )
+        """)
+        rows = await self.db.fetchall("SELECT guild_id, audio_mode FROM music_settings")
+        self.audio_modes = {row['guild_id']: row['audio_mode'] for row in rows}
+        await self.ytdl_cache.setup()
+        await asyncio.to_thread(self.audio_cache.load)
+        metrics.gauge("music.players", lambda: len(self.players))
+        metrics.gauge("music.ffmpeg", lambda: sum(len(p.ffmpeg_pids()) for p in list(self.players.values())))
+        self.reap_players.start()
+
+    async def cog_unload(self):
+        self.reap_players.cancel()
+        for player in list(self.players.values()):
+            await player.disconnect()
+        self.players.clear()
+        self.extraction.close()
+        await self.audio_cache.close()
+
+    # --- Ciclo de vida ---
+    def release_player(self, player: MusicPlayer):
+        """Quita 'player' del diccionario (solo si sigue siendo el de su servidor)."""
+        if self.players.get(player.guild.id) is player:
+            del self.players[player.guild.id]
+
+    @tasks.loop(seconds=REAP_INTERVAL)
+    async def reap_players(self):
+        """Cierra los reproductores inactivos o huérfanos (tareas, vistas y FFmpeg incluidos)."""
+        now = time.monotonic()
+        for player in [p for p in self.players.values() if p.is_stale(now)]:
+            self.release_player(player)
+            try:
+                await player.disconnect()
+            except Exception as e:
+                print(f"Error al cerrar el reproductor de {player.guild.id}: {e}")
+            metrics.incr("music.players.reaped")
 
     def get_player(self, interaction: discord.Interaction) -> MusicPlayer:
         """Obtiene el reproductor del servidor, o crea uno nuevo."""
@@ -339,12 +790,15 @@ class Music(commands.Cog):
             player.text_channel = interaction.channel
             return player
         else:
-            player = MusicPlayer(self.bot, interaction)
+            player = MusicPlayer(
+                self.bot, interaction, self.ytdl_cache, self.extraction, self.audio_cache, self.admission,
+                self.audio_modes.get(interaction.guild.id, DEFAULT_AUDIO_MODE)
+            )
             self.players[interaction.guild.id] = player
             return player
 
-    @app_commands.command(name="play", description="Reproduce una canción de YouTube (búsqueda o URL).")
-    @app_commands.describe(busqueda="El nombre o URL de la canción.")
+    @app_commands.command(name="play", description="Reproduce una canción o playlist de YouTube (búsqueda o URL).")
+    @app_commands.describe(busqueda="El nombre o URL de la canción (o la URL de una playlist).")
     async def play(self, interaction: discord.Interaction, busqueda: str):
         
         if not interaction.user.voice or not interaction.user.voice.channel:
@@ -358,23 +812,75 @@ class Music(commands.Cog):
         
         try:
             await player.connect_vc(interaction.user.voice.channel)
-            song_data = await YTDLSource.search(busqueda, loop=self.bot.loop)
+            if PLAYLIST_RE.match(busqueda):
+                await self.play_playlist(interaction, player, busqueda)
+                return
+            song_data = await self.ytdl_cache.search(
+                busqueda, lambda: YTDLSource.search(busqueda, pool=self.extraction, guild_id=interaction.guild.id)
+            )
+            track = TrackInfo.from_data(song_data)
             
-            await player.queue.put(song_data)
+            player.queue.push(track)
             await player.start_player_loop()
+            if player.current_song:
+                player.schedule_prefetch()
             
             embed = discord.Embed(
                 title="Añadido a la Cola 🎶",
-                description=f"**[{song_data['title']}]({song_data['webpage_url']})**",
+                description=f"**[{track.title}]({track.url})**",
                 color=discord.Color.green()
             )
-            embed.set_thumbnail(url=song_data['thumbnail'])
+            embed.set_thumbnail(url=track.thumbnail)
             
             await interaction.followup.send(embed=embed, ephemeral=True)
             
         except Exception as e:
             await interaction.followup.send(f"❌ Error al buscar o añadir la canción: {e}", ephemeral=True)
             return
+
+    async def play_playlist(self, interaction: discord.Interaction, player: MusicPlayer, url: str):
+        """
+        Lee la playlist en modo 'flat' en un hilo del pool de extracción y va
+        encolando lotes según llegan: la primera canción suena sin esperar al resto.
+        """
+        loop = asyncio.get_running_loop()
+        batches = asyncio.Queue()
+        stop = threading.Event()
+        emit = lambda batch: loop.call_soon_threadsafe(batches.put_nowait, batch)
+
+        mensaje = await interaction.followup.send("⏳ Cargando playlist...", ephemeral=True, wait=True)
+        job = asyncio.create_task(self.extraction.run_in_thread(
+            interaction.guild.id, extract_playlist, url, YTDL_OPTIONS, emit, stop
+        ))
+        job.add_done_callback(lambda _: batches.put_nowait(None))
+
+        total = 0
+        while (batch := await batches.get()) is not None:
+            if self.players.get(interaction.guild.id) is not player:
+                stop.set() # El reproductor se paró mientras cargábamos
+                job.cancel()
+                return
+            player.enqueue_batch(batch)
+            if total == 0:
+                await player.start_player_loop()
+            total += len(batch)
+            metrics.incr("music.playlist.entries", len(batch))
+
+        try:
+            info = await job
+        except Exception as e:
+            await mensaje.edit(content=f"❌ Error al cargar la playlist: {e} ({total} canciones añadidas)")
+            return
+        if total == 0:
+            await mensaje.edit(content="❌ No se encontraron canciones en esa playlist.")
+            return
+
+        embed = discord.Embed(
+            title="Playlist Añadida a la Cola 🎶",
+            description=f"**[{info['title'] or 'Playlist'}]({url})**\n{total} canciones añadidas.",
+            color=discord.Color.green()
+        )
+        await mensaje.edit(content=None, embed=embed)
             
     @app_commands.command(name="queue", description="Muestra la cola de reproducción.")
     async def queue(self, interaction: discord.Interaction):
@@ -382,21 +888,137 @@ class Music(commands.Cog):
             await interaction.response.send_message("La cola está vacía.", ephemeral=True)
             return
         player = self.players[interaction.guild.id]
-        embed = discord.Embed(title="Cola de Reproducción 🎶", color=discord.Color.blue())
-        if player.current_song:
-            embed.add_field(name="Sonando Ahora:", value=f"**[{player.current_song['title']}]({player.current_song['webpage_url']})**", inline=False)
-        if player.queue.empty():
-            embed.description = "No hay más canciones en la cola."
+        # Solo se renderiza la página visible (la cola puede tener cientos tras una playlist)
+        view = QueueView(player, interaction.user)
+        await interaction.response.send_message(embed=player.build_queue_embed(0), view=view, ephemeral=True)
+
+    # --- Edición de la cola ---
+    async def get_voice_player(self, interaction: discord.Interaction):
+        """El reproductor del servidor si el usuario está en su canal de voz (si no, responde y devuelve None)."""
+        player = self.players.get(interaction.guild.id)
+        if not player or not player.voice_client:
+            await interaction.response.send_message("No hay música sonando.", ephemeral=True)
+            return None
+        if not interaction.user.voice or interaction.user.voice.channel != player.voice_client.channel:
+            await interaction.response.send_message("Debes estar en el *mismo* canal de voz que yo.", ephemeral=True)
+            return None
+        return player
+
+    @app_commands.command(name="quitar", description="Quita una canción de la cola.")
+    @app_commands.describe(posicion="Su número en /queue.")
+    async def quitar(self, interaction: discord.Interaction, posicion: app_commands.Range[int, 1]):
+        player = await self.get_voice_player(interaction)
+        if not player:
+            return
+        try:
+            track = player.queue.remove_at(posicion - 1)
+        except IndexError:
+            await interaction.response.send_message(f"No hay ninguna canción en la posición {posicion}.", ephemeral=True)
+            return
+        player.schedule_prefetch() # Puede haber cambiado la siguiente
+        await interaction.response.send_message(f"🗑️ Quitada: **{track.title}**", ephemeral=True)
+
+    @app_commands.command(name="mover", description="Cambia de posición una canción de la cola.")
+    @app_commands.describe(desde="Su número actual en /queue.", hasta="La posición a la que la quieres mover.")
+    async def mover(self, interaction: discord.Interaction, desde: app_commands.Range[int, 1], hasta: app_commands.Range[int, 1]):
+        player = await self.get_voice_player(interaction)
+        if not player:
+            return
+        try:
+            track = player.queue.move(desde - 1, hasta - 1)
+        except IndexError:
+            await interaction.response.send_message(f"Las posiciones deben estar entre 1 y {len(player.queue)}.", ephemeral=True)
+            return
+        player.schedule_prefetch()
+        await interaction.response.send_message(f"↕️ **{track.title}** ahora es la número {hasta}.", ephemeral=True)
+
+    @app_commands.command(name="mezclar", description="Mezcla el orden de la cola.")
+    async def mezclar(self, interaction: discord.Interaction):
+        player = await self.get_voice_player(interaction)
+        if not player:
+            return
+        if len(player.queue) < 2:
+            await interaction.response.send_message("No hay suficientes canciones en la cola para mezclar.", ephemeral=True)
+            return
+        player.queue.shuffle()
+        player.schedule_prefetch()
+        await interaction.response.send_message(f"🔀 Cola mezclada ({len(player.queue)} canciones).", ephemeral=True)
+
+    @app_commands.command(name="modo_audio", description="Elige cómo procesa el bot el audio de la música en este servidor.")
+    @app_commands.describe(modo="Opus directo gasta mucha menos CPU; PCM es el modo clásico.")
+    @app_commands.choices(modo=[
+        app_commands.Choice(name="Opus directo (FFmpeg hace todo)", value="opus"),
+        app_commands.Choice(name="PCM (clásico)", value="pcm"),
+    ])
+    @is_moderator()
+    async def modo_audio(self, interaction: discord.Interaction, modo: app_commands.Choice[str]):
+        await self.db.execute(
+            "INSERT INTO music_settings (guild_id, audio_mode) VALUES (?, ?) "
+            "ON CONFLICT(guild_id) DO UPDATE SET audio_mode = excluded.audio_mode",
+            (interaction.guild.id, modo.value)
+        )
+        self.audio_modes[interaction.guild.id] = modo.value
+        player = self.players.get(interaction.guild.id)
+        if player:
+            player.audio_mode = modo.value # Se aplica desde la próxima canción
+        await interaction.response.send_message(f"🎛️ Modo de audio: **{modo.name}** (se aplica desde la próxima canción).", ephemeral=True)
+
+    @modo_audio.error
+    async def on_modo_audio_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        if isinstance(error, app_commands.CheckFailure):
+            await interaction.response.send_message("⛔ ¡Acceso Denegado! ⛔", ephemeral=True)
         else:
-            queue_list_str = ""
-            for i, song in enumerate(list(player.queue._queue)):
-                queue_list_str += f"**{i+1}.** [{song['title']}]({song['webpage_url']})\n"
-                if i >= 9 and player.queue.qsize() > 10:
-                    queue_list_str += f"...y {player.queue.qsize() - (i+1)} más."
-                    break
-            embed.add_field(name="A Continuación:", value=queue_list_str, inline=False)
+            await interaction.response.send_message("Algo salió mal.", ephemeral=True)
+
+    @app_commands.command(name="musica_debug", description="Muestra los recursos que usa cada reproductor de música.")
+    @is_moderator()
+    async def musica_debug(self, interaction: discord.Interaction):
+        now = time.monotonic()
+        lineas = [f"{'Servidor':<18} {'Estado':<8} {'Cola':>4} {'FFmpeg':>6} {'RSS MB':>7} {'Sock':>4} {'Inact.':>6}"]
+        ffmpeg_total = {"procs": 0, "rss_kb": 0, "sockets": 0}
+        for player in list(self.players.values()):
+            stats = sum_stats(player.ffmpeg_pids())
+            for key in ffmpeg_total:
+                ffmpeg_total[key] += stats[key]
+            if player.idle_since is None:
+                estado = "pausado" if player.is_paused else "sonando"
+            else:
+                estado = "inactivo"
+            voz = 1 if player.voice_client and player.voice_client.is_connected() else 0 # Socket UDP de voz (en el bot)
+            inactivo = f"{int(now - player.idle_since)}s" if player.idle_since is not None else "-"
+            lineas.append(
+                f"{player.guild.name[:18]:<18} {estado:<8} {len(player.queue):>4} {stats['procs']:>6} "
+                f"{stats['rss_kb'] / 1024:>7.1f} {stats['sockets'] + voz:>4} {inactivo:>6}"
+            )
+        if len(lineas) > 26:
+            lineas = lineas[:26] + [f"... y {len(lineas) - 26} más"]
+
+        bot_stats = process_stats(os.getpid()) or {"rss_kb": 0, "sockets": 0}
+        embed = discord.Embed(
+            title="🔧 Recursos de Música",
+            description="```\n" + "\n".join(lineas) + "\n```",
+            color=discord.Color.dark_grey()
+        )
+        embed.add_field(name="Reproductores", value=str(len(self.players)), inline=True)
+        embed.add_field(
+            name="FFmpeg (total)",
+            value=f"{ffmpeg_total['procs']} procesos | {ffmpeg_total['rss_kb'] / 1024:.1f} MB | {ffmpeg_total['sockets']} sockets",
+            inline=True
+        )
+        embed.add_field(
+            name="Proceso del bot",
+            value=f"{bot_stats['rss_kb'] / 1024:.1f} MB | {bot_stats['sockets']} sockets",
+            inline=True
+        )
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
+    @musica_debug.error
+    async def on_musica_debug_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        if isinstance(error, app_commands.CheckFailure):
+            await interaction.response.send_message("⛔ ¡Acceso Denegado! ⛔", ephemeral=True)
+        else:
+            await interaction.response.send_message("Algo salió mal.", ephemeral=True)
+
     # --- Evento de limpieza ---
     @commands.Cog.listener()
     async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
@@ -1,34 +1,154 @@
 # cogs/social/levels.py
 import os
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
-import datetime
-import sqlite3
 import random
 import math # Para la fórmula de nivel
+import time
+import asyncio
+from collections import OrderedDict
+from cachetools import TTLCache
+
+from utils.metrics import metrics
 
 # --- CONSTANTES DEL SISTEMA DE NIVELES ---
 XP_COOLDOWN = 60 # Segundos de cooldown para ganar XP
 XP_MIN = 15      # Mínimo XP por mensaje
 XP_MAX = 25      # Máximo XP por mensaje
+# Máximo de cooldowns vivos en memoria (~ usuarios activos en el último minuto en TODOS los servidores)
+XP_COOLDOWN_MAX = int(os.getenv("XP_COOLDOWN_MAX", "100000"))
+
+# --- CONSTANTES DEL BUFFER DE XP (write-behind) ---
+XP_FLUSH_INTERVAL = 15   # Segundos entre escrituras a la BBDD
+XP_FLUSH_MAX = 500       # Si hay tantos usuarios pendientes, escribimos ya
+XP_STATE_MAX = 50_000    # Perfiles (xp, nivel) que mantenemos en memoria
+
+# -----------------------------------------------------------------
+# --- Clase 1: El Buffer de XP ---
+# -----------------------------------------------------------------
+class XPBuffer:
+    """
+    Suma el XP ganado en memoria por (guild, usuario) y lo vuelca a la BBDD
+    en UNA transacción (executemany + UPSERT). La subida de nivel se calcula
+    contra el estado en memoria, así que el anuncio sigue siendo instantáneo.
+    """
+
+    def __init__(self, db, xp_para_nivel):
+        self.db = db
+        self.xp_para_nivel = xp_para_nivel
+        self.state = OrderedDict()  # {(guild_id, user_id): [xp, level]} (LRU)
+        self.pending = {}           # {(guild_id, user_id): [xp_sumado, level]}
+        self._flush_lock = asyncio.Lock()
+
+    def peek(self, guild_id: int, user_id: int):
+        """Devuelve [xp, level] si el perfil está en memoria (sin tocar la BBDD)."""
+        return self.state.get((guild_id, user_id))
+
+    async def load(self, guild_id: int, user_id: int) -> list:
+        """Devuelve el perfil en memoria, cargándolo de la BBDD si hace falta."""
+        key = (guild_id, user_id)
+        if key in self.state:
+            self.state.move_to_end(key)
+            return self.state[key]
+
+        row = await self.db.get_user_row('levels', user_id, guild_id, {"xp": 0, "level": 0})
+        if key in self.state: # Otro mensaje lo cargó mientras esperábamos
+            return self.state[key]
+
+        profile = [row['xp'], row['level']]
+        self.state[key] = profile
+        self._evict()
+        return profile
+
+    def _evict(self):
+        """Saca de memoria los perfiles menos recientes (nunca los pendientes)."""
+        skipped = 0
+        while len(self.state) > XP_STATE_MAX and skipped < len(self.state):
+            key, profile = self.state.popitem(last=False)
+            if key in self.pending:
+                self.state[key] = profile
+                skipped += 1
+
+    async def add_xp(self, guild_id: int, user_id: int, amount: int):
+        """Suma XP. Devuelve el nuevo nivel si sube, o None."""
+        profile = await self.load(guild_id, user_id)
+        profile[0] += amount
+
+        nuevo_nivel = None
+        if profile[0] >= self.xp_para_nivel(profile[1]):
+            profile[1] += 1
+            nuevo_nivel = profile[1]
+
+        entry = self.pending.setdefault((guild_id, user_id), [0, 0])
+        entry[0] += amount
+        entry[1] = profile[1]
+        return nuevo_nivel
+
+    async def flush(self):
+        """Escribe todo el XP pendiente en una sola transacción."""
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+            rows = [(user_id, guild_id, xp, level) for (guild_id, user_id), (xp, level) in batch.items()]
+
+            start = time.perf_counter()
+            try:
+                await self.db.executemany(
+                    "INSERT INTO levels (user_id, guild_id, xp, level) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (user_id, guild_id) DO UPDATE SET xp = xp + excluded.xp, level = MAX(level, excluded.level)",
+                    rows
+                )
+            except Exception as e:
+                # Devolvemos el lote al buffer para el próximo intento
+                for key, (xp, level) in batch.items():
+                    entry = self.pending.setdefault(key, [0, 0])
+                    entry[0] += xp
+                    entry[1] = max(entry[1], level)
+                print(f"Error al volcar el XP pendiente ({len(rows)} usuarios): {e}")
+                return
+
+            metrics.observe("levels.flush", (time.perf_counter() - start) * 1000)
+            metrics.incr("levels.flush.count")
+            metrics.incr("levels.flush.rows", len(rows))
 
-# --- Clase del Cog ---
+# -----------------------------------------------------------------
+# --- Clase 2: El Cog ---
+# -----------------------------------------------------------------
 class Levels(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        # Creamos una BBDD separada para la economía
-        self.init_database()
-        # Un diccionario para manejar los cooldowns en memoria (más rápido)
-        self.user_cooldowns = {} # {user_id: last_message_time}
-
-    def init_database(self):
-        """Crea el archivo .db y la tabla 'levels' si no existen."""
-        os.makedirs('data', exist_ok=True) 
-        db = sqlite3.connect('data/social.db') # Nueva BBDD
-        cursor = db.cursor()
-        
-        cursor.execute("""
+        # BBDD separada para los niveles (conexión compartida del servicio de almacenamiento)
+        self.db = bot.storage.get('social')
+        # Cooldowns en memoria por (guild, usuario). Cada entrada caduca sola a los
+        # XP_COOLDOWN segundos (reloj monotónico) y, como todas tienen el mismo TTL,
+        # la lista interna ya está ordenada por caducidad: limpiar es O(1) amortizado.
+        # Con más de XP_COOLDOWN_MAX entradas se descarta la más antigua.
+        self.user_cooldowns = TTLCache(maxsize=XP_COOLDOWN_MAX, ttl=XP_COOLDOWN, timer=time.monotonic)
+        metrics.gauge("levels.cooldowns", lambda: len(self.user_cooldowns))
+        # El XP se acumula en memoria y se escribe por lotes
+        self.xp_buffer = XPBuffer(self.db, self.xp_para_nivel)
+        self._flush_task = None
+        metrics.gauge("levels.pending", lambda: len(self.xp_buffer.pending))
+
+    async def cog_load(self):
+        await self.init_database()
+        self.flush_xp.start()
+
+    async def cog_unload(self):
+        """Al descargar el Cog (o apagar el bot) NO perdemos el XP pendiente."""
+        self.flush_xp.cancel()
+        await self.xp_buffer.flush()
+
+    @tasks.loop(seconds=XP_FLUSH_INTERVAL)
+    async def flush_xp(self):
+        """Vuelca el XP acumulado cada XP_FLUSH_INTERVAL segundos."""
+        await self.xp_buffer.flush()
+
+    async def init_database(self):
+        """Crea la tabla 'levels' si no existe."""
+        await self.db.execute("""
         CREATE TABLE IF NOT EXISTS levels (
             user_id INTEGER NOT NULL,
             guild_id INTEGER NOT NULL,
@@ -37,29 +157,11 @@ class Levels(commands.Cog):
             PRIMARY KEY (user_id, guild_id)
         )
         """)
-        db.commit()
-        db.close()
-
-    # --- Función Helper: Obtener/Crear Usuario ---
-    def get_or_create_user(self, user_id: int, guild_id: int) -> dict:
-        """Obtiene el perfil de nivel de un usuario. Si no existe, lo crea."""
-        db = sqlite3.connect('data/social.db')
-        db.row_factory = sqlite3.Row
-        cursor = db.cursor()
-        
-        cursor.execute("SELECT * FROM levels WHERE user_id = ? AND guild_id = ?", (user_id, guild_id))
-        data = cursor.fetchone()
-        
-        if data is None:
-            # Si no existe, lo insertamos
-            cursor.execute("INSERT INTO levels (user_id, guild_id) VALUES (?, ?)", (user_id, guild_id))
-            db.commit()
-            
-            cursor.execute("SELECT * FROM levels WHERE user_id = ? AND guild_id = ?", (user_id, guild_id))
-            data = cursor.fetchone()
-            
-        db.close()
-        return data
+
+    # --- Función Helper: Obtener Usuario ---
+    async def get_user(self, user_id: int, guild_id: int) -> dict:
+        """Obtiene el perfil de nivel de un usuario (nivel 0 si no existe, sin crearlo)."""
+        return await self.db.get_user_row('levels', user_id, guild_id, {"xp": 0, "level": 0})
 
     # --- Función Helper: Fórmula de Nivel ---
     def xp_para_nivel(self, level: int) -> int:
@@ -81,52 +183,29 @@ class Levels(commands.Cog):
         if not message.guild or message.author.bot:
             return
             
-        # 2. Comprobar Cooldown (usando el dict en memoria)
+        # 2. Comprobar Cooldown (las entradas caducadas ya no están en la caché)
         user_id = message.author.id
         guild_id = message.guild.id
-        current_time = datetime.datetime.now()
         
-        if user_id in self.user_cooldowns:
-            last_time = self.user_cooldowns[user_id]
-            if (current_time - last_time).total_seconds() < XP_COOLDOWN:
-                return # Aún en cooldown, no hacer nada
+        if (guild_id, user_id) in self.user_cooldowns:
+            return # Aún en cooldown, no hacer nada
         
         # 3. Actualizar Cooldown en memoria
-        self.user_cooldowns[user_id] = current_time
+        self.user_cooldowns[(guild_id, user_id)] = True
         
         # 4. Dar XP
         xp_ganado = random.randint(XP_MIN, XP_MAX)
         
         try:
-            db = sqlite3.connect('data/social.db')
-            db.row_factory = sqlite3.Row
-            cursor = db.cursor()
-            
-            # Obtenemos los datos (o creamos el usuario)
-            cursor.execute("SELECT * FROM levels WHERE user_id = ? AND guild_id = ?", (user_id, guild_id))
-            user_data = cursor.fetchone()
-            
-            if user_data is None:
-                cursor.execute("INSERT INTO levels (user_id, guild_id, xp, level) VALUES (?, ?, ?, ?)", (user_id, guild_id, xp_ganado, 0))
-                db.commit()
-                user_xp = xp_ganado
-                user_level = 0
-            else:
-                user_xp = user_data['xp'] + xp_ganado
-                user_level = user_data['level']
-                cursor.execute("UPDATE levels SET xp = ? WHERE user_id = ? AND guild_id = ?", (user_xp, user_id, guild_id))
-                db.commit()
+            # Sumamos el XP en memoria y 5. comprobamos si sube de nivel
+            nuevo_nivel = await self.xp_buffer.add_xp(guild_id, user_id, xp_ganado)
             
-            # 5. Comprobar si sube de nivel
-            xp_necesario = self.xp_para_nivel(user_level)
+            # Si hay muchos usuarios pendientes, volcamos sin esperar al timer
+            if len(self.xp_buffer.pending) >= XP_FLUSH_MAX and (self._flush_task is None or self._flush_task.done()):
+                self._flush_task = self.bot.loop.create_task(self.xp_buffer.flush())
             
-            if user_xp >= xp_necesario:
-                # ¡SUBE DE NIVEL!
-                nuevo_nivel = user_level + 1
-                cursor.execute("UPDATE levels SET level = ? WHERE user_id = ? AND guild_id = ?", (nuevo_nivel, user_id, guild_id))
-                db.commit()
-                
-                # ¡Enviar mensaje de felicitación!
+            if nuevo_nivel is not None:
+                # ¡SUBE DE NIVEL! ¡Enviar mensaje de felicitación!
                 embed = discord.Embed(
                     title="¡Subiste de Nivel! 🚀",
                     description=f"¡Felicidades, {message.author.mention}! Has alcanzado el **Nivel {nuevo_nivel}**.",
@@ -136,8 +215,6 @@ class Levels(commands.Cog):
                 # Enviarlo al canal donde subió de nivel
                 await message.channel.send(embed=embed)
             
-            db.close()
-            
         except Exception as e:
             print(f"Error de DB en on_message (levels): {e}")
 
@@ -156,11 +233,14 @@ class Levels(commands.Cog):
         
         target_user = miembro or interaction.user
         
-        # Obtenemos los datos
-        user_data = self.get_or_create_user(target_user.id, interaction.guild.id)
-        
-        user_level = user_data['level']
-        user_xp = user_data['xp']
+        # Obtenemos los datos (de memoria si están, así incluyen el XP aún no volcado)
+        cached = self.xp_buffer.peek(interaction.guild.id, target_user.id)
+        if cached:
+            user_xp, user_level = cached
+        else:
+            user_data = await self.get_user(target_user.id, interaction.guild.id)
+            user_level = user_data['level']
+            user_xp = user_data['xp']
         
         # --- Cálculo de la Barra de Progreso ---
         # 1. XP necesario para el nivel *anterior* (inicio de la barra)
@@ -19,7 +19,11 @@ MOD_COMMANDS = [
     "warnings", 
     "delwarn", 
     "poll",
-    "crear_panel_tickets" # ¡NUEVO!
+    "crear_panel_tickets", # ¡NUEVO!
+    "modo_audio",
+    "musica_debug",
+    "giveaway",
+    "reroll"
 ]
 
 # --- Clase del Cog ---
@@ -59,7 +63,7 @@ class Help(commands.Cog):
             )
             embed.add_field(
                 name="🏛️ Soporte y Admin",
-                value="`/crear_panel_tickets`, `/panel_rol`\n*(Tickets usa `/additem` para roles)*",
+                value="`/crear_panel_tickets`, `/panel_rol`, `/modo_audio`, `/musica_debug`, `/giveaway`, `/reroll`\n*(Tickets usa `/additem` para roles)*",
                 inline=False
             )
             embed.add_field(
@@ -74,7 +78,7 @@ class Help(commands.Cog):
             )
             embed.add_field(
                 name="🎶 Música y Diversión",
-                value="`/play`, `/queue` (y el panel de botones), `/meme`, `/gif`",
+                value="`/play`, `/queue` (y el panel de botones), `/quitar`, `/mover`, `/mezclar`, `/meme`, `/gif`",
                 inline=False
             )
             embed.add_field(
@@ -0,0 +1,143 @@
+# utils/admission.py
+import os
+import time
+import heapq
+import asyncio
+import itertools
+
+from utils.metrics import metrics
+
+# --- CONFIGURACIÓN ---
+MAX_STREAMS = int(os.getenv("MUSIC_MAX_STREAMS", "20"))   # Servidores reproduciendo a la vez (un FFmpeg cada uno)
+MAX_WAITING = int(os.getenv("MUSIC_MAX_WAITING", "50"))   # Servidores en espera; a partir de aquí se rechaza
+ADMISSION_WAIT_MAX = 600  # Segundos máximos en espera antes de rendirse
+PRIORITY_WINDOW = 60      # Un servidor que soltó su plaza hace menos de esto pasa delante
+
+
+class _Ticket:
+    __slots__ = ("guild_id", "key", "future", "queued_at")
+
+    def __init__(self, guild_id: int, key: tuple, future: asyncio.Future):
+        self.guild_id = guild_id
+        self.key = key            # (prioridad, orden de llegada): menor = antes
+        self.future = future
+        self.queued_at = time.perf_counter()
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+
+class AdmissionController:
+    """
+    Limita cuántos pipelines de audio (FFmpeg) hay activos a la vez: uno por
+    servidor que suena, más los de fondo (caché, precalentado) vía
+    try_acquire(). Quien no cabe espera en una cola con prioridad: primero
+    los servidores que ya estaban sonando (soltaron su plaza hace poco),
+    luego los nuevos, cada grupo por orden de llegada. Un servidor conserva
+    su plaza entre canciones y la suelta al quedarse sin cola.
+    """
+
+    def __init__(self, *, limit: int = MAX_STREAMS, max_waiting: int = MAX_WAITING):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.holders = set()    # {guild_id} con plaza
+        self.released = {}     # {guild_id: monotonic() al soltar la plaza}
+        self._waiting = []      # heap de _Ticket
+        self._order = itertools.count()
+        self._changed = asyncio.Event() # Se dispara (y se renueva) cada vez que la cola se mueve
+        metrics.gauge("music.admission.active", lambda: len(self.holders))
+        metrics.gauge("music.admission.waiting", lambda: len(self._waiting))
+
+    def holds(self, guild_id: int) -> bool:
+        return guild_id in self.holders
+
+    def position(self, ticket: _Ticket) -> int:
+        """Posición (1 = el siguiente) de 'ticket' en la cola de espera."""
+        return 1 + sum(1 for other in self._waiting if other.key < ticket.key)
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def acquire(self, guild_id: int, on_position=None, timeout: float = ADMISSION_WAIT_MAX) -> bool:
+        """
+        Consigue plaza para 'guild_id'. Devuelve False si se rechaza (cola llena
+        o demasiada espera). 'on_position(pos, total)' se llama cada vez que cambia la posición.
+        """
+        if guild_id in self.holders:
+            return True
+        if len(self.holders) < self.limit and not self._waiting:
+            self.holders.add(guild_id)
+            metrics.incr("music.admission.admitted")
+            return True
+        if len(self._waiting) >= self.max_waiting:
+            metrics.incr("music.admission.rejected")
+            return False
+
+        now = time.monotonic()
+        priority = 0 if now - self.released.get(guild_id, -PRIORITY_WINDOW) < PRIORITY_WINDOW else 1
+        ticket = _Ticket(guild_id, (priority, next(self._order)), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiting, ticket)
+        metrics.incr("music.admission.queued")
+        self._notify()
+
+        deadline = now + timeout
+        last = None
+        try:
+            while not ticket.future.done():
+                pos = (self.position(ticket), len(self._waiting))
+                if on_position and pos != last:
+                    last = pos
+                    await on_position(*pos)
+                    continue # Mientras avisábamos, la cola pudo moverse
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    metrics.incr("music.admission.timeout")
+                    return False
+                changed = asyncio.ensure_future(self._changed.wait())
+                try:
+                    await asyncio.wait({ticket.future, changed}, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    changed.cancel()
+            metrics.observe("music.admission.wait", (time.perf_counter() - ticket.queued_at) * 1000)
+            return True
+        finally:
+            if not ticket.future.done():
+                # Cancelado o sin plaza a tiempo: salimos de la cola
+                ticket.future.cancel()
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._notify()
+
+    def try_acquire(self, key) -> bool:
+        """
+        Plaza para un FFmpeg de fondo (rellenar la caché, precalentar), sin esperar:
+        solo si sobra capacidad y ningún servidor está en la cola. Se suelta con release(key).
+        """
+        if key in self.holders:
+            return True
+        if len(self.holders) >= self.limit or self._waiting:
+            metrics.incr("music.admission.background.denied")
+            return False
+        self.holders.add(key)
+        metrics.incr("music.admission.background")
+        return True
+
+    def release(self, guild_id: int):
+        """Suelta la plaza de 'guild_id' (o de una clave de try_acquire) y se la da al siguiente de la cola."""
+        if guild_id not in self.holders:
+            return
+        self.holders.discard(guild_id)
+        self.released[guild_id] = time.monotonic()
+        while self._waiting and len(self.holders) < self.limit:
+            ticket = heapq.heappop(self._waiting)
+            if ticket.future.done():
+                continue
+            self.holders.add(ticket.guild_id)
+            ticket.future.set_result(True)
+            metrics.incr("music.admission.admitted")
+        self._notify()
+        # 'released' solo importa durante PRIORITY_WINDOW: podamos lo viejo
+        if len(self.released) > 1000:
+            limite = time.monotonic() - PRIORITY_WINDOW
+            self.released = {gid: t for gid, t in self.released.items() if t > limite}
@@ -0,0 +1,149 @@
+# utils/audio_cache.py
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from pathlib import Path
+
+from utils.metrics import metrics
+
+# --- CONFIGURACIÓN ---
+AUDIO_CACHE_DIR = Path('data') / 'audio_cache'
+AUDIO_CACHE_MAX_MB = int(os.getenv("AUDIO_CACHE_MAX_MB", "0")) # Presupuesto en disco (0 = caché desactivada)
+AUDIO_CACHE_MAX_TRACK = 20 * 60  # Las canciones de más de 20 min no se cachean
+AUDIO_CACHE_BITRATE = "128k"     # Opus a 128k: de sobra para Discord (que emite a 64-128k)
+AUDIO_CACHE_JOBS = 2             # Transcodificaciones simultáneas en segundo plano
+
+
+class AudioCache:
+    """
+    Caché en disco del audio ya transcodificado a Opus (un .opus por vídeo).
+    Se llena en segundo plano tras la primera reproducción, respeta un
+    presupuesto de bytes expulsando lo usado hace más tiempo (LRU) y escribe
+    de forma atómica (.part + os.replace), así nunca se lee un archivo a medias.
+    Cada transcodificación ocupa una plaza de 'admission' (si se da): si no
+    sobra capacidad para los servidores que suenan, no se cachea.
+    """
+
+    def __init__(self, directory: Path = AUDIO_CACHE_DIR, max_bytes: int = AUDIO_CACHE_MAX_MB * 1024 * 1024, admission=None):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.admission = admission
+        self.entries = OrderedDict()  # {video_id: bytes} (el primero es el menos usado)
+        self.total = 0
+        self._filling = set()
+        self._tasks = set()
+        self._slots = asyncio.Semaphore(AUDIO_CACHE_JOBS)
+        metrics.gauge("audio_cache.bytes", lambda: self.total)
+        metrics.gauge("audio_cache.files", lambda: len(self.entries))
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def path_for(self, video_id: str) -> Path:
+        return self.directory / f"{video_id}.opus"
+
+    def load(self):
+        """Reconstruye el índice desde disco (el orden LRU es la fecha de último uso)."""
+        if not self.enabled:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for leftover in self.directory.glob("*.part"):
+            leftover.unlink(missing_ok=True) # Transcodificaciones que se cortaron a medias
+        files = [(path, path.stat()) for path in self.directory.glob("*.opus")]
+        for path, stat in sorted(files, key=lambda item: item[1].st_mtime):
+            self.entries[path.stem] = stat.st_size
+            self.total += stat.st_size
+        self._evict()
+
+    def get(self, video_id: str):
+        """Ruta del audio cacheado de 'video_id', o None."""
+        if not self.enabled or not video_id or video_id not in self.entries:
+            metrics.incr("audio_cache.miss")
+            return None
+        path = self.path_for(video_id)
+        if not path.exists():
+            self.total -= self.entries.pop(video_id)
+            metrics.incr("audio_cache.miss")
+            return None
+        self.entries.move_to_end(video_id)
+        os.utime(path) # Así la recencia sobrevive a un reinicio
+        metrics.incr("audio_cache.hit")
+        return path
+
+    def __contains__(self, video_id: str) -> bool:
+        return self.enabled and video_id in self.entries
+
+    def fill(self, video_id: str, stream_url: str, duration: int | None = None):
+        """Transcodifica el stream a disco en segundo plano (si procede). Nunca espera."""
+        if not self.enabled or not video_id or video_id in self.entries or video_id in self._filling:
+            return
+        if duration and duration > AUDIO_CACHE_MAX_TRACK:
+            return
+        self._filling.add(video_id)
+        task = asyncio.get_running_loop().create_task(self._fill(video_id, stream_url))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fill(self, video_id: str, stream_url: str):
+        final = self.path_for(video_id)
+        tmp = final.with_suffix(".part")
+        slot = ("audio_cache", video_id)
+        admitted = False
+        try:
+            async with self._slots:
+                admitted = self.admission is None or self.admission.try_acquire(slot)
+                if not admitted:
+                    metrics.incr("audio_cache.fill.skipped") # Sin capacidad: la próxima vez será
+                    return
+                start = time.perf_counter()
+                proc = await asyncio.create_subprocess_exec(
+                    "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+                    "-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5",
+                    "-i", stream_url,
+                    "-vn", "-c:a", "libopus", "-b:a", AUDIO_CACHE_BITRATE, "-f", "opus", str(tmp),
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+                try:
+                    _, stderr = await proc.communicate()
+                except asyncio.CancelledError:
+                    proc.kill()
+                    await proc.wait()
+                    raise
+                if proc.returncode != 0:
+                    print(f"Error al cachear el audio de {video_id}: {stderr.decode(errors='ignore').strip()[:200]}")
+                    metrics.incr("audio_cache.fill.error")
+                    return
+
+                os.replace(tmp, final) # Atómico: o está entero o no está
+                size = final.stat().st_size
+                self.entries[video_id] = size
+                self.total += size
+                metrics.observe("audio_cache.fill", (time.perf_counter() - start) * 1000)
+                metrics.incr("audio_cache.fill.bytes", size)
+                self._evict()
+        except OSError as e:
+            print(f"Error al cachear el audio de {video_id}: {e}")
+            metrics.incr("audio_cache.fill.error")
+        finally:
+            if admitted and self.admission is not None:
+                self.admission.release(slot)
+            self._filling.discard(video_id)
+            tmp.unlink(missing_ok=True)
+
+    def _evict(self):
+        """Borra los archivos menos usados hasta volver al presupuesto."""
+        while self.total > self.max_bytes and self.entries:
+            video_id, size = self.entries.popitem(last=False)
+            self.path_for(video_id).unlink(missing_ok=True)
+            self.total -= size
+            metrics.incr("audio_cache.evicted")
+
+    async def close(self):
+        """Cancela las transcodificaciones en curso (sus .part se borran)."""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
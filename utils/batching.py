@@ -0,0 +1,75 @@
+# utils/batching.py
+import time
+import asyncio
+
+from utils.metrics import metrics
+
+
+class BatchWriter:
+    """
+    Cola 'write-behind': los productores añaden filas sin esperar a la BBDD
+    y un bucle de fondo las inserta con UN executemany (un solo commit)
+    cada 'interval' segundos, o antes si se llega a 'max_batch' filas.
+    """
+
+    def __init__(self, db, sql: str, *, name: str, interval: float = 2.0, max_batch: int = 500):
+        self.db = db
+        self.sql = sql
+        self.name = name
+        self.interval = interval
+        self.max_batch = max_batch
+        self.pending = []
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        metrics.gauge(f"{name}.pending", lambda: len(self.pending))
+
+    def add(self, row: tuple):
+        """Encola una fila. Nunca bloquea ni hace I/O."""
+        self.pending.append(row)
+        if len(self.pending) >= self.max_batch:
+            self._wake.set()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error al volcar la cola '{self.name}': {e}")
+
+    async def flush(self):
+        """Inserta todo lo pendiente en una sola transacción."""
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, []
+            start = time.perf_counter()
+            try:
+                await self.db.executemany(self.sql, batch)
+            except Exception:
+                # Devolvemos el lote (delante, para conservar el orden)
+                self.pending[:0] = batch
+                raise
+            metrics.observe(f"{self.name}.flush", (time.perf_counter() - start) * 1000)
+            metrics.incr(f"{self.name}.flush.count")
+            metrics.incr(f"{self.name}.flush.rows", len(batch))
+
+    async def close(self):
+        """Para el bucle de fondo y vuelca lo que quede."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
@@ -0,0 +1,92 @@
+# utils/debounced_editor.py
+import time
+import asyncio
+import discord
+
+from utils.metrics import metrics
+
+# --- CONFIGURACIÓN ---
+LIVE_EDIT_INTERVAL = 5.0 # Segundos mínimos entre dos ediciones del mismo mensaje
+
+
+class DebouncedEditor:
+    """
+    Programador de ediciones para mensajes "en vivo" (contadores, paneles...).
+    Los Cogs llaman a schedule() tantas veces como quieran; por mensaje se hace
+    como mucho UNA edición cada 'interval' segundos, con el estado que haya en
+    ese momento (render() se llama justo antes de editar). Así miles de cambios
+    se juntan en una sola llamada a la API.
+    """
+
+    def __init__(self, *, name: str, interval: float = LIVE_EDIT_INTERVAL):
+        self.name = name
+        self.interval = interval
+        self._pending = {}    # {message_id: (mensaje, render)}: lo último que se pidió
+        self._tasks = {}      # {message_id: asyncio.Task}
+        self._editing = set() # message_id con una edición en vuelo (no se cancela a medias)
+        self._last = {}       # {message_id: monotonic() de la última edición}
+        metrics.gauge(f"{name}.pending", lambda: len(self._pending))
+
+    def schedule(self, message, render):
+        """
+        Pide editar 'message' (Message o PartialMessage). 'render()' devuelve los
+        kwargs de message.edit() o None para no editar. Nunca espera.
+        """
+        if message.id in self._pending:
+            metrics.incr(f"{self.name}.coalesced")
+        self._pending[message.id] = (message, render)
+        task = self._tasks.get(message.id)
+        if task is None or task.done():
+            self._tasks[message.id] = asyncio.get_running_loop().create_task(self._run(message.id))
+
+    async def _run(self, message_id: int):
+        try:
+            while message_id in self._pending:
+                # Siempre esperamos un intervalo desde la última edición (o desde el primer cambio)
+                last = self._last.get(message_id, time.monotonic())
+                await asyncio.sleep(max(0.0, last + self.interval - time.monotonic()))
+
+                message, render = self._pending.pop(message_id)
+                kwargs = render()
+                if kwargs is None:
+                    continue
+                self._editing.add(message_id)
+                try:
+                    await message.edit(**kwargs)
+                    metrics.incr(f"{self.name}.edits")
+                except discord.NotFound:
+                    self._pending.pop(message_id, None) # El mensaje ya no existe
+                except discord.HTTPException as e:
+                    print(f"Error al editar el mensaje {message_id} ({self.name}): {e}")
+                finally:
+                    self._editing.discard(message_id)
+                    self._last[message_id] = time.monotonic()
+        finally:
+            if self._tasks.get(message_id) is asyncio.current_task():
+                del self._tasks[message_id]
+            if message_id not in self._pending:
+                self._last.pop(message_id, None)
+
+    async def cancel(self, message_id: int):
+        """
+        Olvida las ediciones pendientes de 'message_id'. Si hay una en vuelo, espera
+        a que termine (así una edición posterior del Cog no queda pisada).
+        """
+        self._pending.pop(message_id, None)
+        task = self._tasks.get(message_id)
+        if task is None:
+            return
+        if message_id in self._editing:
+            await asyncio.wait({task})
+        else:
+            task.cancel()
+
+    async def close(self):
+        """Cancela todo lo pendiente (para cog_unload)."""
+        self._pending.clear()
+        for task in list(self._tasks.values()):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+        self._last.clear()
@@ -0,0 +1,171 @@
+# utils/extraction.py
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import yt_dlp
+
+from utils.metrics import metrics
+
+# --- CONFIGURACIÓN ---
+EXTRACT_WORKERS = int(os.getenv("YTDL_WORKERS", "4"))  # Extracciones simultáneas (todo el bot)
+EXTRACT_MODE = os.getenv("YTDL_EXECUTOR", "thread")    # 'thread' o 'process' (evita el GIL al parsear)
+PLAYLIST_BATCH = 25                                    # Entradas por lote al leer una playlist
+PLAYLIST_MAX = int(os.getenv("PLAYLIST_MAX", "500"))   # Tope de canciones por playlist (los 'mix' no acaban nunca)
+
+
+def extract_info(query: str, options: dict) -> dict:
+    """
+    Llamada bloqueante a yt-dlp (corre en el pool, nunca en el event loop).
+    Devuelve un dict plano para que pueda volver desde otro proceso.
+    """
+    with yt_dlp.YoutubeDL(options) as ydl:
+        data = ydl.extract_info(query, download=False)
+        return ydl.sanitize_info(data)
+
+
+def extract_playlist(url: str, options: dict, emit, stop, batch_size: int = PLAYLIST_BATCH, limit: int = PLAYLIST_MAX) -> dict:
+    """
+    Extracción 'flat' de una playlist: NO resuelve cada vídeo, solo lee el
+    listado página a página y entrega lotes con emit(lista) según llegan.
+    Corre en un hilo (emit es un callback hacia el event loop); 'stop'
+    (threading.Event) la corta entre entradas.
+    """
+    opts = {**options, 'noplaylist': False, 'extract_flat': 'in_playlist', 'lazy_playlist': True}
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(url, download=False, process=False)
+        # Los enlaces watch?v=...&list=... redirigen a la playlist en sí
+        for _ in range(3):
+            if info.get('_type') not in ('url', 'url_transparent'):
+                break
+            info = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+
+        batch, total = [], 0
+        for entry in info.get('entries') or ():
+            if stop.is_set() or total >= limit:
+                break
+            if not entry:
+                continue
+            batch.append(ydl.sanitize_info(entry))
+            total += 1
+            if len(batch) >= batch_size:
+                emit(batch)
+                batch = []
+        if batch:
+            emit(batch)
+        return {'title': info.get('title'), 'count': total}
+
+
+class _Job:
+    __slots__ = ("future", "executor", "func", "args", "queued_at", "started_at", "exec_future")
+
+    def __init__(self, future, executor, func, args):
+        self.future = future      # Lo que espera quien llamó a run()
+        self.executor = executor
+        self.func = func
+        self.args = args
+        self.queued_at = time.perf_counter()
+        self.started_at = None
+        self.exec_future = None   # Futuro del executor (cuando ya se envió)
+
+
+class ExtractionPool:
+    """
+    Executor propio para yt-dlp: como mucho 'workers' extracciones a la vez,
+    repartidas por turnos entre servidores (un servidor que spamea /play solo
+    se hace cola a sí mismo). Si quien espera se cancela antes de que su
+    trabajo arranque, el trabajo sale de la cola sin ejecutarse; si ya
+    estaba en marcha, termina y su resultado se descarta.
+    """
+
+    def __init__(self, *, workers: int = EXTRACT_WORKERS, mode: str = EXTRACT_MODE):
+        # Los hilos existen siempre: los trabajos con callbacks (playlists) no pueden ir a otro proceso
+        self._threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ytdl")
+        self._executor = ProcessPoolExecutor(max_workers=workers) if mode == "process" else self._threads
+        self.workers = workers
+        self.running = 0
+        self._queues = OrderedDict()  # {guild_id: deque[_Job]} (el primero es el del turno)
+        metrics.gauge("ytdl.pool.queued", lambda: sum(len(q) for q in self._queues.values()))
+        metrics.gauge("ytdl.pool.running", lambda: self.running)
+
+    async def run(self, guild_id: int, func, *args):
+        """Encola func(*args) en el turno de 'guild_id' y espera su resultado."""
+        return await self._submit(guild_id, self._executor, func, args)
+
+    async def run_in_thread(self, guild_id: int, func, *args):
+        """Como run(), pero siempre en un hilo (para funciones con callbacks)."""
+        return await self._submit(guild_id, self._threads, func, args)
+
+    async def _submit(self, guild_id: int, executor, func, args):
+        loop = asyncio.get_running_loop()
+        job = _Job(loop.create_future(), executor, func, args)
+        self._queues.setdefault(guild_id, deque()).append(job)
+        self._dispatch()
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            self._abandon(guild_id, job)
+            raise
+
+    def _abandon(self, guild_id: int, job: _Job):
+        """Quien esperaba ya no quiere el resultado."""
+        metrics.incr("ytdl.pool.cancelled")
+        if job.exec_future is not None:
+            return # Ya está en un worker: no se puede interrumpir
+        queue = self._queues.get(guild_id)
+        if queue is not None:
+            try:
+                queue.remove(job)
+            except ValueError:
+                pass
+            if not queue:
+                del self._queues[guild_id]
+
+    def _next_job(self):
+        """Round-robin: un trabajo del servidor del turno, y ese servidor pasa al final."""
+        if not self._queues:
+            return None
+        guild_id, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        if queue:
+            self._queues.move_to_end(guild_id)
+        else:
+            del self._queues[guild_id]
+        return job
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self.running < self.workers:
+            job = self._next_job()
+            if job is None:
+                return
+            self.running += 1
+            job.started_at = time.perf_counter()
+            metrics.observe("ytdl.pool.wait", (job.started_at - job.queued_at) * 1000)
+            job.exec_future = loop.run_in_executor(job.executor, job.func, *job.args)
+            job.exec_future.add_done_callback(lambda fut, job=job: self._finished(job, fut))
+
+    def _finished(self, job: _Job, fut: asyncio.Future):
+        self.running -= 1
+        metrics.observe("ytdl.pool.exec", (time.perf_counter() - job.started_at) * 1000)
+        exc = None if fut.cancelled() else fut.exception() # La leemos siempre (aunque nadie espere)
+        if not job.future.done():
+            if fut.cancelled():
+                job.future.cancel()
+            elif exc is not None:
+                job.future.set_exception(exc)
+            else:
+                job.future.set_result(fut.result())
+        self._dispatch()
+
+    def close(self):
+        """Apaga el pool; lo que seguía en cola se cancela."""
+        for queue in self._queues.values():
+            for job in queue:
+                job.future.cancel()
+        self._queues.clear()
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._executor is not self._threads:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,91 @@
+# utils/log_dispatcher.py
+import asyncio
+import discord
+
+from utils.metrics import metrics
+
+# --- CONFIGURACIÓN ---
+LOG_BATCH_MAX = 10     # Embeds por mensaje (límite de Discord)
+LOG_CHARS_MAX = 6000   # Caracteres totales de embeds por mensaje (límite de Discord)
+LOG_DEBOUNCE = 1.0     # Segundos que esperamos a que lleguen más embeds antes de enviar
+LOG_QUEUE_MAX = 500    # Embeds en cola por canal; si se llena, descartamos (y lo contamos)
+
+
+class LogDispatcher:
+    """
+    Despachador central de logs de moderación. Los Cogs llaman a send() y
+    vuelven al instante; un worker por canal de destino agrupa hasta 10 embeds
+    por mensaje y los envía de uno en uno (así nunca hay ráfagas contra el
+    mismo canal, y si Discord devuelve 429 solo espera ese worker).
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._queues = {}   # {channel_id: asyncio.Queue}
+        self._workers = {}  # {channel_id: asyncio.Task}
+        metrics.gauge("log.queued", lambda: sum(q.qsize() for q in self._queues.values()))
+
+    def send(self, channel_id: int, embed: discord.Embed) -> bool:
+        """Encola un embed para 'channel_id'. Nunca espera. Devuelve False si se descartó."""
+        queue = self._queues.get(channel_id)
+        if queue is None:
+            queue = self._queues[channel_id] = asyncio.Queue(maxsize=LOG_QUEUE_MAX)
+        worker = self._workers.get(channel_id)
+        if worker is None or worker.done():
+            self._workers[channel_id] = asyncio.get_running_loop().create_task(self._worker(channel_id, queue))
+
+        try:
+            queue.put_nowait(embed)
+        except asyncio.QueueFull:
+            metrics.incr("log.dropped.queue_full")
+            return False
+        metrics.incr("log.enqueued")
+        return True
+
+    async def _next_batch(self, queue: asyncio.Queue, first: discord.Embed):
+        """Junta embeds hasta llenar el mensaje o agotar el debounce. Devuelve (lote, sobrante)."""
+        loop = asyncio.get_running_loop()
+        batch, size = [first], len(first)
+        deadline = loop.time() + LOG_DEBOUNCE
+        while len(batch) < LOG_BATCH_MAX:
+            if queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    embed = await asyncio.wait_for(queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                embed = queue.get_nowait()
+            if size + len(embed) > LOG_CHARS_MAX:
+                return batch, embed # No cabe: va en el siguiente mensaje
+            batch.append(embed)
+            size += len(embed)
+        return batch, None
+
+    async def _worker(self, channel_id: int, queue: asyncio.Queue):
+        carry = None
+        while True:
+            first = carry if carry is not None else await queue.get()
+            batch, carry = await self._next_batch(queue, first)
+
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                print(f"Error: No se encontró el canal de logs (ID: {channel_id})")
+                metrics.incr("log.dropped.no_channel", len(batch))
+                continue
+            try:
+                await channel.send(embeds=batch)
+                metrics.incr("log.messages")
+                metrics.incr("log.embeds", len(batch))
+            except discord.Forbidden:
+                print(f"Error: El bot no tiene permisos para hablar en el canal de logs (ID: {channel_id})")
+                metrics.incr("log.dropped.forbidden", len(batch))
+            except discord.HTTPException as e:
+                print(f"Error al enviar logs al canal {channel_id}: {e}")
+                metrics.incr("log.dropped.http", len(batch))
+            except Exception as e:
+                # Red caída, timeout... el worker sigue vivo para los siguientes lotes
+                print(f"Error al enviar logs al canal {channel_id}: {e!r}")
+                metrics.incr("log.dropped.error", len(batch))
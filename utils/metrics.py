@@ -0,0 +1,106 @@
+# utils/metrics.py
+import threading
+import time
+from collections import deque
+
+# --- Registro de Métricas en Memoria ---
+# Contadores y latencias simples que cualquier Cog puede alimentar.
+# Se leen desde el servidor Flask (otro hilo), por eso usamos un Lock.
+
+RESERVOIR_SIZE = 512 # Últimas N muestras para calcular percentiles
+
+
+class _Timing:
+    """Acumula una serie de duraciones (en milisegundos)."""
+    __slots__ = ("count", "total", "max", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.recent.append(value)
+
+    def summary(self) -> dict:
+        ordered = sorted(self.recent)
+        def pct(p):
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(pct(0.50), 3),
+            "p99_ms": round(pct(0.99), 3),
+            "max_ms": round(self.max, 3),
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._timings = {}
+        self._gauges = {}
+
+    def incr(self, name: str, value: int = 1):
+        """Suma 'value' al contador 'name'."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value_ms: float):
+        """Registra una duración en milisegundos."""
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = _Timing()
+            timing.add(value_ms)
+
+    def gauge(self, name: str, func):
+        """Registra una función que devuelve el valor actual de 'name'."""
+        with self._lock:
+            self._gauges[name] = func
+
+    def timer(self, name: str):
+        """Context manager: mide el bloque y lo registra en 'name'."""
+        return _TimerContext(self, name)
+
+    def snapshot(self) -> dict:
+        """Devuelve una copia serializable (JSON) de todas las métricas."""
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {name: t.summary() for name, t in self._timings.items()}
+            gauges = dict(self._gauges)
+        values = {}
+        for name, func in gauges.items():
+            try:
+                values[name] = func()
+            except Exception as e:
+                values[name] = f"error: {e}"
+        return {"counters": counters, "timings": timings, "gauges": values}
+
+
+class _TimerContext:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics: Metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+# Instancia global (compartida por todo el bot)
+metrics = Metrics()
@@ -0,0 +1,39 @@
+# utils/resources.py
+import os
+
+
+def process_stats(pid: int):
+    """
+    Memoria residente (KB) y sockets abiertos de 'pid', leyendo /proc (solo Linux).
+    Devuelve None si el proceso ya no existe o no se puede leer.
+    """
+    try:
+        rss_kb = 0
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss_kb = int(line.split()[1])
+                    break
+        sockets = 0
+        for fd in os.scandir(f"/proc/{pid}/fd"):
+            try:
+                if os.readlink(fd.path).startswith("socket:"):
+                    sockets += 1
+            except OSError:
+                pass # El descriptor se cerró mientras lo mirábamos
+        return {"rss_kb": rss_kb, "sockets": sockets}
+    except OSError:
+        return None
+
+
+def sum_stats(pids) -> dict:
+    """Suma process_stats() de varios procesos (los que ya no existen no cuentan)."""
+    total = {"procs": 0, "rss_kb": 0, "sockets": 0}
+    for pid in pids:
+        stats = process_stats(pid)
+        if stats is None:
+            continue
+        total["procs"] += 1
+        total["rss_kb"] += stats["rss_kb"]
+        total["sockets"] += stats["sockets"]
+    return total
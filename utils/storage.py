@@ -0,0 +1,178 @@
+# utils/storage.py
+import os
+import time
+import sqlite3
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from utils.metrics import metrics
+
+# --- CONFIGURACIÓN ---
+DATA_DIR = Path('data')
+SLOW_QUERY_MS = 100 # Avisamos por consola si una consulta tarda más que esto
+
+
+class ExecuteResult:
+    """Resultado ligero de un execute (el cursor no sale del hilo de la BBDD)."""
+    __slots__ = ("rowcount", "lastrowid")
+
+    def __init__(self, rowcount: int, lastrowid: int):
+        self.rowcount = rowcount
+        self.lastrowid = lastrowid
+
+
+# -----------------------------------------------------------------
+# --- Clase 1: Una base de datos (una conexión + un hilo propio) ---
+# -----------------------------------------------------------------
+class Database:
+    """
+    Conexión de larga duración a un archivo .db en modo WAL.
+    Todas las consultas corren en un hilo dedicado (nunca en el event loop),
+    y ese único hilo serializa el acceso a la conexión.
+    """
+
+    def __init__(self, name: str, path: Path):
+        self.name = name
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"db-{name}")
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None -> autocommit; las transacciones son explícitas (BEGIN)
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def _call(self, func, *args):
+        """Se ejecuta DENTRO del hilo de la BBDD."""
+        if self._conn is None:
+            self._conn = self._connect()
+        return func(self._conn, *args)
+
+    async def run(self, func, *args, label: str = "run"):
+        """
+        Ejecuta func(conn, *args) en el hilo de la BBDD y devuelve su resultado.
+        Es la base de todos los demás helpers.
+        """
+        loop = asyncio.get_running_loop()
+        submitted = time.perf_counter()
+        started = finished = None
+
+        def job():
+            nonlocal started, finished
+            started = time.perf_counter()
+            try:
+                return self._call(func, *args)
+            finally:
+                finished = time.perf_counter()
+
+        try:
+            return await loop.run_in_executor(self._executor, job)
+        finally:
+            if finished is not None:
+                wait_ms = (started - submitted) * 1000
+                exec_ms = (finished - started) * 1000
+                metrics.observe(f"db.{self.name}.wait", wait_ms)
+                metrics.observe(f"db.{self.name}.query", exec_ms)
+                if exec_ms > SLOW_QUERY_MS:
+                    print(f"Aviso: consulta lenta en {self.name}.db ({label}): {exec_ms:.1f} ms")
+
+    # --- Helpers de Consulta ---
+    async def fetchone(self, sql: str, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone(), label=sql)
+
+    async def fetchall(self, sql: str, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall(), label=sql)
+
+    async def execute(self, sql: str, params=()) -> ExecuteResult:
+        def job(conn):
+            cursor = conn.execute(sql, params)
+            return ExecuteResult(cursor.rowcount, cursor.lastrowid)
+        return await self.run(job, label=sql)
+
+    async def executemany(self, sql: str, seq_of_params) -> ExecuteResult:
+        """executemany dentro de UNA transacción (un solo commit)."""
+        def job(conn):
+            cursor = conn.executemany(sql, seq_of_params)
+            return ExecuteResult(cursor.rowcount, cursor.lastrowid)
+        return await self.transaction(job, label=sql)
+
+    async def get_user_row(self, table: str, user_id: int, guild_id: int, defaults: dict) -> dict:
+        """
+        Lee la fila (user_id, guild_id) de 'table' con UNA sola sentencia.
+        Si el usuario nunca interactuó, devuelve 'defaults' SIN escribir en disco
+        (las escrituras usan UPSERT, así que no hace falta crear la fila antes).
+        """
+        row = await self.fetchone(f"SELECT * FROM {table} WHERE user_id = ? AND guild_id = ?", (user_id, guild_id))
+        if row is None:
+            return {"user_id": user_id, "guild_id": guild_id, **defaults}
+        return dict(row)
+
+    async def executescript(self, script: str):
+        await self.run(lambda conn: conn.executescript(script), label="executescript")
+
+    async def transaction(self, func, *args, label: str = "transaction"):
+        """
+        Ejecuta func(conn, *args) dentro de BEGIN IMMEDIATE ... COMMIT.
+        Si func lanza una excepción, se hace ROLLBACK y se propaga.
+        """
+        def job(conn, *inner_args):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(conn, *inner_args)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+        return await self.run(job, *args, label=label)
+
+    def close(self):
+        """Cierra la conexión (desde su propio hilo) y apaga el executor."""
+        def job():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        try:
+            self._executor.submit(job).result()
+        finally:
+            self._executor.shutdown(wait=True)
+
+
+# -----------------------------------------------------------------
+# --- Clase 2: El Servicio de Almacenamiento (uno por bot) ---
+# -----------------------------------------------------------------
+class Storage:
+    """
+    Punto de acceso único a las BBDD del bot. Se crea en bot.py (setup_hook)
+    y los Cogs lo usan a través de 'self.bot.storage'.
+    """
+
+    def __init__(self, data_dir: Path = DATA_DIR):
+        self.data_dir = Path(data_dir)
+        os.makedirs(self.data_dir, exist_ok=True)
+        self._databases = {}
+
+    def get(self, name: str) -> Database:
+        """Devuelve la BBDD 'name' (ej: 'economy' -> data/economy.db)."""
+        db = self._databases.get(name)
+        if db is None:
+            db = Database(name, self.data_dir / f"{name}.db")
+            self._databases[name] = db
+        return db
+
+    def __getitem__(self, name: str) -> Database:
+        return self.get(name)
+
+    def close(self):
+        """Cierra todas las conexiones. Llamar solo cuando el loop ya paró."""
+        for db in self._databases.values():
+            try:
+                db.close()
+            except Exception as e:
+                print(f"Error al cerrar {db.name}.db: {e}")
+        self._databases.clear()
@@ -0,0 +1,86 @@
+# utils/track_queue.py
+import random
+import asyncio
+from collections import deque
+from itertools import islice
+
+
+class TrackQueue:
+    """
+    Cola de reproducción sobre un deque: añadir/sacar por los dos extremos es
+    O(1); quitar y mover por posición son O(n) (el deque recorre hasta el
+    índice), y mezclar reconstruye la cola una vez. Las vistas por rangos
+    recorren hasta 'stop' sin copiar el resto. get() espera de forma
+    asíncrona a que llegue algo. Las posiciones empiezan en 0 (la siguiente
+    canción).
+    """
+
+    def __init__(self):
+        self._items = deque()
+        self._not_empty = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __bool__(self) -> bool:
+        return bool(self._items)
+
+    # --- Añadir ---
+    def push(self, track):
+        """Añade al final."""
+        self._items.append(track)
+        self._not_empty.set()
+
+    def push_many(self, tracks):
+        """Añade varias al final (ej: un lote de una playlist)."""
+        self._items.extend(tracks)
+        if self._items:
+            self._not_empty.set()
+
+    def push_front(self, track):
+        """Añade al principio (será la siguiente)."""
+        self._items.appendleft(track)
+        self._not_empty.set()
+
+    # --- Consumir ---
+    async def get(self):
+        """Saca la siguiente; si la cola está vacía, espera a que llegue una."""
+        while not self._items:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        return self._items.popleft()
+
+    def peek(self):
+        """La siguiente canción sin sacarla (o None)."""
+        return self._items[0] if self._items else None
+
+    # --- Reordenar ---
+    def remove_at(self, index: int):
+        """Quita y devuelve la canción de la posición 'index'. IndexError si no existe."""
+        if not 0 <= index < len(self._items):
+            raise IndexError(index)
+        track = self._items[index]
+        del self._items[index]
+        return track
+
+    def move(self, src: int, dst: int):
+        """Mueve la canción de 'src' a 'dst' y la devuelve. IndexError si alguna no existe."""
+        if not 0 <= dst < len(self._items):
+            raise IndexError(dst)
+        track = self.remove_at(src)
+        self._items.insert(dst, track)
+        return track
+
+    def shuffle(self):
+        """Mezcla la cola (el deque se reconstruye una sola vez)."""
+        items = list(self._items)
+        random.shuffle(items)
+        self._items = deque(items)
+
+    def clear(self):
+        self._items.clear()
+
+    # --- Vistas ---
+    def slice(self, start: int, stop: int) -> list:
+        """Canciones en [start, stop) sin copiar el resto de la cola."""
+        return list(islice(self._items, start, stop))
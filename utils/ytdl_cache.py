@@ -0,0 +1,181 @@
+# utils/ytdl_cache.py
+import os
+import re
+import json
+import time
+
+from cachetools import LRUCache
+
+from utils.metrics import metrics
+
+# --- CONFIGURACIÓN ---
+MEMORY_MAX = int(os.getenv("YTDL_CACHE_MEMORY", "2048")) # Entradas por nivel en memoria
+QUERY_TTL = 7 * 86400     # Una búsqueda apunta al mismo vídeo durante una semana
+METADATA_TTL = 30 * 86400 # Título, miniatura, duración... cambian muy poco
+STREAM_DEFAULT_TTL = 1800 # Validez supuesta si la URL del stream no trae 'expire'
+EXPIRE_RE = re.compile(r"[?&/]expire[=/](\d+)")
+
+# Campos de yt-dlp que guardamos como metadatos (el resto no hace falta)
+METADATA_FIELDS = ('id', 'title', 'webpage_url', 'thumbnail', 'duration', 'uploader')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ytdl_queries (
+    query TEXT PRIMARY KEY,
+    video_id TEXT NOT NULL,
+    cached_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ytdl_videos (
+    video_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    cached_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ytdl_streams (
+    video_id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def normalize_query(query: str) -> str:
+    """'  Never Gonna   GIVE you up ' -> 'never gonna give you up'."""
+    return " ".join(query.casefold().split())
+
+
+def stream_expires_at(data: dict, resolved_at: float) -> float:
+    """Momento (epoch) en que caduca la URL del stream que devolvió yt-dlp."""
+    match = EXPIRE_RE.search(data.get('url') or "")
+    if match:
+        return float(match.group(1))
+    return resolved_at + STREAM_DEFAULT_TTL
+
+
+def _metadata(data: dict) -> dict:
+    return {field: data.get(field) for field in METADATA_FIELDS}
+
+
+class YTDLCache:
+    """
+    Caché de dos niveles (LRU en memoria + SQLite en music.db) para yt-dlp:
+      búsqueda normalizada -> id de vídeo -> metadatos, y id -> URL del stream.
+    Las URLs de stream caducan (parámetro 'expire'); el resto tiene TTL largo.
+    Quien llama pasa la extracción real como corrutina; solo se ejecuta si falla la caché.
+    """
+
+    def __init__(self, db, *, memory_max: int = MEMORY_MAX):
+        self.db = db
+        self.queries = LRUCache(maxsize=memory_max)  # {query: (video_id, cached_at)}
+        self.videos = LRUCache(maxsize=memory_max)   # {video_id: (metadata, cached_at)}
+        self.streams = LRUCache(maxsize=memory_max)  # {video_id: (url, expires_at)}
+        self._extract_ms = {}                        # {tipo: media móvil de lo que tarda extraer}
+        self._hits = self._misses = 0
+        metrics.gauge("ytdl.cache.hit_ratio", lambda: round(self._hits / (self._hits + self._misses), 3) if self._hits + self._misses else 0.0)
+
+    async def setup(self):
+        """Crea las tablas y purga lo caducado."""
+        await self.db.executescript(SCHEMA)
+        ahora = time.time()
+        await self.db.execute("DELETE FROM ytdl_streams WHERE expires_at < ?", (ahora,))
+        await self.db.execute("DELETE FROM ytdl_queries WHERE cached_at < ?", (ahora - QUERY_TTL,))
+        await self.db.execute("DELETE FROM ytdl_videos WHERE cached_at < ?", (ahora - METADATA_TTL,))
+
+    # --- Contabilidad ---
+    def _hit(self, kind: str):
+        self._hits += 1
+        metrics.incr(f"ytdl.cache.{kind}.hit")
+        # Tiempo ahorrado = lo que suele tardar la extracción que nos hemos evitado
+        metrics.incr("ytdl.cache.saved_ms", int(self._extract_ms.get(kind, 0)))
+
+    async def _extract(self, kind: str, extractor):
+        self._misses += 1
+        metrics.incr(f"ytdl.cache.{kind}.miss")
+        start = time.perf_counter()
+        data = await extractor()
+        elapsed = (time.perf_counter() - start) * 1000
+        previo = self._extract_ms.get(kind)
+        self._extract_ms[kind] = elapsed if previo is None else previo * 0.9 + elapsed * 0.1
+        metrics.observe(f"ytdl.extract.{kind}", elapsed)
+        return data
+
+    # --- Niveles ---
+    async def get_metadata(self, video_id: str):
+        """Metadatos cacheados de 'video_id' (memoria -> disco) o None. Nunca extrae."""
+        ahora = time.time()
+        cached = self.videos.get(video_id)
+        if cached and ahora - cached[1] < METADATA_TTL:
+            return cached[0]
+        row = await self.db.fetchone("SELECT data, cached_at FROM ytdl_videos WHERE video_id = ?", (video_id,))
+        if row and ahora - row['cached_at'] < METADATA_TTL:
+            metadata = json.loads(row['data'])
+            self.videos[video_id] = (metadata, row['cached_at'])
+            return metadata
+        return None
+
+    async def _put_video(self, data: dict):
+        metadata, ahora = _metadata(data), time.time()
+        self.videos[metadata['id']] = (metadata, ahora)
+        await self.db.execute(
+            "INSERT INTO ytdl_videos (video_id, data, cached_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(video_id) DO UPDATE SET data = excluded.data, cached_at = excluded.cached_at",
+            (metadata['id'], json.dumps(metadata), ahora)
+        )
+        return metadata
+
+    # --- API pública ---
+    async def search(self, query: str, extractor) -> dict:
+        """
+        Metadatos del primer resultado de 'query'.
+        'extractor' es una corrutina sin argumentos que hace la búsqueda real.
+        """
+        key = normalize_query(query)
+        ahora = time.time()
+
+        cached = self.queries.get(key)
+        if cached is None:
+            row = await self.db.fetchone("SELECT video_id, cached_at FROM ytdl_queries WHERE query = ?", (key,))
+            if row:
+                cached = self.queries[key] = (row['video_id'], row['cached_at'])
+        if cached and ahora - cached[1] < QUERY_TTL:
+            metadata = await self.get_metadata(cached[0])
+            if metadata:
+                self._hit("search")
+                return metadata
+
+        data = await self._extract("search", extractor)
+        metadata = await self._put_video(data)
+        self.queries[key] = (metadata['id'], ahora)
+        await self.db.execute(
+            "INSERT INTO ytdl_queries (query, video_id, cached_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(query) DO UPDATE SET video_id = excluded.video_id, cached_at = excluded.cached_at",
+            (key, metadata['id'], ahora)
+        )
+        return metadata
+
+    async def stream(self, video_id: str, extractor, *, min_valid: float = 0) -> dict:
+        """
+        Metadatos + 'url' del stream de 'video_id'. Una URL cacheada solo vale
+        si le quedan más de 'min_valid' segundos (ej: duración de la canción + margen).
+        """
+        ahora = time.time()
+        if video_id:
+            cached = self.streams.get(video_id)
+            if cached is None:
+                row = await self.db.fetchone("SELECT url, expires_at FROM ytdl_streams WHERE video_id = ?", (video_id,))
+                if row:
+                    cached = self.streams[video_id] = (row['url'], row['expires_at'])
+            if cached and cached[1] - ahora > min_valid:
+                metadata = await self.get_metadata(video_id)
+                if metadata:
+                    self._hit("stream")
+                    return {**metadata, 'url': cached[0]}
+
+        data = await self._extract("stream", extractor)
+        metadata = await self._put_video(data)
+        expires_at = stream_expires_at(data, ahora)
+        self.streams[metadata['id']] = (data['url'], expires_at)
+        await self.db.execute(
+            "INSERT INTO ytdl_streams (video_id, url, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(video_id) DO UPDATE SET url = excluded.url, expires_at = excluded.expires_at",
+            (metadata['id'], data['url'], expires_at)
+        )
+        return {**metadata, 'url': data['url']}